@@ -0,0 +1,90 @@
+import io
+import random
+import zipfile
+from typing import Dict, List
+from xml.sax.saxutils import escape
+
+# Размеры синтетических протоколов: число разделов и препаратов
+SIZES = {
+    'small': {'sections': 4, 'drugs': 5},
+    'medium': {'sections': 40, 'drugs': 20},
+    # Длиннее ANALYSIS_CHUNK_CHARS по умолчанию: анализируется по частям
+    'large': {'sections': 160, 'drugs': 60},
+}
+
+_DRUGS = [
+    'Амлодипин', 'Лизиноприл', 'Метформин', 'Аторвастатин', 'Омепразол', 'Бисопролол',
+    'Лозартан', 'Гидрохлоротиазид', 'Клопидогрел', 'Ацетилсалициловая кислота', 'Варфарин',
+    'Фуросемид', 'Спиронолактон', 'Эналаприл', 'Розувастатин', 'Пантопразол', 'Инсулин гларгин',
+    'Дапаглифлозин', 'Эмпаглифлозин', 'Ситаглиптин', 'Апиксабан', 'Ривароксабан', 'Дабигатран',
+    'Периндоприл', 'Валсартан', 'Индапамид', 'Небиволол', 'Карведилол', 'Моксонидин', 'Эзетимиб',
+]
+_ROUTES = ['перорально', 'внутривенно', 'подкожно', 'внутримышечно']
+_FILLER = (
+    'Пациенты, соответствующие критериям включения, наблюдаются в течение всего периода '
+    'исследования. Оценка эффективности проводится на каждом визите, нежелательные явления '
+    'регистрируются в индивидуальной регистрационной карте. '
+)
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+_RELS = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/></Relationships>'
+)
+
+
+def make_docx(paragraphs: List[str]) -> bytes:
+    """Минимальный корректный DOCX из списка абзацев"""
+    body = ''.join(
+        f'<w:p><w:r><w:t xml:space="preserve">{escape(paragraph)}</w:t></w:r></w:p>'
+        for paragraph in paragraphs
+    )
+    document = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f'<w:body>{body}</w:body></w:document>'
+    )
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        archive.writestr('_rels/.rels', _RELS)
+        archive.writestr('word/document.xml', document)
+    return buffer.getvalue()
+
+
+def protocol_paragraphs(sections: int, drugs: int, seed: int = 0) -> List[str]:
+    """Текст синтетического протокола: разделы с заголовками и строками назначений"""
+    rng = random.Random(seed)
+    paragraphs = ['КЛИНИЧЕСКИЙ ПРОТОКОЛ', 'Артериальная гипертензия у взрослых']
+    names = [_DRUGS[index % len(_DRUGS)] + ('' if index < len(_DRUGS) else f' {index // len(_DRUGS) + 1}')
+             for index in range(drugs)]
+
+    for section in range(1, sections + 1):
+        paragraphs.append(f'{section}. Раздел {section}')
+        paragraphs.extend(_FILLER * rng.randint(1, 3) for _ in range(rng.randint(2, 5)))
+        # Назначения распределяются по разделам равномерно
+        for index in range(section - 1, drugs, sections):
+            paragraphs.append(
+                f'Препарат: {names[index]}; доза {rng.choice([5, 10, 20, 50, 100])} мг; '
+                f'путь введения: {rng.choice(_ROUTES)}; {rng.randint(1, 3)} раза в сутки.'
+            )
+    return paragraphs
+
+
+def build_corpus(seed: int = 0) -> Dict[str, bytes]:
+    """DOCX протоколы всех размеров из SIZES"""
+    return {
+        size: make_docx(protocol_paragraphs(params['sections'], params['drugs'], seed))
+        for size, params in SIZES.items()
+    }
@@ -0,0 +1,60 @@
+import re
+import json
+import time
+from typing import Dict, List, Any, Iterator
+
+_PRESCRIPTION = re.compile(r'Препарат: ([^;]+); доза (\d+ мг); путь введения: ([^;]+); (\d) раза в сутки')
+
+
+class FakeChunk:
+    def __init__(self, text: str):
+        """Часть потокового ответа (как у google.generativeai)"""
+        self.text = text
+
+
+class FakeGeminiModel:
+    def __init__(self, latency: float = 0.5, chars_per_second: float = 4000, chunk_chars: int = 200):
+        """Заглушка модели Gemini с настраиваемой задержкой
+
+        ``latency`` - время до первой части ответа, дальше ответ выдается
+        частями со скоростью ``chars_per_second``. Препараты берутся из
+        строк назначений синтетического протокола (см. corpus.py).
+        """
+        self.latency = latency
+        self.chars_per_second = chars_per_second
+        self.chunk_chars = chunk_chars
+
+    def generate_content(self, prompt: str, stream: bool = False, **kwargs):
+        text = json.dumps(self._analysis(prompt), ensure_ascii=False)
+        if stream:
+            return self._stream(text)
+        time.sleep(self.latency + len(text) / self.chars_per_second)
+        return FakeChunk(text)
+
+    def _stream(self, text: str) -> Iterator[FakeChunk]:
+        time.sleep(self.latency)
+        for start in range(0, len(text), self.chunk_chars):
+            piece = text[start:start + self.chunk_chars]
+            time.sleep(len(piece) / self.chars_per_second)
+            yield FakeChunk(piece)
+
+    def _analysis(self, prompt: str) -> Dict[str, Any]:
+        drugs: List[Dict[str, Any]] = []
+        for index, (name, dosage, route, times) in enumerate(_PRESCRIPTION.findall(prompt), start=1):
+            drugs.append({
+                'id': str(index),
+                'name': name,
+                'innEnglish': f'drug-{name.lower().replace(" ", "-")}',
+                'innRussian': name.lower(),
+                'dosage': dosage,
+                'route': route,
+                'frequency': f'{times} раза в сутки',
+                'duration': '12 недель',
+                'indication': 'артериальная гипертензия',
+                'targetCondition': 'Hypertension'
+            })
+        return {
+            'protocolSummary': 'Синтетический протокол лечения артериальной гипертензии',
+            'mainCondition': 'Артериальная гипертензия',
+            'drugs': drugs
+        }
@@ -0,0 +1,265 @@
+"""Офлайн бенчмарк API: загрузка протоколов, поиск исследований, экспорт PDF
+
+Запуск из каталога backend (сеть и ключи API не нужны):
+
+    python -m benchmarks.run --concurrency 1,4,16 --requests 40
+
+Gemini заменяется заглушкой с настраиваемой задержкой, внешние API -
+локальным сервером с записанными ответами (benchmarks/fixtures). Результаты
+пишутся в JSON; с ``--baseline`` рост p95 сверх ``--tolerance`` считается
+регрессией (код выхода 1).
+"""
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import logging
+import argparse
+import shutil
+import platform
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Callable, Optional
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.corpus import build_corpus, SIZES
+from benchmarks.fake_gemini import FakeGeminiModel
+from benchmarks.stub_server import StubServer
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+JOB_POLL_INTERVAL = 0.02
+JOB_TIMEOUT = 300
+
+# Сценарий: (базовый URL, сессия, номер запроса) -> None, ошибка - исключение
+Scenario = Callable[[str, requests.Session, int], None]
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль методом ближайшего ранга"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(q / 100 * len(ordered)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def make_scenarios(corpus: Dict[str, bytes]) -> Dict[str, Scenario]:
+    """Все сценарии бенчмарка по именам"""
+    def upload(size: str) -> Scenario:
+        def run(base_url, session, index):
+            # refresh=1: каждый запрос доходит до модели, минуя кэш анализов
+            response = session.post(f'{base_url}/api/upload', params={'refresh': '1'},
+                                    files={'file': (f'protocol_{size}.docx', corpus[size])})
+            response.raise_for_status()
+            status_url = f"{base_url}{response.json()['status_url']}"
+            deadline = time.monotonic() + JOB_TIMEOUT
+            while time.monotonic() < deadline:
+                job = session.get(status_url).json()
+                if job['status'] == 'done':
+                    return
+                if job['status'] == 'failed':
+                    raise RuntimeError(job.get('error'))
+                time.sleep(JOB_POLL_INTERVAL)
+            raise TimeoutError('Задача анализа не завершилась')
+        return run
+
+    def research(cached: bool) -> Scenario:
+        def run(base_url, session, index):
+            drug = 'amlodipine' if cached else f'drug-{uuid.uuid4().hex[:12]}'
+            response = session.get(f'{base_url}/api/research/{drug}', params={'condition': 'Hypertension'})
+            response.raise_for_status()
+            status = response.json().get('status', {})
+            if any(value != 'ok' for value in status.values()):
+                raise RuntimeError(f'Источники ответили с ошибкой: {status}')
+        return run
+
+    def pdf(cached: bool) -> Scenario:
+        drugs = [{'name': f'Препарат {index}', 'innEnglish': f'drug-{index}', 'dosage': '10 мг',
+                  'route': 'перорально', 'frequency': '1 раз в сутки'} for index in range(20)]
+
+        def run(base_url, session, index):
+            summary = 'Протокол' if cached else f'Протокол {uuid.uuid4().hex}'
+            response = session.post(f'{base_url}/api/export/pdf', json={
+                'protocol_summary': summary, 'main_condition': 'Артериальная гипертензия', 'drugs': drugs
+            })
+            response.raise_for_status()
+        return run
+
+    scenarios: Dict[str, Scenario] = {f'upload_{size}': upload(size) for size in SIZES}
+    scenarios['research_cold'] = research(cached=False)
+    scenarios['research_cached'] = research(cached=True)
+    scenarios['pdf_cold'] = pdf(cached=False)
+    scenarios['pdf_cached'] = pdf(cached=True)
+    return scenarios
+
+
+def run_level(base_url: str, scenario: Scenario, concurrency: int, total: int) -> Dict[str, Any]:
+    """Выполнение ``total`` запросов сценария не более чем ``concurrency`` одновременно"""
+    local = threading.local()
+    latencies: List[float] = []
+    errors: List[str] = []
+    lock = threading.Lock()
+
+    def one(index):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        started = time.perf_counter()
+        try:
+            scenario(base_url, session, index)
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+            return
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    duration = time.perf_counter() - started
+
+    return {
+        'concurrency': concurrency,
+        'requests': total,
+        'errors': len(errors),
+        'error_sample': errors[:3],
+        'duration_s': round(duration, 3),
+        'throughput_rps': round(len(latencies) / duration, 3) if duration > 0 else 0.0,
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Регрессии p95 и пропускной способности относительно сохраненных результатов"""
+    previous = {(item['scenario'], item['concurrency']): item for item in baseline.get('results', [])}
+    regressions = []
+    for item in results:
+        before = previous.get((item['scenario'], item['concurrency']))
+        if before is None:
+            continue
+        label = f"{item['scenario']} c={item['concurrency']}"
+        if before['p95_ms'] and item['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{label}: p95 {before['p95_ms']} -> {item['p95_ms']} мс")
+        if before['throughput_rps'] and item['throughput_rps'] < before['throughput_rps'] / (1 + tolerance):
+            regressions.append(f"{label}: {before['throughput_rps']} -> {item['throughput_rps']} запр/с")
+    return regressions
+
+
+def start_app(args: argparse.Namespace, workdir: str, stub: StubServer):
+    """Приложение с заглушками на свободном порту; возвращает (сервер, базовый URL)"""
+    os.environ.update(stub.env())
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ['DOWNLOADS_DIR'] = os.path.join(workdir, 'downloads')
+
+    from werkzeug.serving import make_server
+    from src.main import create_app
+    from src.services.registry import services
+    from src.services.protocol_analyzer import ProtocolAnalyzer
+
+    app = create_app()
+    # Заглушка регистрируется после фабрики, которая регистрирует настоящий анализатор
+    model = FakeGeminiModel(latency=args.gemini_latency, chars_per_second=args.gemini_speed)
+    services.register('protocol_analyzer', lambda: ProtocolAnalyzer(model=model))
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Офлайн бенчмарк API анализатора протоколов')
+    parser.add_argument('--scenarios', default='all',
+                        help='сценарии через запятую (upload_small, upload_medium, upload_large, '
+                             'research_cold, research_cached, pdf_cold, pdf_cached)')
+    parser.add_argument('--concurrency', default='1,4,16', help='уровни параллелизма через запятую')
+    parser.add_argument('--requests', type=int, default=40, help='запросов на каждый уровень')
+    parser.add_argument('--gemini-latency', type=float, default=0.5, help='задержка заглушки Gemini, с')
+    parser.add_argument('--gemini-speed', type=float, default=4000, help='скорость ответа заглушки, символов/с')
+    parser.add_argument('--upstream-latency', type=float, default=0.05, help='задержка внешних API, с')
+    parser.add_argument('--output', help='файл результатов (по умолчанию benchmarks/results/<время>.json)')
+    parser.add_argument('--baseline', help='результаты предыдущего запуска для сравнения')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='допустимое ухудшение (доля)')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    levels = [int(level) for level in args.concurrency.split(',') if level.strip()]
+    scenarios = make_scenarios(build_corpus())
+    names = list(scenarios) if args.scenarios == 'all' else [name.strip() for name in args.scenarios.split(',')]
+    unknown = [name for name in names if name not in scenarios]
+    if unknown:
+        print(f"Неизвестные сценарии: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+
+    workdir = tempfile.mkdtemp(prefix='protocol-bench-')
+    stub = StubServer(latency=args.upstream_latency).start()
+    server, base_url = start_app(args, workdir, stub)
+
+    results = []
+    try:
+        for name in names:
+            # Прогрев: первый запрос создает сервисы и заполняет кэши для *_cached
+            run_level(base_url, scenarios[name], 1, 1)
+            for concurrency in levels:
+                item = {'scenario': name, **run_level(base_url, scenarios[name], concurrency, args.requests)}
+                results.append(item)
+                print(f"{name:16} c={concurrency:<3} {item['throughput_rps']:8.2f} запр/с  "
+                      f"p50={item['p50_ms']:.0f} p95={item['p95_ms']:.0f} p99={item['p99_ms']:.0f} мс  "
+                      f"ошибок: {item['errors']}", flush=True)
+    finally:
+        server.shutdown()
+        stub.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'params': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+            'upstream_requests': stub.requests,
+        },
+        'results': results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as report_file:
+        json.dump(report, report_file, ensure_ascii=False, indent=2)
+    print(f"Результаты: {output}")
+
+    failed = any(item['errors'] for item in results)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f"Регрессия: {regression}")
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
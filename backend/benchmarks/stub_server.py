@@ -0,0 +1,88 @@
+import os
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Optional
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# Последний сегмент пути запроса -> записанный ответ внешнего API
+ROUTES = {
+    'esearch.fcgi': 'pubmed_esearch.json',
+    'esummary.fcgi': 'pubmed_esummary.json',
+    'studies': 'clinical_trials_studies.json',
+    'drugsfda.json': 'fda_drugsfda.json',
+}
+
+
+class StubServer:
+    def __init__(self, latency: float = 0.0, host: str = '127.0.0.1', port: int = 0):
+        """Локальная заглушка PubMed, ClinicalTrials.gov и openFDA
+
+        Отдает записанные ответы из fixtures/ по последнему сегменту пути,
+        не глядя на параметры запроса; ``latency`` имитирует сетевую задержку.
+        """
+        self.latency = latency
+        self.fixtures = self._load_fixtures()
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'StubServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def env(self) -> Dict[str, str]:
+        """Переменные окружения, направляющие ResearchService на заглушку"""
+        return {
+            'PUBMED_BASE_URL': f'{self.url}/entrez/eutils',
+            'CLINICAL_TRIALS_BASE_URL': f'{self.url}/api/v2',
+            'FDA_BASE_URL': self.url,
+        }
+
+    def _load_fixtures(self) -> Dict[str, bytes]:
+        fixtures = {}
+        for route, filename in ROUTES.items():
+            with open(os.path.join(FIXTURES_DIR, filename), 'rb') as fixture:
+                fixtures[route] = fixture.read()
+        return fixtures
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+
+                route = self.path.split('?', 1)[0].rstrip('/').rsplit('/', 1)[-1]
+                body = stub.fixtures.get(route)
+                status = 200 if body is not None else 404
+                body = body if body is not None else b'{"error": "not found"}'
+
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,51 @@
+"""Настройки gunicorn (production): python -m gunicorn -c gunicorn.conf.py src.wsgi:app"""
+import os
+import multiprocessing
+
+bind = os.getenv('GUNICORN_BIND', f"0.0.0.0:{os.getenv('PORT', 5000)}")
+workers = int(os.getenv('GUNICORN_WORKERS', min(multiprocessing.cpu_count() * 2 + 1, 4)))
+# Воркеры делят между собой лимиты частоты запросов к источникам (см. HttpClient)
+os.environ['GUNICORN_WORKERS'] = str(workers)
+# Потоки воркера: запросы в основном ждут Gemini и внешние API
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+worker_class = 'gthread' if threads > 1 else 'sync'
+# Анализ и пакетный поиск отдаются потоком и могут идти долго
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+# Приложение и словари загружаются в мастере один раз и разделяются воркерами
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 0))
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+
+
+def when_ready(server):
+    """Мастер: справочные данные загружаются до fork и разделяются воркерами (copy-on-write)"""
+    from src.services.inn_index import get_inn_index
+    get_inn_index()
+
+
+def post_fork(server, worker):
+    """Воркер: свои соединения с базой (при preload_app приложение создано в мастере)"""
+    from src.models.user import db
+    from src.services.job_queue import job_queue
+
+    # Соединения SQLite, открытые мастером, не переиспользуются после fork
+    if job_queue.app is not None:
+        with job_queue.app.app_context():
+            db.engine.dispose(close=False)
+
+
+def post_worker_init(worker):
+    """Воркер с загруженным приложением (в обоих режимах preload_app): сервисы и очередь задач"""
+    from src.services.job_queue import job_queue
+    from src.services.research_prefetch import research_prefetch
+    from src.services.registry import services
+
+    # Сервисы создаются до первого запроса; ошибки (например, нет GEMINI_API_KEY) видны в /api/health
+    services.preload()
+    # Каждый воркер выполняет задачи из очереди и подбирает задачи завершившихся воркеров
+    job_queue.start()
+    research_prefetch.start()
@@ -0,0 +1,200 @@
+"""Пакетный анализ протоколов из каталога или zip архива
+
+Пример запуска (из каталога backend):
+
+    python -m src.batch_ingest protocols.zip -o results.jsonl
+
+Текст из DOCX извлекается в пуле процессов, запросы к модели выполняются
+асинхронно с ограничением числа одновременных вызовов. Каждый результат
+сразу дописывается в JSONL файл; при повторном запуске уже успешно
+обработанные документы пропускаются, поэтому прерванный запуск
+продолжается с места остановки.
+"""
+import os
+import io
+import sys
+import json
+import time
+import asyncio
+import zipfile
+import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Set, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.main import create_app
+from src.services.docx_ingest import DOCX_MAX_UNCOMPRESSED
+from src.services.protocol_analyzer import ProtocolAnalyzer, extract_docx_text
+
+# Документ: (путь к файлу или архиву, имя части архива или None)
+Location = Tuple[str, Optional[str]]
+
+
+def find_documents(source: str) -> Dict[str, Location]:
+    """DOCX документы каталога (рекурсивно) или zip архива по их именам"""
+    documents: Dict[str, Location] = {}
+    if os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if name.lower().endswith('.docx') and not name.startswith('~$'):
+                    path = os.path.join(root, name)
+                    documents[os.path.relpath(path, source)] = (path, None)
+    elif zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for entry in archive.infolist():
+                name = entry.filename
+                if (entry.is_dir() or not name.lower().endswith('.docx')
+                        or name.startswith('__MACOSX/') or os.path.basename(name).startswith('~$')):
+                    continue
+                documents[name] = (source, name)
+    else:
+        raise ValueError(f"Ожидается каталог или zip архив: {source}")
+    return dict(sorted(documents.items()))
+
+
+def extract_document(location: Location) -> str:
+    """Извлечение текста документа (выполняется в пуле процессов)"""
+    path, member = location
+    if member is None:
+        return extract_docx_text(path)
+
+    with zipfile.ZipFile(path) as archive:
+        if archive.getinfo(member).file_size > DOCX_MAX_UNCOMPRESSED:
+            raise Exception("Размер документа в архиве превышает допустимый")
+        payload = archive.read(member)
+    return extract_docx_text(io.BytesIO(payload))
+
+
+def load_checkpoint(output: str) -> Set[str]:
+    """Имена документов, уже успешно обработанных в предыдущих запусках"""
+    done: Set[str] = set()
+    if not os.path.exists(output):
+        return done
+
+    with open(output, encoding='utf-8') as results:
+        for line in results:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Последняя строка могла остаться недописанной при аварийном завершении
+                continue
+            if record.get('success'):
+                done.add(record['source'])
+            else:
+                done.discard(record.get('source'))
+    return done
+
+
+class BatchIngest:
+    def __init__(self, analyzer: ProtocolAnalyzer, output: str, workers: int,
+                 concurrency: int, refresh: bool = False):
+        """Пакетный анализ: извлечение в процессах, ограниченные по числу вызовы модели"""
+        self.analyzer = analyzer
+        self.output = output
+        self.workers = workers
+        self.concurrency = concurrency
+        self.refresh = refresh
+        self.stats = {'total': 0, 'skipped': 0, 'succeeded': 0, 'failed': 0}
+        self._started = 0.0
+
+    def run(self, documents: Dict[str, Location]) -> Dict[str, Any]:
+        """Обработка документов; возвращает итоговую статистику"""
+        done = load_checkpoint(self.output)
+        pending = {name: location for name, location in documents.items() if name not in done}
+        self.stats['total'] = len(documents)
+        self.stats['skipped'] = len(documents) - len(pending)
+        if self.stats['skipped']:
+            print(f"Пропущено уже обработанных документов: {self.stats['skipped']}")
+
+        self._started = time.time()
+        if pending:
+            asyncio.run(self._process(pending))
+
+        elapsed = time.time() - self._started
+        self.stats['elapsed'] = round(elapsed, 1)
+        self.stats['docs_per_minute'] = round(self._throughput(elapsed), 2)
+        return self.stats
+
+    async def _process(self, documents: Dict[str, Location]) -> None:
+        loop = asyncio.get_running_loop()
+        model_slots = asyncio.Semaphore(self.concurrency)
+        # Ограничивает число извлеченных, но еще не проанализированных текстов в памяти
+        in_flight = asyncio.Semaphore(self.workers + 2 * self.concurrency)
+
+        with ProcessPoolExecutor(max_workers=self.workers) as extractors, \
+                ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='batch') as model_threads, \
+                open(self.output, 'a', encoding='utf-8') as results:
+
+            async def handle(name: str, location: Location) -> None:
+                async with in_flight:
+                    started = time.time()
+                    try:
+                        text = await loop.run_in_executor(extractors, extract_document, location)
+                    except Exception as e:
+                        result = {'success': False, 'error': str(e)}
+                    else:
+                        async with model_slots:
+                            result = await loop.run_in_executor(
+                                model_threads, lambda: self.analyzer.analyze_text(text, self.refresh, filename=name)
+                            )
+                    self._write(results, name, result, time.time() - started)
+
+            await asyncio.gather(*(handle(name, location) for name, location in documents.items()))
+
+    def _write(self, results, name: str, result: Dict[str, Any], elapsed: float) -> None:
+        """Запись результата с немедленным сбросом на диск (контрольная точка)"""
+        record = {'source': name, **result, 'elapsed': round(elapsed, 2)}
+        results.write(json.dumps(record, ensure_ascii=False) + '\n')
+        results.flush()
+        os.fsync(results.fileno())
+
+        key = 'succeeded' if result.get('success') else 'failed'
+        self.stats[key] += 1
+        processed = self.stats['succeeded'] + self.stats['failed']
+        remaining = self.stats['total'] - self.stats['skipped']
+        status = 'ok' if result.get('success') else f"ошибка: {result.get('error')}"
+        print(f"[{processed}/{remaining}] {name} - {status} "
+              f"({self._throughput(time.time() - self._started):.1f} док/мин)", flush=True)
+
+    def _throughput(self, elapsed: float) -> float:
+        processed = self.stats['succeeded'] + self.stats['failed']
+        return processed * 60 / elapsed if elapsed > 0 else 0.0
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Пакетный анализ DOCX протоколов')
+    parser.add_argument('source', help='каталог с DOCX файлами или zip архив')
+    parser.add_argument('-o', '--output', default='batch_results.jsonl',
+                        help='JSONL файл результатов (он же контрольная точка)')
+    parser.add_argument('--workers', type=int, default=int(os.getenv('BATCH_EXTRACT_WORKERS', os.cpu_count() or 2)),
+                        help='число процессов для извлечения текста')
+    parser.add_argument('--concurrency', type=int, default=int(os.getenv('BATCH_MODEL_CONCURRENCY', 4)),
+                        help='максимум одновременных запросов к модели')
+    parser.add_argument('--refresh', action='store_true', help='не использовать кэш анализов')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    try:
+        documents = find_documents(args.source)
+    except (ValueError, OSError, zipfile.BadZipFile) as e:
+        print(f"Ошибка: {str(e)}", file=sys.stderr)
+        return 2
+
+    print(f"Найдено документов: {len(documents)}")
+    # База и кэш анализов те же, что у веб-приложения
+    create_app(serve=False)
+    batch = BatchIngest(ProtocolAnalyzer(), args.output, max(args.workers, 1),
+                        max(args.concurrency, 1), refresh=args.refresh)
+    stats = batch.run(documents)
+    print(json.dumps(stats, ensure_ascii=False))
+    return 1 if stats['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,49 @@
+"""Импорт выгрузки openFDA drugsfda в локальное зеркало
+
+Пример запуска (из каталога backend):
+
+    python -m src.fda_import drug-drugsfda-0001-of-0001.json.zip
+
+Выгрузка скачивается с https://open.fda.gov/data/downloads/ (раздел
+Drugs@FDA). Содержимое зеркала заменяется целиком; запущенное приложение
+подхватывает новые данные в течение FDA_MIRROR_REFRESH секунд.
+"""
+import os
+import sys
+import json
+import time
+import zipfile
+import argparse
+from typing import List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.main import create_app
+from src.services.fda_mirror import FdaMirror
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Импорт выгрузки openFDA drugsfda в локальное зеркало')
+    parser.add_argument('dump', help='JSON файл выгрузки или zip архив с ним')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    mirror = FdaMirror(create_app(serve=False))
+    started = time.perf_counter()
+    try:
+        count = mirror.import_dump(args.dump)
+    except (ValueError, OSError, zipfile.BadZipFile, json.JSONDecodeError) as e:
+        print(f"Ошибка: {str(e)}", file=sys.stderr)
+        return 2
+
+    print(json.dumps({'rows': count, 'seconds': round(time.perf_counter() - started, 2)}, ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,49 +8,135 @@ load_dotenv()
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
+from typing import Dict, Any, Optional
 from flask import Flask, send_from_directory
 from flask_cors import CORS
 from src.models.user import db
-from src.routes.user import user_bp
-from src.routes.analyzer import analyzer_bp
-
-app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
-
-# Конфигурация из переменных окружения
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'asdf#FGSgvasgf$5$WGT')
-app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_CONTENT_LENGTH', 16777216))  # 16MB
-
-# Настройка CORS
-cors_origins = os.getenv('CORS_ORIGINS', 'http://localhost:3000,http://localhost:5173').split(',')
-CORS(app, origins=cors_origins)
-
-# Регистрация blueprints
-app.register_blueprint(user_bp, url_prefix='/api')
-app.register_blueprint(analyzer_bp, url_prefix='/api')
-
-# uncomment if you need to use database
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db.init_app(app)
-with app.app_context():
-    db.create_all()
-
-@app.route('/', defaults={'path': ''})
-@app.route('/<path:path>')
-def serve(path):
-    static_folder_path = app.static_folder
-    if static_folder_path is None:
-            return "Static folder not configured", 404
-
-    if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
-        return send_from_directory(static_folder_path, path)
-    else:
-        index_path = os.path.join(static_folder_path, 'index.html')
-        if os.path.exists(index_path):
-            return send_from_directory(static_folder_path, 'index.html')
+from src.services.research_cache import research_cache
+from src.services.analysis_cache import analysis_cache
+from src.services.analysis_history import analysis_history
+from src.services.job_queue import job_queue
+from src.services.research_prefetch import research_prefetch
+from src.services.registry import services
+from src.services.http_client import get_http_client
+from src.services.protocol_analyzer import ProtocolAnalyzer
+from src.services.research_service import ResearchService
+from src.services.research_engine import ResearchEngine
+from src.services.pdf_report import PdfReportService
+from src.services.metrics import metrics
+from src.services.fda_mirror import fda_mirror
+from src.services.compression import compression
+from src.services.json_provider import OrjsonProvider
+
+STATIC_DIR = os.path.join(os.path.dirname(__file__), 'static')
+# Файлы сборки Vite с хэшем содержимого в имени (assets/index-3f2a1b.js) не меняются
+STATIC_IMMUTABLE_PREFIX = 'assets/'
+STATIC_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def create_app(config: Optional[Dict[str, Any]] = None, serve: bool = True,
+               dispatch_jobs: bool = True) -> Flask:
+    """Фабрика приложения
+
+    ``serve=False`` - только база и кэши (для CLI импорта и пакетной
+    обработки), без маршрутов и очереди задач. ``dispatch_jobs=False``
+    восстанавливает прерванные задачи в базе, но не запускает их в этом
+    процессе (под gunicorn их запускают воркеры, см. gunicorn.conf.py).
+    """
+    app = Flask(__name__, static_folder=STATIC_DIR)
+    # Быстрый JSON (orjson, если установлен)
+    app.json = OrjsonProvider(app)
+
+    # Конфигурация из переменных окружения
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'asdf#FGSgvasgf$5$WGT')
+    app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_CONTENT_LENGTH', 16777216))  # 16MB
+
+    database_dir = os.path.join(os.path.dirname(__file__), 'database')
+    os.makedirs(database_dir, exist_ok=True)
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('SQLALCHEMY_DATABASE_URI', f"sqlite:///{os.path.join(database_dir, 'app.db')}")
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config.update(config or {})
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+
+    # Кэш результатов поиска исследований (LRU в памяти + SQLite)
+    research_cache.init_app(app)
+    # Локальное зеркало openFDA drugsfda (заполняется python -m src.fda_import)
+    fda_mirror.init_app(app)
+    # Кэш результатов анализа протоколов по хэшу содержимого
+    analysis_cache.init_app(app)
+    # История анализов с полнотекстовым индексом (FTS5)
+    analysis_history.init_app(app)
+    if not serve:
+        return app
+
+    # Маршруты импортируются только для веб-приложения
+    from src.routes.user import user_bp
+    from src.routes.analyzer import analyzer_bp
+    from src.routes.jobs import jobs_bp
+    from src.routes.history import history_bp
+
+    # Настройка CORS
+    cors_origins = os.getenv('CORS_ORIGINS', 'http://localhost:3000,http://localhost:5173').split(',')
+    CORS(app, origins=cors_origins)
+
+    # Регистрация blueprints
+    app.register_blueprint(user_bp, url_prefix='/api')
+    app.register_blueprint(analyzer_bp, url_prefix='/api')
+    app.register_blueprint(jobs_bp, url_prefix='/api')
+    app.register_blueprint(history_bp, url_prefix='/api')
+
+    # Общие для процесса сервисы создаются лениво при первом обращении
+    services.init_app(app)
+    services.register('http_client', get_http_client)
+    services.register('protocol_analyzer', ProtocolAnalyzer)
+    services.register('research_service', lambda: ResearchService(services.get('http_client')))
+    services.register('research_engine', lambda: ResearchEngine(services.get('research_service')))
+    services.register('pdf_reports', PdfReportService)
+
+    # Метрики этапов; заголовок X-Trace: 1 возвращает длительности этапов запроса
+    metrics.init_app(app)
+    # Сжатие ответов API (gzip, brotli - если установлен)
+    compression.init_app(app)
+    # Предзагрузка исследований для препаратов завершенных анализов
+    research_prefetch.init_app(app)
+    # Фоновые задачи анализа (незавершенные задачи возобновляются при старте)
+    job_queue.init_app(app, dispatch=dispatch_jobs)
+    if dispatch_jobs:
+        research_prefetch.start()
+
+    @app.route('/', defaults={'path': ''})
+    @app.route('/<path:path>')
+    def serve_static(path):
+        static_folder_path = app.static_folder
+        if static_folder_path is None:
+                return "Static folder not configured", 404
+
+        # send_from_directory отдает ETag и Last-Modified и отвечает 304 на условные запросы
+        if path != "" and os.path.isfile(os.path.join(static_folder_path, path)):
+            max_age = STATIC_MAX_AGE if path.startswith(STATIC_IMMUTABLE_PREFIX) else 0
+            response = send_from_directory(static_folder_path, path, max_age=max_age)
+            if max_age:
+                response.cache_control.immutable = True
+            return response
         else:
-            return "index.html not found", 404
+            index_path = os.path.join(static_folder_path, 'index.html')
+            if os.path.exists(index_path):
+                # index.html всегда перепроверяется, чтобы клиент увидел новую сборку
+                response = send_from_directory(static_folder_path, 'index.html', max_age=0)
+                response.cache_control.no_cache = True
+                return response
+            else:
+                return "index.html not found", 404
+
+    return app
 
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # Сервер разработки; для production используется gunicorn (src/wsgi.py)
+    debug = os.getenv('FLASK_DEBUG', '1') == '1'
+    # С перезагрузчиком модуль выполняется и в наблюдающем процессе: очередь задач и
+    # предзагрузку запускает только процесс, который обслуживает запросы
+    serving = not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'
+    create_app(dispatch_jobs=serving).run(host='0.0.0.0', port=int(os.getenv('PORT', 5000)), debug=debug)
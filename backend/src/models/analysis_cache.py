@@ -0,0 +1,15 @@
+from src.models.user import db
+
+class AnalysisCacheEntry(db.Model):
+    __tablename__ = 'analysis_cache'
+
+    key = db.Column(db.String(64), primary_key=True)
+    model = db.Column(db.String(80), nullable=False)
+    prompt_version = db.Column(db.String(32), nullable=False)
+    result = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.Float, nullable=False)
+    last_accessed_at = db.Column(db.Float, nullable=False, index=True)
+    hits = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<AnalysisCacheEntry {self.key[:12]}>'
@@ -0,0 +1,72 @@
+import json
+from src.models.user import db
+
+class ProtocolAnalysis(db.Model):
+    __tablename__ = 'protocol_analyses'
+
+    id = db.Column(db.Integer, primary_key=True)
+    content_key = db.Column(db.String(64), unique=True, nullable=False)
+    filename = db.Column(db.String(255), nullable=False, default='')
+    protocol_summary = db.Column(db.Text, nullable=False, default='')
+    main_condition = db.Column(db.String(255), nullable=False, default='')
+    drug_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.Float, nullable=False, index=True)
+    drugs = db.relationship('AnalysisDrug', backref='analysis', lazy='selectin',
+                            cascade='all, delete-orphan', order_by='AnalysisDrug.position')
+    sections = db.relationship('AnalysisSection', lazy='select',
+                               cascade='all, delete-orphan', order_by='AnalysisSection.position')
+
+    def __repr__(self):
+        return f'<ProtocolAnalysis {self.id} {self.filename}>'
+
+    def to_dict(self, with_drugs: bool = True):
+        data = {
+            'id': self.id,
+            'filename': self.filename,
+            'protocol_summary': self.protocol_summary,
+            'main_condition': self.main_condition,
+            'drug_count': self.drug_count,
+            'created_at': self.created_at
+        }
+        if with_drugs:
+            data['drugs'] = [drug.to_dict() for drug in self.drugs]
+        else:
+            data['inns'] = sorted({drug.inn for drug in self.drugs if drug.inn})
+        return data
+
+class AnalysisDrug(db.Model):
+    __tablename__ = 'analysis_drugs'
+    __table_args__ = (db.Index('ix_analysis_drugs_inn_analysis', 'inn', 'analysis_id'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    analysis_id = db.Column(db.Integer, db.ForeignKey('protocol_analyses.id', ondelete='CASCADE'),
+                            nullable=False, index=True)
+    position = db.Column(db.Integer, nullable=False, default=0)
+    inn = db.Column(db.String(255), nullable=False, default='')
+    name = db.Column(db.String(255), nullable=False, default='')
+    dosage = db.Column(db.String(255), nullable=False, default='')
+    route = db.Column(db.String(255), nullable=False, default='')
+    data = db.Column(db.Text, nullable=False)
+
+    def __repr__(self):
+        return f'<AnalysisDrug {self.analysis_id}:{self.inn or self.name}>'
+
+    def to_dict(self):
+        return json.loads(self.data)
+
+class AnalysisSection(db.Model):
+    """Результат анализа блока разделов (для повторного анализа только измененных разделов)"""
+    __tablename__ = 'analysis_sections'
+
+    id = db.Column(db.Integer, primary_key=True)
+    analysis_id = db.Column(db.Integer, db.ForeignKey('protocol_analyses.id', ondelete='CASCADE'),
+                            nullable=False, index=True)
+    position = db.Column(db.Integer, nullable=False, default=0)
+    fingerprints = db.Column(db.Text, nullable=False)
+    result = db.Column(db.Text, nullable=False)
+
+    def __repr__(self):
+        return f'<AnalysisSection {self.analysis_id}:{self.position}>'
+
+    def to_dict(self):
+        return {'fingerprints': self.fingerprints.split(','), 'result': json.loads(self.result)}
@@ -0,0 +1,14 @@
+from src.models.user import db
+
+class FdaApplication(db.Model):
+    __tablename__ = 'fda_drugsfda'
+
+    id = db.Column(db.Integer, primary_key=True)
+    ingredient = db.Column(db.String(255), nullable=False, index=True)
+    application_number = db.Column(db.String(32), nullable=False)
+    sponsor_name = db.Column(db.String(255), nullable=False, default='')
+    brand_name = db.Column(db.String(255), nullable=False, default='')
+    imported_at = db.Column(db.Float, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<FdaApplication {self.ingredient}:{self.application_number}>'
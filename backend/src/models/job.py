@@ -0,0 +1,42 @@
+import json
+from src.models.user import db
+
+class AnalysisJob(db.Model):
+    __tablename__ = 'analysis_jobs'
+
+    id = db.Column(db.String(32), primary_key=True)
+    status = db.Column(db.String(16), nullable=False, index=True)
+    stage = db.Column(db.String(32), nullable=False)
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    filename = db.Column(db.String(255), nullable=False)
+    refresh = db.Column(db.Boolean, nullable=False, default=False)
+    # Режим редакций: id предыдущей версии в истории анализов (0 - ее нет), None - обычный анализ
+    revision_of = db.Column(db.Integer, nullable=True)
+    payload = db.Column(db.LargeBinary, nullable=True)
+    result = db.Column(db.Text, nullable=True)
+    partial_drugs = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    # Предзагрузка исследований после анализа: running, done или cancelled
+    prefetch = db.Column(db.String(16), nullable=True)
+    # Последнее обращение клиента к задаче (статус или поток событий)
+    seen_at = db.Column(db.Float, nullable=True)
+    created_at = db.Column(db.Float, nullable=False, index=True)
+    updated_at = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return f'<AnalysisJob {self.id} {self.status}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'stage': self.stage,
+            'progress': self.progress,
+            'filename': self.filename,
+            'result': json.loads(self.result) if self.result else None,
+            'partial_drugs': json.loads(self.partial_drugs) if self.partial_drugs else [],
+            'error': self.error,
+            'prefetch': self.prefetch,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at
+        }
@@ -0,0 +1,13 @@
+from src.models.user import db
+
+class ResearchCacheEntry(db.Model):
+    __tablename__ = 'research_cache'
+
+    source = db.Column(db.String(32), primary_key=True)
+    drug = db.Column(db.String(255), primary_key=True)
+    condition = db.Column(db.String(255), primary_key=True)
+    payload = db.Column(db.Text, nullable=False)
+    fetched_at = db.Column(db.Float, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<ResearchCacheEntry {self.source}:{self.drug}:{self.condition}>'
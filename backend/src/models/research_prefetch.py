@@ -0,0 +1,16 @@
+from src.models.user import db
+
+class PrefetchTask(db.Model):
+    """Пара (препарат, заболевание), ожидающая фоновой предзагрузки исследований"""
+    __tablename__ = 'prefetch_tasks'
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.String(32), nullable=False, index=True)
+    drug_name = db.Column(db.String(255), nullable=False)
+    condition = db.Column(db.String(255), nullable=False, default='')
+    # queued или running; обработанные пары удаляются
+    status = db.Column(db.String(16), nullable=False, index=True)
+    updated_at = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return f'<PrefetchTask {self.job_id}:{self.drug_name} {self.status}>'
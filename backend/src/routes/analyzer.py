@@ -1,21 +1,33 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context, send_from_directory, current_app
 from werkzeug.utils import secure_filename
 import os
-import tempfile
-from src.services.protocol_analyzer import ProtocolAnalyzer
-from src.services.research_service import ResearchService
+import json
+from src.services.registry import services
+from src.services.research_cache import research_cache
+from src.services.analysis_cache import analysis_cache
+from src.services.analysis_history import analysis_history
+from src.services.fda_mirror import fda_mirror
+from src.services.job_queue import job_queue
+from src.services.research_prefetch import research_prefetch
+from src.services.docx_ingest import validate_docx_stream, DocxValidationError
+from src.services.pdf_report import DOWNLOADS_DIR, DAY
+from src.services.metrics import metrics, current_trace, summarize
 
 analyzer_bp = Blueprint('analyzer', __name__)
 
 ALLOWED_EXTENSIONS = {'docx'}
+RESEARCH_BATCH_LIMIT = int(os.getenv('RESEARCH_BATCH_LIMIT', 100))
 
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def is_truthy(value):
+    return str(value).strip().lower() in {'1', 'true', 'yes', 'on'}
+
 @analyzer_bp.route('/upload', methods=['POST'])
 def upload_file():
-    """Загрузка и анализ DOCX файла протокола"""
+    """Загрузка DOCX файла протокола и постановка его анализа в очередь"""
     try:
         if 'file' not in request.files:
             return jsonify({'error': 'Файл не найден'}), 400
@@ -27,19 +39,34 @@ def upload_file():
         if not allowed_file(file.filename):
             return jsonify({'error': 'Разрешены только DOCX файлы'}), 400
         
-        # Сохраняем файл во временную директорию
-        filename = secure_filename(file.filename)
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.docx') as tmp_file:
-            file.save(tmp_file.name)
-            
-            # Анализируем протокол
-            analyzer = ProtocolAnalyzer()
-            result = analyzer.analyze_protocol(tmp_file.name)
-            
-            # Удаляем временный файл
-            os.unlink(tmp_file.name)
-            
-            return jsonify(result)
+        filename = secure_filename(file.filename) or 'protocol.docx'
+        # refresh=1 заставляет заново проанализировать протокол, минуя кэш
+        refresh = is_truthy(request.args.get('refresh') or request.form.get('refresh', ''))
+        # revision=1 - новая редакция: модели отправляются только измененные разделы;
+        # предыдущая версия - revision_of (id анализа) или последний анализ файла с тем же именем
+        revision_of = request.args.get('revision_of') or request.form.get('revision_of')
+        if revision_of:
+            try:
+                revision_of = int(revision_of)
+            except ValueError:
+                return jsonify({'error': 'Некорректный параметр revision_of'}), 400
+        elif is_truthy(request.args.get('revision') or request.form.get('revision', '')):
+            revision_of = analysis_history.latest(filename) or 0
+        else:
+            revision_of = None
+        
+        # Проверяем архив прямо в потоке загрузки, до постановки в очередь
+        try:
+            validate_docx_stream(file.stream)
+        except DocxValidationError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        # Анализ выполняется в фоне; клиент следит за задачей через /api/jobs/<id>
+        job = job_queue.submit(filename, file.stream.read(), refresh=refresh, revision_of=revision_of)
+        job['status_url'] = f"/api/jobs/{job['id']}"
+        job['events_url'] = f"/api/jobs/{job['id']}/events"
+        
+        return jsonify(job), 202, {'Location': job['status_url']}
     
     except Exception as e:
         return jsonify({'error': f'Ошибка при анализе: {str(e)}'}), 500
@@ -49,19 +76,77 @@ def search_research(drug_name):
     """Поиск исследований для конкретного препарата"""
     try:
         condition = request.args.get('condition', '')
-        research_service = ResearchService()
+        # job - задача анализа, из результатов которой пришел запрос: клиент еще
+        # работает с результатами, и предзагрузка ее исследований продолжается
+        job_id = request.args.get('job')
+        if job_id:
+            job_queue.touch(job_id)
+        research_engine = services.get('research_engine')
         
-        results = {
-            'pubmed': research_service.search_pubmed(drug_name, condition),
-            'clinical_trials': research_service.search_clinical_trials(drug_name, condition),
-            'fda': research_service.search_fda(drug_name)
-        }
+        # Повторный запрос с If-None-Match: ответ 304 без поиска, если кэш не изменился
+        etag = research_engine.etag(drug_name, condition)
+        if etag and request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            # Все источники опрашиваются параллельно с общим дедлайном
+            response = jsonify(research_engine.search(drug_name, condition))
+            etag = research_engine.etag(drug_name, condition)
         
-        return jsonify(results)
+        if etag:
+            response.set_etag(etag, weak=True)
+        # Браузер перепроверяет ответ при каждом обращении
+        response.cache_control.no_cache = True
+        return response
     
     except Exception as e:
         return jsonify({'error': f'Ошибка при поиске исследований: {str(e)}'}), 500
 
+@analyzer_bp.route('/research/batch', methods=['POST'])
+def search_research_batch():
+    """Пакетный поиск исследований для всех препаратов протокола (NDJSON поток)"""
+    data = request.get_json(silent=True)
+    drugs = data.get('drugs') if isinstance(data, dict) else data
+    if not isinstance(drugs, list) or not drugs:
+        return jsonify({'error': 'Список препаратов не найден'}), 400
+    if len(drugs) > RESEARCH_BATCH_LIMIT:
+        return jsonify({'error': f'Слишком много препаратов (максимум {RESEARCH_BATCH_LIMIT})'}), 400
+    job_id = (data.get('job') if isinstance(data, dict) else None) or request.args.get('job')
+    if job_id:
+        job_queue.touch(str(job_id))
+    
+    # Группируем препараты по нормализованному запросу: одинаковые запросы выполняются один раз
+    lookups = {}
+    requested = {}
+    for drug in drugs:
+        if not isinstance(drug, dict):
+            continue
+        drug_name = (drug.get('canonicalInn') or drug.get('innEnglish') or drug.get('name') or '').strip()
+        if not drug_name:
+            continue
+        condition = (drug.get('targetCondition') or '').strip()
+        key = research_cache.make_key('pubmed', drug_name, condition)
+        lookups.setdefault(key, (drug_name, condition))
+        requested.setdefault(key, []).append(drug.get('id'))
+    
+    if not requested:
+        return jsonify({'error': 'Не указаны названия препаратов'}), 400
+    
+    research_engine = services.get('research_engine')
+    
+    def generate():
+        try:
+            for item in research_engine.search_batch(lookups.values()):
+                item['ids'] = requested[research_cache.make_key('pubmed', item['drug'], item['condition'])]
+                yield current_app.json.dumps(item, ensure_ascii=False) + '\n'
+        except Exception as e:
+            yield json.dumps({'error': f'Ошибка при поиске исследований: {str(e)}'}, ensure_ascii=False) + '\n'
+        # Заголовки уходят до начала поиска: с X-Trace длительности этапов - последней строкой
+        spans = current_trace()
+        if spans is not None:
+            yield json.dumps({'timings': summarize(spans)}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @analyzer_bp.route('/export/pdf', methods=['POST'])
 def export_pdf():
     """Экспорт результатов анализа в PDF"""
@@ -70,8 +155,8 @@ def export_pdf():
         if not data:
             return jsonify({'error': 'Данные для экспорта не найдены'}), 400
         
-        analyzer = ProtocolAnalyzer()
-        pdf_path = analyzer.generate_pdf_report(data)
+        # Отчет с тем же содержимым не генерируется повторно
+        pdf_path = services.get('pdf_reports').generate(data)
         
         return jsonify({'pdf_url': f'/api/download/{os.path.basename(pdf_path)}'})
     
@@ -84,27 +169,59 @@ def download_file(filename):
     try:
         # Безопасная проверка имени файла
         filename = secure_filename(filename)
-        downloads_dir = os.path.join(os.path.dirname(__file__), '..', 'downloads')
         
-        if not os.path.exists(os.path.join(downloads_dir, filename)):
+        if not os.path.exists(os.path.join(DOWNLOADS_DIR, filename)):
             return jsonify({'error': 'Файл не найден'}), 404
         
-        return send_from_directory(downloads_dir, filename, as_attachment=True)
+        # Имя файла зависит от содержимого, поэтому его можно кэшировать надолго
+        return send_from_directory(DOWNLOADS_DIR, filename, as_attachment=True, max_age=DAY)
     
     except Exception as e:
         return jsonify({'error': f'Ошибка при скачивании: {str(e)}'}), 500
 
 @analyzer_bp.route('/health', methods=['GET'])
 def health_check():
-    """Проверка состояния сервиса"""
+    """Проверка состояния сервиса
+
+    Возвращает 503, если анализатор протоколов не может быть создан
+    (например, не задан GEMINI_API_KEY).
+    """
+    errors = {}
+    analyzer_error = services.probe('protocol_analyzer')
+    if analyzer_error:
+        errors['gemini_ai'] = analyzer_error
+    engine_error = services.probe('research_engine')
+    if engine_error:
+        errors['research'] = engine_error
+    research_engine = None if engine_error else services.get('research_engine')
+    
+    def source_ready(source):
+        return research_engine is not None and research_engine.is_source_available(source)
+    
+    service_status = {
+        'gemini_ai': analyzer_error is None,
+        'pubmed': source_ready('pubmed'),
+        'clinical_trials': source_ready('clinical_trials'),
+        'fda': source_ready('fda')
+    }
+    healthy = all(service_status.values())
+    
     return jsonify({
-        'status': 'healthy',
+        'status': 'healthy' if healthy else 'degraded',
         'version': '2.0.0',
-        'services': {
-            'gemini_ai': True,  # TODO: добавить реальную проверку
-            'pubmed': True,
-            'clinical_trials': True,
-            'fda': True
-        }
-    })
+        # Счетчики ниже относятся к процессу, который ответил на запрос
+        'worker': os.getpid(),
+        'services': service_status,
+        'errors': errors,
+        'cache': {
+            'research': research_cache.stats(),
+            'analysis': analysis_cache.stats(),
+            'fda_mirror': fda_mirror.stats()
+        },
+        'prefetch': research_prefetch.stats()
+    }), 200 if service_status['gemini_ai'] else 503
 
+@analyzer_bp.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Метрики в текстовом формате Prometheus (значения текущего процесса с меткой worker)"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
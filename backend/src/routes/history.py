@@ -0,0 +1,50 @@
+from flask import Blueprint, request, jsonify
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from src.services.analysis_history import analysis_history
+
+history_bp = Blueprint('history', __name__)
+
+def parse_date(value: Optional[str], end: bool = False) -> Optional[float]:
+    """Дата YYYY-MM-DD (UTC) или unix timestamp; для конца периода дата включается целиком"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    date = datetime.fromisoformat(value)
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    if end and len(value) == 10:
+        date += timedelta(days=1)
+    return date.timestamp()
+
+@history_bp.route('/analyses', methods=['GET'])
+def list_analyses():
+    """Постраничный поиск по истории анализов (без обращения к Gemini и внешним API)"""
+    try:
+        since = parse_date(request.args.get('from'))
+        until = parse_date(request.args.get('to'), end=True)
+        page = int(request.args.get('page', 1))
+        per_page = int(request.args.get('per_page', 20))
+    except ValueError:
+        return jsonify({'error': 'Некорректные параметры: даты в формате YYYY-MM-DD, page и per_page - целые числа'}), 400
+    
+    try:
+        return jsonify(analysis_history.search(
+            inn=request.args.get('inn', '').strip(),
+            condition=request.args.get('condition', '').strip(),
+            query=request.args.get('q', '').strip(),
+            since=since, until=until, page=page, per_page=per_page
+        ))
+    except Exception as e:
+        return jsonify({'error': f'Ошибка при поиске в истории анализов: {str(e)}'}), 500
+
+@history_bp.route('/analyses/<int:analysis_id>', methods=['GET'])
+def get_analysis(analysis_id):
+    """Сохраненный анализ со списком препаратов"""
+    analysis = analysis_history.get(analysis_id)
+    if analysis is None:
+        return jsonify({'error': 'Анализ не найден'}), 404
+    return jsonify(analysis)
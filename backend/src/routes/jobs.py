@@ -0,0 +1,76 @@
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+import os
+import json
+import time
+from src.services.job_queue import job_queue, TERMINAL_STATUSES
+from src.services.research_prefetch import research_prefetch
+
+jobs_bp = Blueprint('jobs', __name__)
+
+JOB_EVENTS_INTERVAL = float(os.getenv('JOB_EVENTS_INTERVAL', 0.5))
+# Поток держит поток gunicorn, поэтому закрывается через JOB_EVENTS_MAX_DURATION секунд;
+# EventSource переподключается сам и продолжает с Last-Event-ID
+JOB_EVENTS_MAX_DURATION = float(os.getenv('JOB_EVENTS_MAX_DURATION', 25))
+JOB_EVENTS_RETRY_MS = int(os.getenv('JOB_EVENTS_RETRY_MS', 1000))
+
+@jobs_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Состояние задачи анализа и ее результат"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Задача не найдена'}), 404
+    job_queue.touch(job_id)
+    return jsonify(job)
+
+@jobs_bp.route('/jobs/<job_id>/prefetch', methods=['DELETE'])
+def cancel_prefetch(job_id):
+    """Отмена фоновой предзагрузки исследований задачи (клиент закрыл результаты)"""
+    if not research_prefetch.cancel(job_id):
+        return jsonify({'error': 'Задача не найдена'}), 404
+    return jsonify(job_queue.get(job_id))
+
+@jobs_bp.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Поток прогресса задачи (Server-Sent Events)
+
+    id события - число уже отправленных препаратов: после переподключения
+    с заголовком Last-Event-ID поток продолжается со следующего препарата.
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Задача не найдена'}), 404
+    try:
+        resume_from = max(0, int(request.headers.get('Last-Event-ID', 0)))
+    except ValueError:
+        resume_from = 0
+    
+    def generate():
+        current = job
+        last_state = None
+        sent_drugs = resume_from
+        started = time.monotonic()
+        yield f"retry: {JOB_EVENTS_RETRY_MS}\n\n"
+        while True:
+            # Каждый новый препарат отправляется отдельным событием
+            for drug in current['partial_drugs'][sent_drugs:]:
+                sent_drugs += 1
+                yield f"id: {sent_drugs}\nevent: drug\ndata: {json.dumps(drug, ensure_ascii=False)}\n\n"
+            
+            state = (current['status'], current['stage'], current['progress'])
+            if state != last_state:
+                last_state = state
+                event = current['status'] if current['status'] in TERMINAL_STATUSES else 'progress'
+                yield f"id: {sent_drugs}\nevent: {event}\ndata: {json.dumps(current, ensure_ascii=False)}\n\n"
+            if current['status'] in TERMINAL_STATUSES:
+                return
+            if time.monotonic() - started > JOB_EVENTS_MAX_DURATION:
+                # Клиент переподключится через retry мс и продолжит с id последнего события
+                return
+            time.sleep(JOB_EVENTS_INTERVAL)
+            job_queue.touch(job_id)
+            current = job_queue.get(job_id)
+            if current is None:
+                return
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
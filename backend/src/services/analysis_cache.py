@@ -0,0 +1,118 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import unicodedata
+from typing import Dict, Any, Optional
+from src.models.user import db
+from src.models.analysis_cache import AnalysisCacheEntry
+
+DAY = 24 * 60 * 60
+
+
+def normalize_protocol_text(text: str) -> str:
+    """Нормализация извлеченного текста: Unicode NFC, пробелы, пустые строки"""
+    text = unicodedata.normalize('NFC', text)
+    lines = (' '.join(line.split()) for line in text.splitlines())
+    return '\n'.join(line for line in lines if line)
+
+
+class AnalysisCache:
+    def __init__(self, app=None):
+        """Кэш результатов анализа протоколов по хэшу содержимого"""
+        self.app = None
+        self.max_entries = int(os.getenv('ANALYSIS_CACHE_MAX_ENTRIES', 500))
+        self.max_age = float(os.getenv('ANALYSIS_CACHE_MAX_AGE', 90 * DAY))
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'bypassed': 0, 'evictions': 0}
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Привязка к приложению Flask"""
+        self.app = app
+        app.extensions['analysis_cache'] = self
+
+    def make_key(self, text: str, model: str, prompt_version: str) -> str:
+        """Ключ: SHA-256 от нормализованного текста, модели и версии промпта"""
+        digest = hashlib.sha256()
+        digest.update(f"{model}\0{prompt_version}\0".encode('utf-8'))
+        digest.update(normalize_protocol_text(text).encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Сохраненный результат анализа или None"""
+        if self.app is None:
+            return None
+
+        try:
+            with self.app.app_context():
+                entry = db.session.get(AnalysisCacheEntry, key)
+                if entry is None or time.time() - entry.created_at > self.max_age:
+                    self._count('misses')
+                    return None
+
+                entry.last_accessed_at = time.time()
+                entry.hits += 1
+                result = json.loads(entry.result)
+                db.session.commit()
+        except Exception as e:
+            print(f"Ошибка при чтении кэша анализа: {str(e)}")
+            return None
+
+        self._count('hits')
+        return result
+
+    def set(self, key: str, result: Dict[str, Any], model: str, prompt_version: str) -> None:
+        """Сохранение результата анализа с последующим вытеснением старых записей"""
+        if self.app is None:
+            return
+
+        now = time.time()
+        try:
+            with self.app.app_context():
+                db.session.merge(AnalysisCacheEntry(
+                    key=key, model=model, prompt_version=prompt_version,
+                    result=json.dumps(result, ensure_ascii=False),
+                    created_at=now, last_accessed_at=now, hits=0
+                ))
+                db.session.commit()
+                self._evict(now)
+        except Exception as e:
+            print(f"Ошибка при сохранении кэша анализа: {str(e)}")
+
+    def record_bypass(self) -> None:
+        """Учет явного обхода кэша"""
+        self._count('bypassed')
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики кэша"""
+        with self._lock:
+            return dict(self._stats)
+
+    def _evict(self, now: float) -> None:
+        """Удаление записей старше max_age и самых давно использованных сверх max_entries"""
+        query = AnalysisCacheEntry.query
+        evicted = query.filter(AnalysisCacheEntry.created_at < now - self.max_age).delete()
+
+        overflow = query.count() - self.max_entries
+        if overflow > 0:
+            stale_keys = [
+                row[0] for row in query.order_by(AnalysisCacheEntry.last_accessed_at.asc())
+                .with_entities(AnalysisCacheEntry.key).limit(overflow)
+            ]
+            evicted += query.filter(AnalysisCacheEntry.key.in_(stale_keys)).delete(synchronize_session=False)
+
+        if evicted:
+            db.session.commit()
+            with self._lock:
+                self._stats['evictions'] += evicted
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+
+analysis_cache = AnalysisCache()
@@ -0,0 +1,203 @@
+import os
+import re
+import json
+import time
+from typing import Dict, List, Any, Optional
+from sqlalchemy import text as sql
+from sqlalchemy.exc import IntegrityError
+from src.models.user import db
+from src.models.analysis_history import ProtocolAnalysis, AnalysisDrug, AnalysisSection
+from src.services.inn_index import get_inn_index
+
+FTS_TABLE = 'protocol_analyses_fts'
+_FTS_TOKEN = re.compile(r'\w+')
+
+
+def fts_query(query: str) -> str:
+    """Запрос FTS5 из произвольной строки: все слова по префиксу ("диабет" найдет "диабета")
+
+    Слова берутся в кавычки, поэтому синтаксис FTS5 в запросе не интерпретируется.
+    """
+    return ' '.join(f'"{token}"*' for token in _FTS_TOKEN.findall(query.lower()))
+
+
+class AnalysisHistory:
+    def __init__(self, app=None):
+        """История анализов протоколов: таблицы препаратов с индексами и FTS5 по тексту
+
+        Повторный анализ того же содержимого (тот же ключ кэша анализов)
+        обновляет существующую запись, а не создает новую.
+        """
+        self.app = None
+        self.max_per_page = int(os.getenv('HISTORY_MAX_PER_PAGE', 100))
+        self.fts = False
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Привязка к приложению Flask и создание полнотекстового индекса"""
+        self.app = app
+        app.extensions['analysis_history'] = self
+        with app.app_context():
+            if db.engine.dialect.name != 'sqlite':
+                return
+            try:
+                db.session.execute(sql(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                    "protocol_text, summary, condition, tokenize='unicode61 remove_diacritics 2')"
+                ))
+                db.session.commit()
+                self.fts = True
+            except Exception as e:
+                db.session.rollback()
+                print(f"Ошибка при создании полнотекстового индекса: {str(e)}")
+
+    def record(self, content_key: str, text: str, result: Dict[str, Any], filename: str = '',
+               sections: Optional[List[Dict[str, Any]]] = None) -> Optional[int]:
+        """Сохранение успешного анализа; возвращает id записи истории
+
+        ``sections`` - результаты блоков разделов (см. ``ProtocolAnalyzer``);
+        если не переданы, ранее сохраненные блоки той же записи остаются.
+        """
+        if self.app is None:
+            return None
+
+        # Одинаковое содержимое может сохраняться одновременно из нескольких потоков:
+        # проигравший вставку по content_key повторяет запись как обновление
+        for _ in range(2):
+            with self.app.app_context():
+                try:
+                    return self._save(content_key, text, result, filename, sections)
+                except IntegrityError:
+                    db.session.rollback()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Ошибка при сохранении истории анализов: {str(e)}")
+                    return None
+        print("Ошибка при сохранении истории анализов: конфликт записи")
+        return None
+
+    def _save(self, content_key: str, text: str, result: Dict[str, Any], filename: str,
+              sections: Optional[List[Dict[str, Any]]]) -> int:
+        drugs = result.get('drugs', [])
+        analysis = ProtocolAnalysis.query.filter_by(content_key=content_key).first()
+        if analysis is None:
+            analysis = ProtocolAnalysis(content_key=content_key)
+            db.session.add(analysis)
+        else:
+            # Строки удаляются запросом, а не заменой коллекции: параллельное обновление
+            # той же записи не приводит к рассинхронизации сессии
+            AnalysisDrug.query.filter_by(analysis_id=analysis.id).delete(synchronize_session='fetch')
+            if sections is not None:
+                AnalysisSection.query.filter_by(analysis_id=analysis.id).delete(synchronize_session='fetch')
+        analysis.filename = (filename or analysis.filename or '')[:255]
+        analysis.protocol_summary = result.get('protocol_summary', '')
+        analysis.main_condition = (result.get('main_condition') or '')[:255]
+        analysis.drug_count = len(drugs)
+        analysis.created_at = time.time()
+        db.session.flush()
+        db.session.add_all(self._drug_row(analysis.id, position, drug) for position, drug in enumerate(drugs))
+        if sections is not None:
+            db.session.add_all(
+                AnalysisSection(analysis_id=analysis.id, position=position,
+                                fingerprints=','.join(section['fingerprints']),
+                                result=json.dumps(section['result'], ensure_ascii=False))
+                for position, section in enumerate(sections)
+            )
+        db.session.flush()
+
+        if self.fts:
+            db.session.execute(sql(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), {'id': analysis.id})
+            db.session.execute(sql(
+                f"INSERT INTO {FTS_TABLE} (rowid, protocol_text, summary, condition) "
+                "VALUES (:id, :text, :summary, :condition)"
+            ), {'id': analysis.id, 'text': text, 'summary': analysis.protocol_summary,
+                'condition': analysis.main_condition})
+        db.session.commit()
+        return analysis.id
+
+    def get(self, analysis_id: int) -> Optional[Dict[str, Any]]:
+        """Анализ с полным списком препаратов"""
+        with self.app.app_context():
+            analysis = db.session.get(ProtocolAnalysis, analysis_id)
+            return analysis.to_dict() if analysis else None
+
+    def latest(self, filename: str) -> Optional[int]:
+        """Последний анализ файла с тем же именем (предыдущая версия протокола)"""
+        if self.app is None or not filename:
+            return None
+        with self.app.app_context():
+            analysis = ProtocolAnalysis.query.filter_by(filename=filename[:255]) \
+                .order_by(ProtocolAnalysis.created_at.desc()).first()
+            return analysis.id if analysis else None
+
+    def sections(self, analysis_id: int) -> List[Dict[str, Any]]:
+        """Сохраненные результаты блоков разделов анализа"""
+        if self.app is None:
+            return []
+        with self.app.app_context():
+            return [section.to_dict() for section in AnalysisSection.query
+                    .filter_by(analysis_id=analysis_id).order_by(AnalysisSection.position)]
+
+    def search(self, inn: str = '', condition: str = '', query: str = '',
+               since: Optional[float] = None, until: Optional[float] = None,
+               page: int = 1, per_page: int = 20) -> Dict[str, Any]:
+        """Постраничный поиск по МНН, заболеванию, тексту и дате (новые сначала)"""
+        page = max(page, 1)
+        per_page = min(max(per_page, 1), self.max_per_page)
+
+        with self.app.app_context():
+            filters = []
+            if inn:
+                key = get_inn_index().normalize(inn)
+                filters.append(ProtocolAnalysis.id.in_(
+                    db.select(AnalysisDrug.analysis_id).where(AnalysisDrug.inn == key)
+                ))
+            if condition:
+                filters.append(self._text_filter(condition, 'condition', ProtocolAnalysis.main_condition))
+            if query:
+                filters.append(self._text_filter(query, None, ProtocolAnalysis.protocol_summary))
+            if since is not None:
+                filters.append(ProtocolAnalysis.created_at >= since)
+            if until is not None:
+                filters.append(ProtocolAnalysis.created_at < until)
+
+            base = ProtocolAnalysis.query.filter(*filters)
+            total = base.count()
+            analyses = base.order_by(ProtocolAnalysis.created_at.desc(), ProtocolAnalysis.id.desc()) \
+                .offset((page - 1) * per_page).limit(per_page).all()
+            return {
+                'items': [analysis.to_dict(with_drugs=False) for analysis in analyses],
+                'page': page,
+                'per_page': per_page,
+                'total': total,
+                'pages': (total + per_page - 1) // per_page
+            }
+
+    def _text_filter(self, value: str, column: Optional[str], fallback):
+        """Условие полнотекстового поиска (по столбцу FTS или по всем); без FTS5 - LIKE"""
+        match = fts_query(value)
+        if not self.fts or not match:
+            return fallback.ilike(f"%{value.strip()}%")
+        if column:
+            match = f"{column} : ({match})"
+        return ProtocolAnalysis.id.in_(
+            sql(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match")
+            .bindparams(match=match).columns(db.column('rowid'))
+        )
+
+    def _drug_row(self, analysis_id: int, position: int, drug: Dict[str, Any]) -> AnalysisDrug:
+        inn = drug.get('canonicalInn') or get_inn_index().resolve_drug(drug) or ''
+        return AnalysisDrug(
+            analysis_id=analysis_id,
+            position=position,
+            inn=inn[:255],
+            name=(drug.get('name') or '')[:255],
+            dosage=(drug.get('dosage') or '')[:255],
+            route=(drug.get('route') or '')[:255],
+            data=json.dumps(drug, ensure_ascii=False)
+        )
+
+
+analysis_history = AnalysisHistory()
@@ -0,0 +1,125 @@
+import os
+import zlib
+from typing import Iterable, Iterator, Optional
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен: без него используется только gzip
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = frozenset((
+    'application/json', 'application/x-ndjson', 'application/javascript',
+    'text/html', 'text/css', 'text/plain', 'text/javascript', 'image/svg+xml',
+))
+
+
+class _GzipEncoder:
+    def __init__(self, level: int):
+        # wbits 16 + MAX_WBITS - формат gzip (заголовок и контрольная сумма)
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        # Синхронизация без завершения потока: клиент сразу получает строку NDJSON
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _BrotliEncoder:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class Compression:
+    def __init__(self, app=None):
+        """Сжатие ответов gzip или brotli по заголовку Accept-Encoding
+
+        Обычные ответы сжимаются целиком, потоковые (NDJSON) - по частям с
+        синхронизацией после каждой, чтобы не задерживать выдачу. Файлы
+        (send_file) и уже сжатые ответы не трогаются.
+        """
+        self.app = None
+        self.min_size = int(os.getenv('COMPRESS_MIN_SIZE', 500))
+        self.gzip_level = int(os.getenv('COMPRESS_GZIP_LEVEL', 6))
+        # Средний уровень brotli: почти как максимальный по размеру, но быстрее в разы
+        self.brotli_quality = int(os.getenv('COMPRESS_BROTLI_QUALITY', 5))
+
+        if app is not None:
+            self.init_app(app)
+
+    @property
+    def encodings(self):
+        return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+    def init_app(self, app):
+        """Привязка к приложению Flask"""
+        self.app = app
+        app.extensions['compression'] = self
+
+        from flask import request
+
+        @app.after_request
+        def compress_response(response):
+            return self.compress(response, request.accept_encodings.best_match(self.encodings))
+
+    def compress(self, response, encoding: Optional[str]):
+        """Сжатие ответа выбранным способом (None - без сжатия)"""
+        if (response.mimetype not in COMPRESSIBLE_MIMETYPES or response.direct_passthrough
+                or 'Content-Encoding' in response.headers or not 200 <= response.status_code < 300
+                or response.status_code == 204):
+            return response
+        response.vary.add('Accept-Encoding')
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = self._stream(response.response, self._encoder(encoding))
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            encoder = self._encoder(encoding)
+            response.set_data(encoder.compress(data) + encoder.finish())
+        response.headers['Content-Encoding'] = encoding
+        # Сжатое представление не совпадает побайтно с исходным: ETag становится слабым
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    def _encoder(self, encoding: str):
+        if encoding == 'br':
+            return _BrotliEncoder(self.brotli_quality)
+        return _GzipEncoder(self.gzip_level)
+
+    def _stream(self, chunks: Iterable, encoder) -> Iterator[bytes]:
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                data = encoder.compress(chunk) + encoder.flush()
+                if data:
+                    yield data
+            yield encoder.finish()
+        finally:
+            # Клиент отключился: исходный генератор тоже закрывается
+            close = getattr(chunks, 'close', None)
+            if callable(close):
+                close()
+
+
+compression = Compression()
@@ -0,0 +1,47 @@
+import os
+import zipfile
+from typing import BinaryIO
+
+# Ограничения распакованного DOCX (защита от zip-бомб)
+DOCX_MAX_UNCOMPRESSED = int(os.getenv('DOCX_MAX_UNCOMPRESSED', 100 * 1024 * 1024))
+DOCX_MAX_RATIO = int(os.getenv('DOCX_MAX_RATIO', 100))
+DOCX_MAX_ENTRIES = int(os.getenv('DOCX_MAX_ENTRIES', 2000))
+
+# Маленькие части (стили, настройки) сжимаются очень хорошо, поэтому
+# коэффициент сжатия проверяется только у крупных частей
+_RATIO_CHECK_MIN_SIZE = 1024 * 1024
+
+
+class DocxValidationError(ValueError):
+    """Файл не является допустимым DOCX документом"""
+
+
+def validate_docx_stream(stream: BinaryIO) -> None:
+    """Проверка DOCX без распаковки: структура архива и размеры частей
+
+    Используются размеры из центрального каталога архива. zipfile не
+    распаковывает часть больше заявленного размера, поэтому проверка
+    заявленных размеров ограничивает и фактический объем распаковки.
+    Поток возвращается в начало.
+    """
+    try:
+        stream.seek(0)
+        with zipfile.ZipFile(stream) as archive:
+            entries = archive.infolist()
+            if len(entries) > DOCX_MAX_ENTRIES:
+                raise DocxValidationError("Слишком много частей в DOCX архиве")
+            if 'word/document.xml' not in archive.NameToInfo:
+                raise DocxValidationError("Файл не является DOCX документом")
+
+            total = 0
+            for entry in entries:
+                total += entry.file_size
+                if total > DOCX_MAX_UNCOMPRESSED:
+                    raise DocxValidationError("Распакованный размер DOCX превышает допустимый")
+                if (entry.file_size > _RATIO_CHECK_MIN_SIZE
+                        and entry.file_size > DOCX_MAX_RATIO * max(entry.compress_size, 1)):
+                    raise DocxValidationError("Подозрительно высокая степень сжатия DOCX")
+    except zipfile.BadZipFile:
+        raise DocxValidationError("Файл поврежден или не является DOCX документом")
+    finally:
+        stream.seek(0)
@@ -0,0 +1,107 @@
+import os
+import re
+import time
+from typing import Dict, List, Any, Iterable, Optional, Tuple
+
+# Типы публикаций PubMed (pubtype из esummary) и их вес, от сильных доказательств к слабым
+STUDY_TYPES: List[Tuple[str, float, Tuple[str, ...]]] = [
+    ('Meta-analysis', 1.0, ('meta-analysis',)),
+    ('Systematic Review', 0.9, ('systematic review',)),
+    ('RCT', 0.8, ('randomized controlled trial',)),
+    ('Clinical Trial', 0.6, ('clinical trial', 'clinical trial, phase iii', 'clinical trial, phase iv',
+                             'clinical trial, phase ii', 'controlled clinical trial', 'pragmatic clinical trial')),
+    ('Study', 0.3, ()),
+]
+STUDY_TYPE_WEIGHTS = {label: weight for label, weight, _ in STUDY_TYPES}
+
+# Запасной вариант - заголовок; только целые слова ("rct", но не "direct")
+_TITLE_RULES = [
+    ('Meta-analysis', re.compile(r'\bmeta[\s-]?analys[ie]s\b')),
+    ('Systematic Review', re.compile(r'\bsystematic\s+review\b')),
+    ('RCT', re.compile(r'\brandomi[sz]ed\b.*\btrials?\b|\brcts?\b')),
+    ('Clinical Trial', re.compile(r'\bclinical\s+trials?\b')),
+]
+
+# Журналы с наибольшим весом доказательств
+_TOP_JOURNALS = re.compile(
+    r'\b(?:lancet|new england journal of medicine|n engl j med|jama|bmj|british medical journal|'
+    r'cochrane database|annals of internal medicine|nature medicine|circulation|'
+    r'european heart journal|diabetes care|journal of clinical oncology)\b'
+)
+_YEAR = re.compile(r'\b(19|20)\d{2}\b')
+_PHASE = re.compile(r'phase\s*(\d)')
+
+# Фаза (максимальная из указанных) и статус клинического исследования
+TRIAL_PHASE_WEIGHTS = {4: 1.0, 3: 0.9, 2: 0.6, 1: 0.3}
+TRIAL_STATUS_WEIGHTS = {
+    'completed': 1.0, 'active, not recruiting': 0.7, 'recruiting': 0.6,
+    'enrolling by invitation': 0.6, 'not yet recruiting': 0.4, 'unknown': 0.3,
+    'suspended': 0.2, 'terminated': 0.2, 'withdrawn': 0.0,
+}
+
+# Оригинальные препараты (NDA/BLA) важнее дженериков (ANDA)
+FDA_APPLICATION_WEIGHTS = {'NDA': 1.0, 'BLA': 1.0, 'ANDA': 0.5}
+
+RECENCY_YEARS = 20
+
+
+def study_type(title: str, publication_types: Iterable[str] = ()) -> str:
+    """Тип исследования по типам публикации PubMed, а если их нет - по заголовку"""
+    types = {str(value).lower() for value in publication_types}
+    for label, _, names in STUDY_TYPES:
+        if types.intersection(names):
+            return label
+
+    title_lower = (title or '').lower()
+    for label, pattern in _TITLE_RULES:
+        if pattern.search(title_lower):
+            return label
+    return 'Study'
+
+
+class EvidenceRanker:
+    def __init__(self, top_k: Optional[int] = None):
+        """Оценка силы доказательств и отбор лучших результатов каждого источника"""
+        self.top_k = top_k if top_k is not None else int(os.getenv('EVIDENCE_TOP_K', 5))
+
+    def rank(self, results: Dict[str, Any]) -> Dict[str, Any]:
+        """Копия результатов, где списки источников отсортированы по evidenceScore и обрезаны до top_k"""
+        current_year = time.gmtime().tm_year
+        scorers = {
+            'pubmed': lambda item: self.score_article(item, current_year),
+            'clinical_trials': self.score_trial,
+            'fda': self.score_application,
+        }
+        ranked = dict(results)
+        for source, score in scorers.items():
+            items = results.get(source)
+            if not isinstance(items, list):
+                continue
+            scored = [{**item, 'evidenceScore': score(item)} for item in items]
+            # Сортировка устойчивая: при равной оценке сохраняется порядок источника
+            scored.sort(key=lambda item: item['evidenceScore'], reverse=True)
+            ranked[source] = scored[:self.top_k] if self.top_k > 0 else scored
+        return ranked
+
+    def score_article(self, article: Dict[str, Any], current_year: int) -> float:
+        """Статья PubMed: тип публикации, свежесть и журнал"""
+        type_weight = STUDY_TYPE_WEIGHTS.get(article.get('type'), STUDY_TYPE_WEIGHTS['Study'])
+        match = _YEAR.search(str(article.get('year') or ''))
+        recency = max(0.0, 1 - (current_year - int(match.group())) / RECENCY_YEARS) if match else 0.0
+        journal = 1.0 if _TOP_JOURNALS.search((article.get('journal') or '').lower()) else 0.0
+        return round(0.6 * type_weight + 0.25 * recency + 0.15 * journal, 3)
+
+    def score_trial(self, trial: Dict[str, Any]) -> float:
+        """Клиническое исследование: фаза и статус"""
+        phases = [int(phase) for phase in _PHASE.findall((trial.get('phase') or '').lower())]
+        phase_weight = TRIAL_PHASE_WEIGHTS.get(max(phases), 0.2) if phases else 0.2
+        status_weight = TRIAL_STATUS_WEIGHTS.get((trial.get('status') or '').lower(), 0.3)
+        return round(0.7 * phase_weight + 0.3 * status_weight, 3)
+
+    def score_application(self, application: Dict[str, Any]) -> float:
+        """Заявка FDA: оригинальный препарат или дженерик"""
+        application_number = (application.get('applicationNumber') or '').upper()
+        for prefix, weight in FDA_APPLICATION_WEIGHTS.items():
+            if application_number.startswith(prefix):
+                return weight
+        return 0.5
@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import zipfile
+import threading
+from typing import Dict, List, Any, Optional, Iterable, Iterator, Tuple
+from sqlalchemy import insert, func
+from src.models.user import db
+from src.models.fda_mirror import FdaApplication
+from src.services.inn_index import get_inn_index
+
+FDA_RESULT_LIMIT = 3
+_INSERT_BATCH = 5000
+
+
+def application_result(application_number: str, sponsor_name: str) -> Dict[str, Any]:
+    """Результат поиска FDA в формате ответа API"""
+    return {
+        'applicationNumber': application_number,
+        'sponsorName': sponsor_name,
+        'url': f"https://www.accessdata.fda.gov/scripts/cder/daf/index.cfm?event=overview.process&ApplNo={application_number}"
+    }
+
+
+def read_dump(path: str) -> List[Dict[str, Any]]:
+    """Заявки из выгрузки openFDA drugsfda (JSON или zip архив с JSON, как на open.fda.gov)"""
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            names = [name for name in archive.namelist() if name.lower().endswith('.json')]
+            if not names:
+                raise ValueError("В архиве нет JSON файла выгрузки")
+            with archive.open(names[0]) as dump:
+                data = json.load(dump)
+    else:
+        with open(path, encoding='utf-8') as dump:
+            data = json.load(dump)
+
+    results = data.get('results') if isinstance(data, dict) else None
+    if not isinstance(results, list):
+        raise ValueError("Файл не похож на выгрузку openFDA drugsfda: нет массива results")
+    return results
+
+
+def dump_rows(applications: Iterable[Dict[str, Any]]) -> Iterator[Tuple[str, str, str, str]]:
+    """Строки зеркала: (нормализованное действующее вещество, номер заявки, спонсор, торговое название)"""
+    inn_index = get_inn_index()
+    seen = set()
+    for application in applications:
+        application_number = application.get('application_number') or ''
+        if not application_number:
+            continue
+        sponsor_name = application.get('sponsor_name') or ''
+        for product in application.get('products') or []:
+            for ingredient in product.get('active_ingredients') or []:
+                key = inn_index.normalize(ingredient.get('name') or '')
+                if not key or (key, application_number) in seen:
+                    continue
+                seen.add((key, application_number))
+                yield key, application_number, sponsor_name, product.get('brand_name') or ''
+
+
+class FdaMirror:
+    def __init__(self, app=None):
+        """Локальное зеркало openFDA drugsfda: таблица SQLite и словарь в памяти
+
+        Индекс по действующему веществу загружается из SQLite при первом
+        обращении и перечитывается, если выгрузку импортировали заново
+        (проверка не чаще раза в FDA_MIRROR_REFRESH секунд).
+        """
+        self.app = None
+        self.refresh_interval = float(os.getenv('FDA_MIRROR_REFRESH', 300))
+        self._index: Optional[Dict[str, List[Dict[str, Any]]]] = None
+        self._version: Optional[float] = None
+        self._checked_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0}
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Привязка к приложению Flask"""
+        self.app = app
+        app.extensions['fda_mirror'] = self
+
+    def import_dump(self, path: str) -> int:
+        """Замена содержимого зеркала данными выгрузки; возвращает число строк"""
+        rows = dump_rows(read_dump(path))
+        imported_at = time.time()
+        count = 0
+        with self.app.app_context():
+            FdaApplication.query.delete()
+            batch = []
+            for ingredient, application_number, sponsor_name, brand_name in rows:
+                batch.append({
+                    'ingredient': ingredient[:255], 'application_number': application_number,
+                    'sponsor_name': sponsor_name[:255], 'brand_name': brand_name[:255],
+                    'imported_at': imported_at
+                })
+                if len(batch) >= _INSERT_BATCH:
+                    db.session.execute(insert(FdaApplication), batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                db.session.execute(insert(FdaApplication), batch)
+                count += len(batch)
+            # Старые данные заменяются одной транзакцией
+            db.session.commit()
+
+        with self._lock:
+            self._checked_at = None
+        return count
+
+    def lookup(self, drug_name: str) -> Optional[List[Dict[str, Any]]]:
+        """Заявки FDA для препарата; None, если зеркало пусто или вещество не найдено"""
+        index = self._get_index()
+        if not index:
+            return None
+
+        results = index.get(get_inn_index().normalize(drug_name))
+        with self._lock:
+            self._stats['hits' if results else 'misses'] += 1
+        return [dict(result) for result in results] if results else None
+
+    def stats(self) -> Dict[str, Any]:
+        """Состояние зеркала и счетчики попаданий"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['ingredients'] = len(self._index) if self._index else 0
+            stats['imported_at'] = self._version
+        return stats
+
+    def _get_index(self) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+        if self.app is None:
+            return None
+        if self._fresh():
+            return self._index
+
+        with self._lock:
+            if self._fresh():
+                return self._index
+            try:
+                with self.app.app_context():
+                    version = db.session.query(func.max(FdaApplication.imported_at)).scalar()
+                    if version != self._version:
+                        self._index = self._load() if version is not None else None
+                        self._version = version
+            except Exception as e:
+                print(f"Ошибка при чтении зеркала FDA: {str(e)}")
+            self._checked_at = time.monotonic()
+            return self._index
+
+    def _fresh(self) -> bool:
+        return self._checked_at is not None and time.monotonic() - self._checked_at < self.refresh_interval
+
+    def _load(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Словарь вещество -> заявки; оригинальные NDA/BLA перед дженериками ANDA"""
+        rows = db.session.query(
+            FdaApplication.ingredient, FdaApplication.application_number, FdaApplication.sponsor_name
+        ).all()
+        rows.sort(key=lambda row: (row[0], row[1].startswith('ANDA'), row[1]))
+
+        index: Dict[str, List[Dict[str, Any]]] = {}
+        for ingredient, application_number, sponsor_name in rows:
+            results = index.setdefault(ingredient, [])
+            if len(results) < FDA_RESULT_LIMIT:
+                results.append(application_result(application_number, sponsor_name))
+        return index
+
+
+fda_mirror = FdaMirror()
@@ -0,0 +1,234 @@
+import os
+import time
+import random
+import threading
+import requests
+from contextlib import contextmanager
+from requests.adapters import HTTPAdapter
+from typing import Dict, Any, Optional, Iterator
+from urllib.parse import urlsplit
+from src.services.metrics import metrics
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_priority = threading.local()
+
+
+@contextmanager
+def background_requests() -> Iterator[None]:
+    """Запросы текущего потока - фоновые: они уступают слоты ограничителя интерактивным"""
+    previous = getattr(_priority, 'background', False)
+    _priority.background = True
+    try:
+        yield
+    finally:
+        _priority.background = previous
+
+
+def is_background() -> bool:
+    return getattr(_priority, 'background', False)
+
+
+class RateLimiter:
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        """Token bucket: не более ``rate`` запросов в секунду"""
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, deadline: Optional[float] = None, background: bool = False) -> None:
+        """Ожидание свободного слота; бросает Timeout, если слот не успеть получить до дедлайна
+
+        Фоновый запрос не резервирует слот заранее и получает его, только
+        когда заполнена хотя бы половина ведра: интерактивным запросам всегда
+        остается запас, а пока они ждут (баланс отрицательный), фоновые ждут дольше.
+        """
+        if background:
+            return self._acquire_background(deadline)
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+            wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                raise requests.Timeout("Лимит запросов к источнику не позволяет уложиться в дедлайн")
+            # Отрицательный баланс резервирует слот за текущим потоком
+            self.tokens -= 1
+
+        if wait > 0:
+            time.sleep(wait)
+
+    def _acquire_background(self, deadline: Optional[float]) -> None:
+        # При ведре меньше одного слота (лимит поделен между процессами) - только полное ведро
+        threshold = min(self.capacity, max(1.0, self.capacity / 2))
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= threshold:
+                    self.tokens -= 1
+                    return
+                wait = (threshold - self.tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                raise requests.Timeout("Лимит запросов к источнику не позволяет уложиться в дедлайн")
+            time.sleep(wait)
+
+
+class HttpClient:
+    def __init__(self):
+        """Пул keep-alive сессий по хостам с повторами и ограничением частоты"""
+        self.pool_maxsize = int(os.getenv('HTTP_POOL_MAXSIZE', 16))
+        self.max_retries = int(os.getenv('HTTP_MAX_RETRIES', 3))
+        self.backoff_base = float(os.getenv('HTTP_BACKOFF_BASE', 0.5))
+        self.backoff_max = float(os.getenv('HTTP_BACKOFF_MAX', 8))
+        self.rate_limits = self._default_rate_limits()
+        # Лимиты источников общие для всех процессов сервера: каждый воркер gunicorn
+        # получает свою долю (GUNICORN_WORKERS выставляет gunicorn.conf.py)
+        self.rate_limit_processes = max(1, int(os.getenv('HTTP_RATE_LIMIT_PROCESSES',
+                                                         os.getenv('GUNICORN_WORKERS', 1))))
+
+        self._sessions: Dict[str, requests.Session] = {}
+        self._limiters: Dict[str, RateLimiter] = {}
+        self._lock = threading.Lock()
+
+    def get(self, url: str, params: Optional[Dict[str, Any]] = None,
+            timeout: Optional[float] = None, deadline: Optional[float] = None) -> requests.Response:
+        """GET через общий пул с экспоненциальной задержкой при 429/5xx"""
+        host = urlsplit(url).netloc
+        try:
+            response = self._get_with_retries(host, url, params, timeout, deadline)
+        except requests.Timeout:
+            metrics.upstream_errors.inc(host, 'timeout')
+            raise
+        except requests.ConnectionError:
+            metrics.upstream_errors.inc(host, 'connection')
+            raise
+
+        if response.status_code in RETRY_STATUSES:
+            metrics.upstream_errors.inc(host, f'http_{response.status_code}')
+        return response
+
+    def _get_with_retries(self, host: str, url: str, params: Optional[Dict[str, Any]],
+                          timeout: Optional[float], deadline: Optional[float]) -> requests.Response:
+        session = self._session_for(host)
+        limiter = self._limiter_for(host)
+
+        attempt = 0
+        while True:
+            if limiter is not None:
+                limiter.acquire(deadline, background=is_background())
+
+            try:
+                response = session.get(url, params=params, timeout=self._timeout(timeout, deadline))
+            except requests.ConnectionError:
+                if attempt >= self.max_retries:
+                    raise
+                response = None
+
+            if response is not None and (response.status_code not in RETRY_STATUSES
+                                         or attempt >= self.max_retries):
+                return response
+
+            delay = self._backoff(attempt, response)
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                if response is not None:
+                    return response
+                raise requests.Timeout("Истек общий дедлайн поиска")
+            time.sleep(delay)
+            attempt += 1
+            metrics.upstream_retries.inc(host)
+
+    def close(self) -> None:
+        """Закрытие всех сессий"""
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+    def _session_for(self, host: str) -> requests.Session:
+        """Сессия с собственным пулом соединений для хоста"""
+        session = self._sessions.get(host)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(host)
+                if session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize, max_retries=0)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    session.headers.update({'Accept': 'application/json', 'Connection': 'keep-alive'})
+                    self._sessions[host] = session
+        return session
+
+    def _limiter_for(self, host: str) -> Optional[RateLimiter]:
+        """Ограничитель частоты для хоста (если для него задан лимит)
+
+        Частота и размер ведра делятся на число процессов, поэтому суммарная
+        частота запросов всех воркеров не превышает лимит источника.
+        """
+        rate = self.rate_limits.get(host)
+        if not rate:
+            return None
+        limiter = self._limiters.get(host)
+        if limiter is None:
+            share = self.rate_limit_processes
+            with self._lock:
+                limiter = self._limiters.setdefault(
+                    host, RateLimiter(rate / share, burst=max(rate, 1.0) / share)
+                )
+        return limiter
+
+    def _backoff(self, attempt: int, response: Optional[requests.Response]) -> float:
+        """Задержка перед повтором: Retry-After или экспонента с полным джиттером"""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                return min(float(retry_after), self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _timeout(self, timeout: Optional[float], deadline: Optional[float]) -> Optional[float]:
+        """Таймаут отдельного запроса, не выходящий за общий дедлайн"""
+        if deadline is None:
+            return timeout
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise requests.Timeout("Истек общий дедлайн поиска")
+        return min(timeout, remaining) if timeout is not None else remaining
+
+    def _default_rate_limits(self) -> Dict[str, float]:
+        """Лимиты запросов в секунду по хостам
+
+        NCBI E-utilities разрешает 3 запроса в секунду без ключа и 10 с ключом.
+        """
+        ncbi_rate = 10.0 if get_api_key('PUBMED_API_KEY') else 3.0
+        return {
+            'eutils.ncbi.nlm.nih.gov': float(os.getenv('PUBMED_RATE_LIMIT', ncbi_rate)),
+            'api.fda.gov': float(os.getenv('FDA_RATE_LIMIT', 4)),
+            'clinicaltrials.gov': float(os.getenv('CLINICAL_TRIALS_RATE_LIMIT', 10)),
+        }
+
+
+def get_api_key(name: str) -> Optional[str]:
+    """Ключ API из окружения; шаблонные значения из .env.example игнорируются"""
+    value = os.getenv(name, '').strip()
+    if not value or value.startswith('your_'):
+        return None
+    return value
+
+
+_http_client = None
+_http_client_lock = threading.Lock()
+
+
+def get_http_client() -> HttpClient:
+    """Общий для процесса HTTP клиент"""
+    global _http_client
+    if _http_client is None:
+        with _http_client_lock:
+            if _http_client is None:
+                _http_client = HttpClient()
+    return _http_client
@@ -0,0 +1,229 @@
+import os
+import re
+import csv
+import json
+import threading
+import unicodedata
+from typing import Dict, List, Any, Optional, Iterable
+
+DATASET_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'inn_synonyms.json')
+
+# Соли и формы, не влияющие на результаты поиска (английские и русские)
+SALT_WORDS = frozenset((
+    'hydrochloride', 'hcl', 'sodium', 'potassium', 'calcium', 'magnesium', 'sulfate', 'sulphate',
+    'maleate', 'mesylate', 'besylate', 'citrate', 'tartrate', 'phosphate', 'acetate', 'bromide',
+    'гидрохлорид', 'натрия', 'калия', 'кальция', 'магния', 'сульфат', 'малеат', 'мезилат',
+    'безилат', 'цитрат', 'тартрат', 'фосфат', 'ацетат', 'бромид',
+))
+
+_TRANSLIT = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh', 'з': 'z',
+    'и': 'i', 'й': 'i', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r',
+    'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'c', 'ч': 'ch', 'ш': 'sh', 'щ': 'shch',
+    'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+}
+
+# Дозировки и формы выпуска в свободном тексте модели: "500 мг", "10mg/ml", "таб."
+_DOSAGE = re.compile(r'\b\d+(?:[.,]\d+)?\s*(?:mg|mcg|µg|g|ml|iu|ме|мг|мкг|г|мл|%)(?:/\S+)?', re.IGNORECASE)
+_PARENTHESES = re.compile(r'\(([^)]*)\)')
+_NON_WORD = re.compile(r'[^\w\s/-]+')
+_CYRILLIC = re.compile(r'[а-яё]')
+# Разделители компонентов комбинированного препарата: "амоксициллин + клавулановая кислота"
+_COMBINATION = re.compile(r'[+/]')
+
+# Приведение английского и транслитерированного написания к общему "скелету"
+_SKELETON_RULES = [
+    (re.compile(r'ph'), 'f'), (re.compile(r'th'), 't'), (re.compile(r'kh|ch'), 'h'),
+    (re.compile(r'x'), 'ks'), (re.compile(r'qu'), 'kv'), (re.compile(r'c(?=[eiy])'), 's'),
+    (re.compile(r'c'), 'k'), (re.compile(r'[yj]'), 'i'), (re.compile(r'w'), 'v'),
+    (re.compile(r'z'), 's'), (re.compile(r'ae|oe'), 'e'), (re.compile(r'(.)\1+'), r'\1'),
+    (re.compile(r'e\b'), ''),
+]
+
+
+def transliterate(text: str) -> str:
+    """Транслитерация кириллицы латиницей"""
+    return ''.join(_TRANSLIT.get(char, char) for char in text)
+
+
+def skeleton(name: str) -> str:
+    """Упрощенное написание для нечеткого сравнения (метформин ~ metformin, амлодипин ~ amlodipine)"""
+    value = transliterate(name)
+    for pattern, replacement in _SKELETON_RULES:
+        value = pattern.sub(replacement, value)
+    return value
+
+
+def clean_name(name: str) -> str:
+    """Нижний регистр, без дозировок, скобок, пунктуации и лишних пробелов"""
+    value = unicodedata.normalize('NFC', str(name or '')).lower().replace('ё', 'е')
+    value = _PARENTHESES.sub(' ', value)
+    value = _DOSAGE.sub(' ', value)
+    value = _NON_WORD.sub(' ', value)
+    return ' '.join(value.split())
+
+
+def strip_salts(name: str) -> str:
+    """Название без слов-солей (если после них что-то остается)
+
+    Только кандидат для поиска в словаре: "calcium gluconate" без солей -
+    это "gluconate", поэтому для неизвестных препаратов результат не используется.
+    """
+    tokens = [token for token in name.split() if token not in SALT_WORDS]
+    return ' '.join(tokens) if tokens else name
+
+
+def split_combination(name: str) -> List[str]:
+    """Очищенные названия компонентов комбинированного препарата (один элемент - не комбинация)"""
+    value = _DOSAGE.sub(' ', _PARENTHESES.sub(' ', str(name or '').lower()))
+    components = [clean_name(part) for part in _COMBINATION.split(value)]
+    return [component for component in components if component]
+
+
+class InnIndex:
+    def __init__(self, paths: Iterable[str] = ()):
+        """Индекс МНН: хэш-таблицы синонимов и их упрощенных написаний
+
+        Точные синонимы (английские, русские, торговые названия) ищутся в
+        словаре, для остального используется поиск по самому длинному
+        префиксу из слов и по "скелету" транслитерированного названия.
+        """
+        self._names: Dict[str, str] = {}
+        self._skeletons: Dict[str, str] = {}
+        self._max_tokens = 1
+        for path in paths:
+            self.load(path)
+
+    def __len__(self) -> int:
+        return len(set(self._names.values()))
+
+    def load(self, path: str) -> None:
+        """Загрузка словаря: JSON {"МНН": ["синоним", ...]} или CSV/TSV строки "МНН,синоним" """
+        if path.lower().endswith('.json'):
+            with open(path, encoding='utf-8') as dataset:
+                for inn, synonyms in json.load(dataset).items():
+                    self.add(inn, synonyms)
+            return
+
+        delimiter = '\t' if path.lower().endswith('.tsv') else ','
+        with open(path, encoding='utf-8', newline='') as dataset:
+            for row in csv.reader(dataset, delimiter=delimiter):
+                if len(row) >= 2 and row[0].strip() and not row[0].startswith('#'):
+                    self.add(row[0], row[1:])
+
+    def add(self, inn: str, synonyms: Iterable[str] = ()) -> None:
+        """Добавление МНН и его синонимов; ранее загруженные записи имеют приоритет"""
+        canonical = clean_name(inn)
+        if not canonical:
+            return
+        for synonym in (inn, *synonyms):
+            name = clean_name(synonym)
+            if not name:
+                continue
+            self._names.setdefault(name, canonical)
+            self._skeletons.setdefault(skeleton(name), canonical)
+            self._max_tokens = max(self._max_tokens, len(name.split()))
+
+    def canonical(self, name: str) -> Optional[str]:
+        """Каноническое МНН (английское) или None, если название не найдено"""
+        components = split_combination(name)
+        if len(components) > 1:
+            return self._combination(components)
+
+        cleaned = clean_name(name)
+        if not cleaned:
+            return None
+        # Соль отбрасывается, только если без нее название есть в словаре
+        for candidate in (cleaned, strip_salts(cleaned)):
+            inn = self._lookup(candidate)
+            if inn:
+                return inn
+        # Название в скобках: "Глюкофаж (метформин)", "Аугментин (амоксициллин + клавуланат)"
+        for inner in _PARENTHESES.findall(str(name).lower()):
+            inn = self.canonical(inner)
+            if inn:
+                return inn
+        return None
+
+    def normalize(self, name: str) -> str:
+        """Ключ препарата: каноническое МНН, а для неизвестных - очищенное название"""
+        inn = self.canonical(name)
+        if inn:
+            return inn
+        components = split_combination(name)
+        if len(components) > 1:
+            return ' + '.join(sorted(components))
+        return clean_name(name)
+
+    def resolve_drug(self, drug: Dict[str, Any]) -> Optional[str]:
+        """Каноническое МНН препарата по любому из полей innEnglish, name, innRussian
+
+        Поле с комбинацией проверяется первым: модель нередко указывает в
+        innEnglish только первое действующее вещество комбинированного препарата.
+        """
+        fields = sorted(('innEnglish', 'name', 'innRussian'),
+                        key=lambda field: len(split_combination(drug.get(field) or '')) < 2)
+        for field in fields:
+            inn = self.canonical(drug.get(field) or '')
+            if inn:
+                return inn
+        return None
+
+    def annotate(self, drug: Dict[str, Any]) -> Dict[str, Any]:
+        """Копия препарата с полем canonicalInn (пустая строка, если МНН не найдено)"""
+        inn = self.resolve_drug(drug)
+        if inn is None:
+            english = drug.get('innEnglish') or ''
+            inn = self.normalize(english) if english and not _CYRILLIC.search(english.lower()) else ''
+        return {**drug, 'canonicalInn': inn}
+
+    def _combination(self, components: List[str]) -> Optional[str]:
+        """МНН комбинации: компоненты через " + " в алфавитном порядке
+
+        Каждый компонент ищется отдельно, поэтому комбинация не сводится к
+        первому действующему веществу; None, если не найден ни один компонент.
+        """
+        inns = [self.canonical(component) for component in components]
+        if not any(inns):
+            return None
+        return ' + '.join(sorted({inn or component for inn, component in zip(inns, components)}))
+
+    def _lookup(self, name: str) -> Optional[str]:
+        if not name:
+            return None
+        inn = self._names.get(name)
+        if inn:
+            return inn
+
+        # Самый длинный префикс из слов: "metformin extended release" -> metformin
+        tokens = name.split()
+        for length in range(min(len(tokens), self._max_tokens), 0, -1):
+            prefix = ' '.join(tokens[:length])
+            inn = self._names.get(prefix) or self._skeletons.get(skeleton(prefix))
+            if inn:
+                return inn
+
+        # Русский родительный падеж: "метформина гидрохлорид"
+        if _CYRILLIC.search(tokens[0]) and tokens[0][-1] in 'аяы':
+            return self._skeletons.get(skeleton(tokens[0][:-1]))
+        return None
+
+
+_inn_index = None
+_inn_index_lock = threading.Lock()
+
+
+def get_inn_index() -> InnIndex:
+    """Общий для процесса индекс: встроенный словарь и, если задан, INN_DATASET_PATH"""
+    global _inn_index
+    if _inn_index is None:
+        with _inn_index_lock:
+            if _inn_index is None:
+                paths: List[str] = []
+                # Пользовательский словарь загружается первым и имеет приоритет
+                extra = os.getenv('INN_DATASET_PATH', '').strip()
+                if extra:
+                    paths.extend(path for path in extra.split(os.pathsep) if path)
+                paths.append(DATASET_PATH)
+                _inn_index = InnIndex(paths)
+    return _inn_index
@@ -0,0 +1,278 @@
+import io
+import os
+import json
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional
+from sqlalchemy import inspect, or_, text as sql
+from src.models.user import db
+from src.models.job import AnalysisJob
+from src.services.registry import services
+from src.services.research_prefetch import research_prefetch
+from src.services.metrics import trace, summarize
+
+DAY = 24 * 60 * 60
+
+TERMINAL_STATUSES = ('done', 'failed')
+
+# Столбцы, добавленные после создания таблицы задач
+MIGRATED_COLUMNS = {'revision_of': 'INTEGER', 'prefetch': 'VARCHAR(16)', 'seen_at': 'FLOAT'}
+# Не чаще одной записи отметки активности клиента в базу за интервал
+TOUCH_INTERVAL = 5.0
+
+
+class JobQueue:
+    def __init__(self, app=None):
+        """Очередь фоновых задач анализа протоколов с состоянием в SQLite"""
+        self.app = None
+        self.workers = int(os.getenv('JOB_WORKERS', 2))
+        self.retention = float(os.getenv('JOB_RETENTION', 7 * DAY))
+        # Выполняемые задачи отмечаются каждые heartbeat секунд; задача без отметки
+        # дольше stale_after секунд считается брошенной (воркер завершился) и возвращается в очередь
+        self.heartbeat = float(os.getenv('JOB_HEARTBEAT', 10))
+        self.stale_after = float(os.getenv('JOB_STALE_AFTER', 60))
+        self._executor = None
+        self._lock = threading.Lock()
+        self._touched: Dict[str, float] = {}
+        # Задачи, выполняемые и ожидающие в пуле этого процесса
+        self._running = set()
+        self._submitted = set()
+        self._maintainer = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, dispatch: bool = True):
+        """Привязка к приложению и возврат в очередь брошенных задач
+
+        При ``dispatch=False`` задачи только возвращаются в очередь в базе, а
+        выполнять их начинает позже ``start()`` в рабочем процессе (под
+        gunicorn - хук post_worker_init).
+        """
+        self.app = app
+        app.extensions['job_queue'] = self
+        self._migrate()
+        self.recover()
+        if dispatch:
+            self.start()
+
+    def start(self) -> None:
+        """Запуск задач из очереди и периодического обслуживания в этом процессе
+
+        Фоновый поток отмечает выполняемые здесь задачи, возвращает в
+        очередь задачи завершившихся процессов и запускает ожидающие.
+        """
+        with self._lock:
+            if self._maintainer is not None:
+                return
+            self._maintainer = threading.Thread(target=self._maintain, name='job-maintainer', daemon=True)
+        self.dispatch()
+        self._maintainer.start()
+
+    def submit(self, filename: str, payload: bytes, refresh: bool = False,
+               revision_of: Optional[int] = None) -> Dict[str, Any]:
+        """Создание задачи и постановка ее в очередь (``revision_of`` - см. ``ProtocolAnalyzer``)"""
+        now = time.time()
+        with self.app.app_context():
+            job = AnalysisJob(
+                id=uuid.uuid4().hex, status='queued', stage='queued', progress=0,
+                filename=filename, refresh=refresh, revision_of=revision_of, payload=payload,
+                created_at=now, updated_at=now
+            )
+            db.session.add(job)
+            db.session.commit()
+            job_dict = job.to_dict()
+            self._purge(now)
+
+        self._enqueue(job_dict['id'])
+        return job_dict
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Текущее состояние задачи"""
+        with self.app.app_context():
+            job = db.session.get(AnalysisJob, job_id)
+            return job.to_dict() if job else None
+
+    def touch(self, job_id: str) -> None:
+        """Отметка активности клиента: пока клиент обращается к задаче, предзагрузка продолжается"""
+        now = time.time()
+        if now - self._touched.get(job_id, 0) < TOUCH_INTERVAL:
+            return
+        self._touched[job_id] = now
+        with self.app.app_context():
+            AnalysisJob.query.filter(
+                AnalysisJob.id == job_id,
+                or_(AnalysisJob.seen_at.is_(None), AnalysisJob.seen_at < now - TOUCH_INTERVAL)
+            ).update({'seen_at': now}, synchronize_session=False)
+            db.session.commit()
+
+    def recover(self) -> int:
+        """Возврат брошенных задач в состояние queued (только база, без запуска)
+
+        Брошенной считается выполняемая задача без отметки дольше
+        ``stale_after`` секунд: ее процесс завершился (перезапуск, таймаут
+        или max_requests воркера gunicorn). Задачи, которые сейчас выполняют
+        другие живые процессы, не трогаются. Возвращает число задач.
+        """
+        now = time.time()
+        with self.app.app_context():
+            stale = AnalysisJob.query.filter(
+                AnalysisJob.status == 'running', AnalysisJob.updated_at < now - self.stale_after
+            ).all()
+            for job in stale:
+                if job.payload is None:
+                    job.status, job.stage, job.error = 'failed', 'failed', 'Задача прервана перезапуском сервера'
+                else:
+                    job.status, job.stage, job.progress, job.partial_drugs = 'queued', 'queued', 0, None
+                job.updated_at = now
+            db.session.commit()
+            return len(stale)
+
+    def dispatch(self) -> None:
+        """Запуск задач из очереди в этом процессе
+
+        Задачу захватывает атомарно только один исполнитель, поэтому вызов из
+        нескольких воркеров gunicorn не приводит к повторному анализу.
+        """
+        with self.app.app_context():
+            queued = [job_id for job_id, in db.session.query(AnalysisJob.id).filter_by(status='queued')]
+
+        for job_id in queued:
+            self._enqueue(job_id)
+
+    def _enqueue(self, job_id: str) -> None:
+        with self._lock:
+            if job_id in self._submitted or job_id in self._running:
+                return
+            self._submitted.add(job_id)
+        self._get_executor().submit(self._run, job_id)
+
+    def _maintain(self) -> None:
+        """Периодическое обслуживание очереди (поток процесса-исполнителя)"""
+        while True:
+            time.sleep(self.heartbeat)
+            try:
+                self._beat()
+                self.recover()
+                self.dispatch()
+            except Exception as e:
+                print(f"Ошибка при обслуживании очереди задач: {str(e)}")
+
+    def _beat(self) -> None:
+        """Отметка задач, которые выполняются в этом процессе"""
+        with self._lock:
+            running = list(self._running)
+        if not running:
+            return
+        with self.app.app_context():
+            AnalysisJob.query.filter(
+                AnalysisJob.id.in_(running), AnalysisJob.status == 'running'
+            ).update({'updated_at': time.time()}, synchronize_session=False)
+            db.session.commit()
+
+    def _run(self, job_id: str) -> None:
+        """Выполнение задачи в рабочем потоке"""
+        with self._lock:
+            self._submitted.discard(job_id)
+            self._running.add(job_id)
+        try:
+            self._execute(job_id)
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+
+    def _execute(self, job_id: str) -> None:
+        with self.app.app_context():
+            # Атомарный захват задачи: ее не выполнят дважды
+            claimed = AnalysisJob.query.filter_by(id=job_id, status='queued').update(
+                {'status': 'running', 'stage': 'extracting', 'progress': 5, 'updated_at': time.time()}
+            )
+            db.session.commit()
+            if not claimed:
+                return
+            job = db.session.get(AnalysisJob, job_id)
+            payload, refresh, filename, revision_of = job.payload, job.refresh, job.filename, job.revision_of
+
+        partial_drugs = []
+        partial_lock = threading.Lock()
+        
+        def on_drug(drug):
+            # Препараты видны клиенту до завершения всего анализа
+            with partial_lock:
+                partial_drugs.append(drug)
+                self._update(job_id, partial_drugs=json.dumps(partial_drugs, ensure_ascii=False))
+
+        with trace() as spans:
+            try:
+                analyzer = services.get('protocol_analyzer')
+                result = analyzer.analyze_protocol(
+                    io.BytesIO(payload), refresh=refresh,
+                    progress=lambda stage, percent: self._update(job_id, stage=stage, progress=percent),
+                    on_drug=on_drug, filename=filename, revision_of=revision_of
+                )
+            except Exception as e:
+                result = {'success': False, 'error': str(e)}
+        # Длительности этапов (мс) сохраняются вместе с результатом задачи
+        result['timings'] = summarize(spans)
+
+        if result.get('success'):
+            self._update(job_id, status='done', stage='done', progress=100,
+                         result=json.dumps(result, ensure_ascii=False), payload=None)
+            # Исследования для препаратов запрашиваются в фоне, до первого обращения клиента
+            research_prefetch.schedule(job_id, result.get('drugs', []))
+        else:
+            self._update(job_id, status='failed', stage='failed',
+                         error=result.get('error', 'Неизвестная ошибка'), payload=None)
+
+    def _update(self, job_id: str, **fields) -> None:
+        """Сохранение изменений состояния задачи"""
+        with self.app.app_context():
+            job = db.session.get(AnalysisJob, job_id)
+            if job is None:
+                return
+            for name, value in fields.items():
+                setattr(job, name, value)
+            job.updated_at = time.time()
+            db.session.commit()
+
+    def _migrate(self) -> None:
+        """Добавление столбцов, появившихся после создания таблицы задач"""
+        with self.app.app_context():
+            columns = {column['name'] for column in inspect(db.engine).get_columns(AnalysisJob.__tablename__)}
+            for name, column_type in MIGRATED_COLUMNS.items():
+                if name not in columns:
+                    db.session.execute(sql(
+                        f"ALTER TABLE {AnalysisJob.__tablename__} ADD COLUMN {name} {column_type}"
+                    ))
+            db.session.commit()
+
+    def _purge(self, now: float) -> None:
+        """Удаление завершенных задач старше срока хранения"""
+        AnalysisJob.query.filter(
+            AnalysisJob.status.in_(TERMINAL_STATUSES),
+            AnalysisJob.updated_at < now - self.retention
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        self._touched.clear()
+
+    def _reset_after_fork(self) -> None:
+        # Потоки родителя в дочернем процессе не существуют
+        self._executor = None
+        self._lock = threading.Lock()
+        self._touched = {}
+        self._running = set()
+        self._submitted = set()
+        self._maintainer = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='job')
+        return self._executor
+
+
+job_queue = JobQueue()
+os.register_at_fork(after_in_child=job_queue._reset_after_fork)
@@ -0,0 +1,263 @@
+import re
+import json
+from typing import Dict, List, Any, Optional, Tuple
+
+DRUG_FIELDS = (
+    'id', 'name', 'innEnglish', 'innRussian', 'dosage', 'route',
+    'frequency', 'duration', 'indication', 'targetCondition'
+)
+
+_TRAILING_COMMA = re.compile(r',\s*([}\]])')
+# Начало JSON объекта: скобка, за которой (после пробелов) идет ключ в кавычках
+_OBJECT_START = re.compile(r'\{\s*"')
+
+
+class DrugStreamParser:
+    def __init__(self):
+        """Инкрементальный разбор JSON ответа модели
+
+        Текст подается частями по мере генерации. Как только в массиве
+        ``drugs`` верхнего объекта закрывается очередной объект препарата,
+        он разбирается и возвращается из ``feed``, не дожидаясь конца ответа.
+        Верхний объект начинается со скобки, за которой идет ключ в кавычках;
+        закрывшийся объект без ключа ``drugs`` (например, пример в пояснении
+        модели) пропускается, и поиск продолжается дальше.
+        """
+        self.text = ''
+        self.drugs: List[Dict[str, Any]] = []
+        self.start: Optional[int] = None
+        self.end: Optional[int] = None
+        # В ответе встретился хотя бы один JSON объект
+        self.found = False
+
+        self._pos = 0
+        self._stack: List[str] = []
+        self._keys: List[Optional[str]] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._drugs_depth: Optional[int] = None
+        self._drug_start: Optional[int] = None
+        self._has_drugs = False
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """Добавление очередной части ответа; возвращает завершенные препараты"""
+        self.text += chunk
+        completed = []
+        text = self.text
+
+        while self._pos < len(text) and self.end is None:
+            char = text[self._pos]
+            pos = self._pos
+            self._pos += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._stack and self._stack[-1] == '{':
+                        self._last_string = text[self._string_start:pos]
+                continue
+
+            if self.start is None:
+                # Все до начала JSON объекта (```json, скобки в тексте пояснения) пропускается
+                if char == '{':
+                    following = text[pos + 1:].lstrip()
+                    if not following:
+                        # Что идет за скобкой, станет известно со следующей частью ответа
+                        self._pos = pos
+                        break
+                    if following[0] == '"':
+                        self.start = pos
+                        self.found = True
+                        self._open('{')
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = pos + 1
+            elif char == ':':
+                if self._stack and self._stack[-1] == '{':
+                    self._keys[-1] = self._last_string
+                    if len(self._stack) == 1 and self._last_string == 'drugs':
+                        self._has_drugs = True
+            elif char == ',':
+                self._last_string = None
+            elif char in '{[':
+                if char == '{' and self._drugs_depth is not None and len(self._stack) == self._drugs_depth:
+                    self._drug_start = pos
+                parent_key = self._keys[-1] if self._keys else None
+                self._open(char)
+                if char == '[' and len(self._stack) == 2 and parent_key == 'drugs':
+                    self._drugs_depth = len(self._stack)
+            elif char in '}]':
+                if not self._stack:
+                    continue
+                self._stack.pop()
+                self._keys.pop()
+                if char == ']' and self._drugs_depth is not None and len(self._stack) < self._drugs_depth:
+                    self._drugs_depth = None
+                if (char == '}' and self._drug_start is not None
+                        and self._drugs_depth is not None and len(self._stack) == self._drugs_depth):
+                    drug = self._parse_drug(text[self._drug_start:pos + 1])
+                    self._drug_start = None
+                    if drug is not None:
+                        self.drugs.append(drug)
+                        completed.append(drug)
+                if not self._stack:
+                    if self._has_drugs:
+                        self.end = pos + 1
+                    else:
+                        self._restart()
+
+        return completed
+
+    def document(self) -> Optional[str]:
+        """Полный JSON объект верхнего уровня, если он уже закрыт"""
+        if self.start is None or self.end is None:
+            return None
+        return self.text[self.start:self.end]
+
+    def _restart(self) -> None:
+        # Закрытый объект - не ответ с препаратами: ищем следующий
+        self.start = None
+        self._stack = []
+        self._keys = []
+        self._last_string = None
+        self._drugs_depth = None
+        self._drug_start = None
+
+    def _open(self, char: str) -> None:
+        self._stack.append(char)
+        self._keys.append(None)
+        self._last_string = None
+
+    def _parse_drug(self, fragment: str) -> Optional[Dict[str, Any]]:
+        try:
+            drug = json.loads(fragment)
+        except json.JSONDecodeError:
+            drug = repair_json(fragment)
+        return normalize_drug(drug) if isinstance(drug, dict) else None
+
+
+def normalize_drug(drug: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Приведение препарата к схеме: строковые поля, обязательно name или innEnglish"""
+    normalized = {}
+    for field in DRUG_FIELDS:
+        value = drug.get(field)
+        if value is None:
+            value = ''
+        elif isinstance(value, (list, tuple)):
+            value = ', '.join(str(item) for item in value)
+        elif not isinstance(value, str):
+            value = str(value)
+        normalized[field] = value.strip()
+
+    if not normalized['name'] and not normalized['innEnglish']:
+        return None
+    return normalized
+
+
+def validate_analysis(result: Any, streamed_drugs: Optional[List[Dict[str, Any]]] = None) -> Tuple[Dict[str, Any], List[str]]:
+    """Проверка результата анализа по схеме
+
+    Возвращает результат, приведенный к схеме, и список найденных проблем.
+    Если массив ``drugs`` потерян или испорчен, используются препараты,
+    уже разобранные из потока.
+    """
+    problems = []
+    if not isinstance(result, dict):
+        problems.append('ответ не является JSON объектом')
+        result = {}
+
+    clean: Dict[str, Any] = {}
+    for field in ('protocolSummary', 'mainCondition'):
+        value = result.get(field, '')
+        if not isinstance(value, str):
+            problems.append(f'поле {field} не является строкой')
+            value = '' if value is None else str(value)
+        clean[field] = value
+
+    drugs = result.get('drugs')
+    if not isinstance(drugs, list):
+        problems.append('поле drugs не является массивом')
+        drugs = streamed_drugs or []
+
+    clean['drugs'] = []
+    for drug in drugs:
+        normalized = normalize_drug(drug) if isinstance(drug, dict) else None
+        if normalized is None:
+            problems.append('препарат без названия пропущен')
+            continue
+        if not normalized['id']:
+            normalized['id'] = str(len(clean['drugs']) + 1)
+        clean['drugs'].append(normalized)
+
+    return clean, problems
+
+
+def repair_json(text: str, expect: Optional[str] = None) -> Optional[Any]:
+    """Локальное исправление типичных поломок JSON без обращения к модели
+
+    Убираются обрамление кода и висячие запятые, незакрытые строки и
+    скобки (например, при обрыве генерации) закрываются. Объект ищется
+    с каждой скобки, за которой идет ключ в кавычках: скобки в тексте
+    перед JSON пропускаются. Если задан ``expect``, предпочитается первый
+    объект с этим ключом.
+    """
+    fallback = None
+    for match in _OBJECT_START.finditer(text):
+        result = _repair_candidate(text[match.start():])
+        if result is None:
+            continue
+        if expect is None or (isinstance(result, dict) and expect in result):
+            return result
+        if fallback is None:
+            fallback = result
+    return fallback
+
+
+def _repair_candidate(candidate: str) -> Optional[Any]:
+    """Разбор объекта с начала текста: целиком, с текстом после объекта или с исправлениями"""
+    candidate = candidate.strip()
+    try:
+        # Пояснение модели после JSON не мешает разбору
+        return json.JSONDecoder().raw_decode(candidate)[0]
+    except json.JSONDecodeError:
+        pass
+    if candidate.endswith('```'):
+        candidate = candidate[:-3].rstrip()
+
+    stack = []
+    in_string = escape = False
+    for char in candidate:
+        if in_string:
+            if escape:
+                escape = False
+            elif char == '\\':
+                escape = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in '{[':
+            stack.append('}' if char == '{' else ']')
+        elif char in '}]' and stack:
+            stack.pop()
+
+    if in_string:
+        candidate += '"'
+    candidate = candidate.rstrip().rstrip(',')
+    if candidate.endswith(':'):
+        candidate += ' null'
+    candidate += ''.join(reversed(stack))
+    candidate = _TRAILING_COMMA.sub(r'\1', candidate)
+
+    try:
+        return json.loads(candidate)
+    except json.JSONDecodeError:
+        return None
@@ -0,0 +1,216 @@
+import os
+import time
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, List, Tuple, Optional, Iterator, Callable, Any
+import requests
+
+# Границы корзин гистограммы длительностей (секунды)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+TRACE_HEADER = 'X-Trace'
+
+# Этапы текущего запроса (или задачи): список (этап, секунды); None - трассировка выключена
+_trace: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar('trace', default=None)
+
+
+def error_kind(error: BaseException) -> str:
+    """Вид ошибки для счетчиков: timeout или error"""
+    return 'timeout' if isinstance(error, (requests.Timeout, TimeoutError)) else 'error'
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], *extra: str) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(label for label in extra if label)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...], buckets=DEFAULT_BUCKETS):
+        """Гистограмма в формате Prometheus"""
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        with self._lock:
+            # Счетчики корзин, затем сумма и общее число наблюдений
+            series = self._series.setdefault(label_values, [0.0] * (len(self.buckets) + 2))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self, const: str = '') -> List[str]:
+        # const - метки, общие для всех серий (например, worker="<pid>")
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for label_values, values in sorted(series.items()):
+            for bound, count in zip(self.buckets, values):
+                labels = _labels(self.labels, label_values, const, f'le="{bound}"')
+                lines.append(f'{self.name}_bucket{labels} {count:g}')
+            labels = _labels(self.labels, label_values, const, 'le="+Inf"')
+            lines.append(f'{self.name}_bucket{labels} {values[-1]:g}')
+            lines.append(f'{self.name}_sum{_labels(self.labels, label_values, const)} {values[-2]:.6f}')
+            lines.append(f'{self.name}_count{_labels(self.labels, label_values, const)} {values[-1]:g}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...]):
+        """Счетчик в формате Prometheus"""
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self, const: str = '') -> List[str]:
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            lines.append(f'{self.name}{_labels(self.labels, label_values, const)} {value:g}')
+        return lines
+
+
+class Metrics:
+    def __init__(self, app=None):
+        """Метрики процесса: длительности этапов и ошибки внешних сервисов"""
+        self.app = None
+        self.stage_duration = Histogram(
+            'protocol_stage_duration_seconds', 'Длительность этапов обработки', ('stage',)
+        )
+        self.stage_errors = Counter(
+            'protocol_stage_errors_total', 'Этапы, завершившиеся ошибкой или таймаутом', ('stage', 'kind')
+        )
+        self.upstream_errors = Counter(
+            'upstream_errors_total', 'Ошибки и таймауты запросов к внешним API', ('host', 'kind')
+        )
+        self.upstream_retries = Counter(
+            'upstream_retries_total', 'Повторные запросы к внешним API', ('host',)
+        )
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Привязка к приложению: заголовок X-Trace включает трассировку запроса
+
+        Длительности этапов запроса возвращаются в заголовке Server-Timing.
+        """
+        self.app = app
+        app.extensions['metrics'] = self
+
+        from flask import request, g
+
+        @app.before_request
+        def start_trace():
+            if request.headers.get(TRACE_HEADER, '').strip().lower() in {'1', 'true', 'yes', 'on'}:
+                g.trace_token = _trace.set([])
+
+        @app.after_request
+        def add_trace_header(response):
+            spans = _trace.get()
+            # Ответ из кэша не выполнял этапов; потоковый ответ еще не начался
+            # (пакетный поиск отдает длительности последней строкой, см. current_trace)
+            if spans and 'trace_token' in g:
+                response.headers['Server-Timing'] = format_server_timing(spans)
+            return response
+
+        @app.teardown_request
+        def stop_trace(error=None):
+            token = g.pop('trace_token', None)
+            if token is not None:
+                _trace.reset(token)
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        """Замер этапа: гистограмма, счетчик ошибок и трассировка текущего запроса"""
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            self.stage_errors.inc(stage, error_kind(e))
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stage_duration.observe(elapsed, stage)
+            spans = _trace.get()
+            if spans is not None:
+                spans.append((stage, elapsed))
+
+    def timed(self, stage: str) -> Callable:
+        """Декоратор: весь вызов функции - один этап"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus
+
+        Значения относятся к текущему процессу, поэтому у всех серий есть
+        метка ``worker`` (pid): под gunicorn каждый воркер считает свое, и
+        ответы разных воркеров нельзя принимать за одну и ту же серию.
+        """
+        const = f'worker="{os.getpid()}"'
+        lines = []
+        for metric in (self.stage_duration, self.stage_errors, self.upstream_errors, self.upstream_retries):
+            lines.extend(metric.render(const))
+        return '\n'.join(lines) + '\n'
+
+
+@contextmanager
+def trace() -> Iterator[List[Tuple[str, float]]]:
+    """Трассировка вне HTTP запроса (например, в фоновой задаче)"""
+    spans: List[Tuple[str, float]] = []
+    token = _trace.set(spans)
+    try:
+        yield spans
+    finally:
+        _trace.reset(token)
+
+
+def current_trace() -> Optional[List[Tuple[str, float]]]:
+    """Этапы текущего запроса (задачи); None, если трассировка выключена"""
+    return _trace.get()
+
+
+def submit(executor, fn: Callable, *args, **kwargs):
+    """Отправка задачи в пул потоков вместе с контекстом: этапы попадают в трассировку запроса"""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def format_server_timing(spans: List[Tuple[str, float]]) -> str:
+    """Этапы в формате заголовка Server-Timing (длительность в миллисекундах)"""
+    return ', '.join(f'{stage};dur={elapsed * 1000:.1f}' for stage, elapsed in spans)
+
+
+def summarize(spans: List[Tuple[str, float]]) -> Dict[str, Any]:
+    """Суммарная длительность этапов в миллисекундах (для сохранения в результатах)"""
+    totals: Dict[str, float] = {}
+    for stage, elapsed in spans:
+        totals[stage] = totals.get(stage, 0.0) + elapsed
+    return {stage: round(elapsed * 1000, 1) for stage, elapsed in totals.items()}
+
+
+metrics = Metrics()
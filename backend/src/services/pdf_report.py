@@ -0,0 +1,249 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, Optional
+from src.services.metrics import metrics
+
+# Меняйте при изменении оформления отчета: от версии зависит имя файла
+REPORT_VERSION = '1'
+REPORT_PREFIX = 'protocol_analysis_'
+
+# Поля препарата, которые попадают в отчет (и в хэш его содержимого)
+REPORT_DRUG_FIELDS = ('name', 'innEnglish', 'dosage', 'route', 'frequency')
+
+DAY = 24 * 60 * 60
+
+DOWNLOADS_DIR = os.getenv(
+    'DOWNLOADS_DIR', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'downloads')
+)
+
+
+def report_key(analysis_data: Dict[str, Any]) -> str:
+    """Хэш содержимого отчета
+
+    Учитываются только выводимые в отчет поля, поэтому, например, другое
+    время анализа не приводит к повторной генерации того же отчета.
+    """
+    content = {
+        'version': REPORT_VERSION,
+        'protocol_summary': analysis_data.get('protocol_summary') or '',
+        'main_condition': analysis_data.get('main_condition') or '',
+        'drugs': [
+            [drug.get(field, '') for field in REPORT_DRUG_FIELDS]
+            for drug in analysis_data.get('drugs') or []
+            if isinstance(drug, dict)
+        ]
+    }
+    serialized = json.dumps(content, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+def report_filename(analysis_data: Dict[str, Any]) -> str:
+    """Имя файла отчета по хэшу содержимого"""
+    return f"{REPORT_PREFIX}{report_key(analysis_data)[:32]}.pdf"
+
+
+def render_pdf_report(analysis_data: Dict[str, Any], pdf_path: str) -> str:
+    """Генерация PDF отчета (выполняется в отдельном процессе)
+
+    Документ пишется во временный файл и атомарно переименовывается,
+    поэтому недописанный отчет никогда не отдается клиенту.
+    """
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib import colors
+    from reportlab.lib.units import inch
+    
+    tmp_path = f"{pdf_path}.{os.getpid()}.tmp"
+    try:
+        # Создаем PDF документ
+        doc = SimpleDocTemplate(tmp_path, pagesize=letter)
+        styles = getSampleStyleSheet()
+        story = []
+        
+        # Заголовок
+        title_style = ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=16,
+            spaceAfter=30,
+            alignment=1  # Центрирование
+        )
+        story.append(Paragraph("Анализ клинического протокола", title_style))
+        story.append(Spacer(1, 12))
+        
+        # Общая информация
+        if analysis_data.get('protocol_summary'):
+            story.append(Paragraph("Резюме протокола:", styles['Heading2']))
+            story.append(Paragraph(analysis_data['protocol_summary'], styles['Normal']))
+            story.append(Spacer(1, 12))
+        
+        if analysis_data.get('main_condition'):
+            story.append(Paragraph("Основное состояние:", styles['Heading2']))
+            story.append(Paragraph(analysis_data['main_condition'], styles['Normal']))
+            story.append(Spacer(1, 12))
+        
+        # Таблица препаратов
+        if analysis_data.get('drugs'):
+            story.append(Paragraph("Анализ лекарственных средств:", styles['Heading2']))
+            
+            # Создаем данные для таблицы
+            table_data = [['Препарат', 'МНН (англ.)', 'Дозировка', 'Путь введения', 'Режим']]
+            
+            for drug in analysis_data['drugs']:
+                table_data.append([
+                    drug.get('name', ''),
+                    drug.get('innEnglish', ''),
+                    drug.get('dosage', ''),
+                    drug.get('route', ''),
+                    drug.get('frequency', '')
+                ])
+            
+            # Создаем таблицу
+            table = Table(table_data, colWidths=[1.5*inch, 1.5*inch, 1*inch, 1*inch, 1*inch])
+            table.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, 0), 10),
+                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+                ('FONTSIZE', (0, 1), (-1, -1), 8),
+                ('GRID', (0, 0), (-1, -1), 1, colors.black)
+            ]))
+            
+            story.append(table)
+        
+        # Генерируем PDF
+        doc.build(story)
+        os.replace(tmp_path, pdf_path)
+        
+        return pdf_path
+    
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise Exception(f"Ошибка при генерации PDF: {str(e)}")
+
+
+class PdfReportService:
+    def __init__(self, downloads_dir: Optional[str] = None):
+        """PDF отчеты с именами по хэшу содержимого, генерация в пуле процессов"""
+        self.downloads_dir = downloads_dir or DOWNLOADS_DIR
+        # PDF_WORKERS=0 - генерация в потоке запроса, без пула процессов
+        self.workers = int(os.getenv('PDF_WORKERS', 2))
+        self.render_timeout = float(os.getenv('PDF_RENDER_TIMEOUT', 120))
+        self.max_bytes = int(os.getenv('DOWNLOADS_MAX_BYTES', 500 * 1024 * 1024))
+        self.max_age = float(os.getenv('DOWNLOADS_MAX_AGE', 7 * DAY))
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = {}
+        
+        os.makedirs(self.downloads_dir, exist_ok=True)
+    
+    @metrics.timed('pdf')
+    def generate(self, analysis_data: Dict[str, Any]) -> str:
+        """Путь к PDF отчету; готовый отчет с тем же содержимым отдается сразу"""
+        filename = report_filename(analysis_data)
+        pdf_path = os.path.join(self.downloads_dir, filename)
+        
+        if os.path.exists(pdf_path):
+            self._touch(pdf_path)
+            return pdf_path
+        
+        if self.workers <= 0:
+            render_pdf_report(analysis_data, pdf_path)
+            self.evict(keep=filename)
+            return pdf_path
+        
+        # Одновременные запросы одного и того же отчета ждут одну генерацию
+        with self._lock:
+            future = self._pending.get(filename)
+            owner = future is None
+            if owner:
+                future = self._get_executor().submit(render_pdf_report, analysis_data, pdf_path)
+                self._pending[filename] = future
+        
+        try:
+            future.result(timeout=self.render_timeout)
+        except BrokenProcessPool:
+            # Рабочий процесс аварийно завершился: следующий запрос создаст новый пул
+            with self._lock:
+                self._executor = None
+            raise
+        finally:
+            if owner:
+                with self._lock:
+                    self._pending.pop(filename, None)
+        
+        if owner:
+            self.evict(keep=filename)
+        return pdf_path
+    
+    def evict(self, keep: Optional[str] = None) -> int:
+        """Удаление отчетов старше срока хранения и самых старых сверх лимита размера"""
+        now = time.time()
+        reports = []
+        try:
+            names = os.listdir(self.downloads_dir)
+        except OSError:
+            return 0
+        
+        for name in names:
+            if not name.startswith(REPORT_PREFIX) or not name.endswith('.pdf'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.downloads_dir, name))
+            except OSError:
+                continue
+            reports.append((stat.st_mtime, stat.st_size, name))
+        
+        reports.sort()
+        total = sum(size for _, size, _ in reports)
+        removed = 0
+        for mtime, size, name in reports:
+            if name == keep:
+                continue
+            if now - mtime <= self.max_age and total <= self.max_bytes:
+                continue
+            try:
+                os.remove(os.path.join(self.downloads_dir, name))
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+    
+    def close(self) -> None:
+        """Остановка пула процессов"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+    
+    def _touch(self, path: str) -> None:
+        # Время изменения служит временем последнего обращения для вытеснения
+        try:
+            os.utime(path)
+        except OSError as e:
+            print(f"Ошибка при обновлении времени отчета: {str(e)}")
+    
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Вызывается под self._lock
+        if self._executor is None:
+            # fork из многопоточного воркера может скопировать чужие захваченные
+            # блокировки; forkserver порождает процессы из чистого однопоточного
+            # сервера, в котором модуль отчетов уже импортирован
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('forkserver')
+                context.set_forkserver_preload([__name__])
+            else:
+                context = multiprocessing.get_context('spawn')
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        return self._executor
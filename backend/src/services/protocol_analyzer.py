@@ -1,53 +1,173 @@
 import os
 import json
 import tempfile
-from typing import Dict, List, Any
-import mammoth
-import google.generativeai as genai
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib import colors
-from reportlab.lib.units import inch
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Callable, BinaryIO, Union, Iterator, Tuple
+from src.services.analysis_cache import AnalysisCache, analysis_cache
+from src.services.analysis_history import AnalysisHistory, analysis_history
+from src.services.docx_ingest import validate_docx_stream
+from src.services.json_stream import DrugStreamParser, validate_analysis, repair_json
+from src.services.protocol_sections import (
+    split_sections, merge_drugs, drug_key, section_fingerprint, group_sections, mentions_drug
+)
+from src.services.metrics import metrics, submit
+from src.services.inn_index import get_inn_index
+
+# Меняйте при любом изменении промпта: от версии зависит ключ кэша анализов
+PROMPT_VERSION = '1'
+
+# Обратный вызов прогресса: (этап, процент)
+ProgressCallback = Callable[[str, int], None]
+# Обратный вызов для каждого препарата, разобранного из потока ответа модели
+DrugCallback = Callable[[Dict[str, Any]], None]
+
+_analysis_executor = None
+_analysis_executor_lock = threading.Lock()
+
+
+def get_analysis_executor() -> ThreadPoolExecutor:
+    """Общий для процесса пул для параллельного анализа фрагментов протоколов"""
+    global _analysis_executor
+    if _analysis_executor is None:
+        with _analysis_executor_lock:
+            if _analysis_executor is None:
+                _analysis_executor = ThreadPoolExecutor(
+                    max_workers=int(os.getenv('ANALYSIS_MAX_PARALLEL', 4)),
+                    thread_name_prefix='analysis'
+                )
+    return _analysis_executor
+
+def extract_docx_text(source: Union[str, BinaryIO]) -> str:
+    """Извлечение текста из DOCX файла (путь или открытый бинарный поток)
+
+    Поток передается в mammoth напрямую, без промежуточных файлов;
+    перед распаковкой архив проверяется на zip-бомбу. Функция уровня
+    модуля, чтобы ее можно было выполнять в пуле процессов.
+    """
+    import mammoth
+    
+    try:
+        if hasattr(source, 'read'):
+            validate_docx_stream(source)
+            return mammoth.extract_raw_text(source).value
+        with open(source, 'rb') as docx_file:
+            validate_docx_stream(docx_file)
+            result = mammoth.extract_raw_text(docx_file)
+            return result.value
+    except Exception as e:
+        raise Exception(f"Ошибка при извлечении текста из DOCX: {str(e)}")
 
 class ProtocolAnalyzer:
-    def __init__(self):
-        """Инициализация анализатора протоколов"""
-        self.api_key = os.getenv('GEMINI_API_KEY')
-        if not self.api_key:
-            raise ValueError("GEMINI_API_KEY не найден в переменных окружения")
-        
-        genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel('gemini-1.5-flash')
+    def __init__(self, cache: AnalysisCache = None, model=None, history: AnalysisHistory = None):
+        """Инициализация анализатора протоколов
+
+        ``model`` позволяет подставить собственный клиент модели с методом
+        ``generate_content`` (например, в тестах).
+        """
+        self.model_name = os.getenv('GEMINI_MODEL', 'gemini-1.5-flash')
+        if model is None:
+            self.api_key = os.getenv('GEMINI_API_KEY')
+            if not self.api_key:
+                raise ValueError("GEMINI_API_KEY не найден в переменных окружения")
+            
+            # Тяжелый SDK импортируется только при создании анализатора
+            import google.generativeai as genai
+            
+            genai.configure(api_key=self.api_key)
+            model = genai.GenerativeModel(self.model_name)
+        self.model = model
+        self.cache = cache or analysis_cache
+        # Успешные анализы сохраняются в историю для поиска по МНН, заболеванию и тексту
+        self.history = history or analysis_history
+        # Протоколы длиннее chunk_chars анализируются по частям
+        self.chunk_chars = int(os.getenv('ANALYSIS_CHUNK_CHARS', 60000))
+        self.chunk_retries = int(os.getenv('ANALYSIS_CHUNK_RETRIES', 2))
+        # В режиме редакций разделы анализируются блоками не длиннее revision_chunk_chars
+        self.revision_chunk_chars = int(os.getenv('ANALYSIS_REVISION_CHUNK_CHARS', 8000))
+        # Если изменено больше этой доли текста, новая редакция анализируется целиком
+        self.revision_full_ratio = float(os.getenv('ANALYSIS_REVISION_FULL_RATIO', 0.5))
     
-    def extract_text_from_docx(self, file_path: str) -> str:
-        """Извлечение текста из DOCX файла"""
+    def extract_text_from_docx(self, source: Union[str, BinaryIO]) -> str:
+        """Извлечение текста из DOCX файла (путь или открытый бинарный поток)"""
+        with metrics.span('extract'):
+            return extract_docx_text(source)
+    
+    def analyze_protocol(self, source: Union[str, BinaryIO], refresh: bool = False,
+                         progress: Optional[ProgressCallback] = None,
+                         on_drug: Optional[DrugCallback] = None, filename: str = '',
+                         revision_of: Optional[int] = None) -> Dict[str, Any]:
+        """Основной метод анализа протокола
+
+        Результат кэшируется по хэшу нормализованного текста, модели и версии
+        промпта; ``refresh=True`` игнорирует сохраненный результат и
+        перезаписывает его. ``progress`` получает этап и процент выполнения,
+        ``on_drug`` - каждый препарат, как только модель закончила его описание.
+        Результат сохраняется в историю анализов (``analysis_id`` в ответе).
+
+        ``revision_of`` включает режим редакций: модели отправляются только
+        разделы, которых нет в предыдущей версии (id анализа в истории;
+        0 - предыдущей версии нет), см. ``_analyze_revision``.
+        """
+        progress = progress or (lambda stage, percent: None)
         try:
-            with open(file_path, 'rb') as docx_file:
-                result = mammoth.extract_raw_text(docx_file)
-                return result.value
+            # Извлекаем текст из документа
+            progress('extracting', 10)
+            text = self.extract_text_from_docx(source)
         except Exception as e:
-            raise Exception(f"Ошибка при извлечении текста из DOCX: {str(e)}")
+            return {
+                'success': False,
+                'error': str(e),
+                'analysis_timestamp': self._get_timestamp()
+            }
+        
+        return self.analyze_text(text, refresh, progress, on_drug, filename, revision_of)
     
-    def analyze_protocol(self, file_path: str) -> Dict[str, Any]:
-        """Основной метод анализа протокола"""
+    def analyze_text(self, text: str, refresh: bool = False,
+                     progress: Optional[ProgressCallback] = None,
+                     on_drug: Optional[DrugCallback] = None, filename: str = '',
+                     revision_of: Optional[int] = None) -> Dict[str, Any]:
+        """Анализ уже извлеченного текста протокола (см. ``analyze_protocol``)"""
+        progress = progress or (lambda stage, percent: None)
         try:
-            # Извлекаем текст из документа
-            text = self.extract_text_from_docx(file_path)
-            
             if not text.strip():
                 raise Exception("Документ пуст или не содержит текста")
             
-            # Анализируем протокол с помощью ИИ
-            analysis_result = self._analyze_with_ai(text)
+            cache_key = self.cache.make_key(text, self.model_name, PROMPT_VERSION)
+            analysis_result = None if refresh else self.cache.get(cache_key)
+            cached = analysis_result is not None
+            if refresh:
+                self.cache.record_bypass()
             
-            return {
+            sections = revision = None
+            if not cached:
+                # Анализируем протокол с помощью ИИ
+                progress('analyzing', 20)
+                if revision_of is not None:
+                    analysis_result, sections, revision = self._analyze_revision(
+                        text, revision_of, progress, self._unique_drugs(on_drug)
+                    )
+                else:
+                    analysis_result, sections = self._analyze_with_ai(text, progress, self._unique_drugs(on_drug))
+                self.cache.set(cache_key, {
+                    'protocolSummary': analysis_result.get('protocolSummary', ''),
+                    'mainCondition': analysis_result.get('mainCondition', ''),
+                    'drugs': analysis_result.get('drugs', [])
+                }, self.model_name, PROMPT_VERSION)
+            
+            result = {
                 'success': True,
                 'protocol_summary': analysis_result.get('protocolSummary', ''),
                 'main_condition': analysis_result.get('mainCondition', ''),
-                'drugs': analysis_result.get('drugs', []),
+                'drugs': self._canonicalize(analysis_result.get('drugs', [])),
+                'cached': cached,
                 'analysis_timestamp': self._get_timestamp()
             }
+            if revision is not None:
+                result['revision'] = revision
+            result['analysis_id'] = self.history.record(cache_key, text, result, filename, sections)
+            return result
         
         except Exception as e:
             return {
@@ -56,11 +176,245 @@ class ProtocolAnalyzer:
                 'analysis_timestamp': self._get_timestamp()
             }
     
-    def _analyze_with_ai(self, text: str) -> Dict[str, Any]:
-        """Анализ текста с помощью Gemini AI"""
+    def _analyze_with_ai(self, text: str, progress: Optional[ProgressCallback] = None,
+                         on_drug: Optional[DrugCallback] = None
+                         ) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """Анализ текста с помощью Gemini AI
+
+        Длинные протоколы анализируются по частям (см. ``_analyze_chunked``).
+        Вместе с результатом возвращаются результаты по разделам для истории
+        (см. ``_section_results``): по ним следующая редакция протокола
+        повторно использует неизмененные разделы.
+        """
+        with metrics.span('analyze'):
+            return self._analyze_full(text, self._sections(text), progress, on_drug)
+    
+    def _analyze_full(self, text: str, sections: List[Tuple[str, str]],
+                      progress: Optional[ProgressCallback] = None,
+                      on_drug: Optional[DrugCallback] = None
+                      ) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        if len(text) > self.chunk_chars:
+            return self._analyze_chunked(sections, progress, on_drug)
+        result = self._generate_analysis(self._build_prompt(text), on_drug)
+        units = [(list(dict.fromkeys(fp for fp, _ in sections)), text)] if sections else []
+        return result, self._section_results(units, sections, [result])
+    
+    def _analyze_chunked(self, sections: List[Tuple[str, str]], progress: Optional[ProgressCallback] = None,
+                         on_drug: Optional[DrugCallback] = None
+                         ) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """Map-reduce анализ длинного протокола
+
+        Разделы (отпечаток, текст) группируются в фрагменты не длиннее
+        ``chunk_chars``, фрагменты анализируются параллельно (не более
+        ``ANALYSIS_MAX_PARALLEL`` одновременно на процесс), а препараты
+        объединяются без дубликатов по МНН, дозировке и пути введения.
+        Повторно отправляются только фрагменты, анализ которых не удался.
+        """
+        units = group_sections(sections, self.chunk_chars)
+        results = self._analyze_chunks([unit_text for _, unit_text in units], progress, on_drug)
+        return self._merge_results(results), self._section_results(units, sections, results)
+    
+    def _analyze_revision(self, text: str, previous_id: int, progress: Optional[ProgressCallback] = None,
+                          on_drug: Optional[DrugCallback] = None
+                          ) -> Tuple[Dict[str, Any], List[Dict[str, Any]], Dict[str, Any]]:
+        """Анализ новой редакции протокола по разделам
+
+        Текст режется на разделы, у каждого считается отпечаток. Результаты
+        разделов предыдущей версии, оставшихся без изменений, используются
+        повторно; остальные разделы группируются в блоки и отправляются
+        модели, а резюме протокола берется из предыдущей версии. Если
+        изменена большая часть текста (``revision_full_ratio``) или блоков
+        получается больше, чем фрагментов полного анализа, протокол
+        анализируется целиком. Возвращает объединенный результат, результаты
+        разделов для истории и сводку (сколько разделов взято из предыдущей
+        версии и сколько проанализировано заново).
+        """
+        with metrics.span('analyze'):
+            sections = self._sections(text)
+            order = {}
+            for position, (fingerprint, _) in enumerate(sections):
+                order.setdefault(fingerprint, position)
+            
+            stored = self.history.sections(previous_id) if previous_id else []
+            # Разделы записей, затронутых изменениями (например, препарат без раздела
+            # в блоке с измененным разделом), анализируются заново целиком
+            dirty = {fp for unit in stored if not all(fp in order for fp in unit['fingerprints'])
+                     for fp in unit['fingerprints']}
+            reused = [unit for unit in stored
+                      if unit['fingerprints'] and not any(fp in dirty for fp in unit['fingerprints'])]
+            covered = {fp for unit in reused for fp in unit['fingerprints']}
+            changed = [(fp, section) for fp, section in sections if fp not in covered]
+            units = group_sections(changed, self.revision_chunk_chars)
+            
+            changed_chars = sum(len(section) for _, section in changed)
+            full_calls = len(group_sections(sections, self.chunk_chars)) if len(text) > self.chunk_chars else 1
+            if not reused or changed_chars > self.revision_full_ratio * len(text) or len(units) > full_calls:
+                result, stored = self._analyze_full(text, sections, progress, on_drug)
+                return result, stored, {
+                    'previous_id': previous_id or None,
+                    'sections': len(order),
+                    'reused': 0,
+                    'analyzed': len(order)
+                }
+            
+            if on_drug:
+                for unit in reused:
+                    for drug in unit['result'].get('drugs', []):
+                        on_drug(drug)
+            results = self._analyze_chunks([unit_text for _, unit_text in units], progress, on_drug) if units else []
+            
+            stored = reused + self._section_results(units, sections, results)
+            # Порядок записей - порядок их разделов в новой редакции
+            stored.sort(key=lambda unit: min(order[fp] for fp in unit['fingerprints']))
+            
+            merged = self._merge_results([unit['result'] for unit in stored])
+            # Резюме фрагмента не описывает протокол целиком: остается резюме предыдущей версии
+            previous = self.history.get(previous_id) or {}
+            merged['protocolSummary'] = previous.get('protocol_summary') or next(
+                (result['protocolSummary'] for result in results if result.get('protocolSummary')), ''
+            )
+            return merged, stored, {
+                'previous_id': previous_id or None,
+                'sections': len(order),
+                'reused': len(covered),
+                'analyzed': len({fp for fp, _ in changed})
+            }
+    
+    def _sections(self, text: str) -> List[Tuple[str, str]]:
+        """Разделы протокола с отпечатками"""
+        return [(section_fingerprint(section), section) for section in split_sections(text)]
+    
+    def _section_results(self, units: List[Tuple[List[str], str]], sections: List[Tuple[str, str]],
+                         results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Результаты проанализированных блоков, разложенные по разделам
+
+        Каждый раздел блока получает запись с препаратами, упомянутыми в его
+        тексте (в том числе пустую), поэтому в следующей редакции его можно
+        взять повторно независимо от соседних разделов. Препараты, которых нет
+        ни в одном разделе, остаются в записи всего блока.
+        """
+        texts: Dict[str, str] = {}
+        for fingerprint, section in sections:
+            texts.setdefault(fingerprint, section)
+        
+        records = []
+        for (fingerprints, _), result in zip(units, results):
+            drugs = [drug for drug in result.get('drugs', []) if isinstance(drug, dict)]
+            condition = result.get('mainCondition', '')
+            placed = set()
+            for fingerprint in dict.fromkeys(fingerprints):
+                found = [index for index, drug in enumerate(drugs) if mentions_drug(texts[fingerprint], drug)]
+                placed.update(found)
+                records.append(self._unit([fingerprint], {
+                    'mainCondition': condition, 'drugs': [drugs[index] for index in found]
+                }))
+            unplaced = [drug for index, drug in enumerate(drugs) if index not in placed]
+            if unplaced:
+                records.append(self._unit(fingerprints, {'mainCondition': condition, 'drugs': unplaced}))
+        return records
+    
+    def _unit(self, fingerprints: List[str], result: Dict[str, Any]) -> Dict[str, Any]:
+        """Запись для истории: отпечатки разделов и результат анализа"""
+        return {'fingerprints': list(fingerprints), 'result': {
+            'protocolSummary': result.get('protocolSummary', ''),
+            'mainCondition': result.get('mainCondition', ''),
+            'drugs': result.get('drugs', [])
+        }}
+    
+    def _merge_results(self, results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Объединение результатов фрагментов: первое резюме, самое частое заболевание, препараты без дубликатов"""
+        conditions = Counter(result.get('mainCondition') for result in results if result.get('mainCondition'))
+        return {
+            'protocolSummary': next((result['protocolSummary'] for result in results
+                                     if result.get('protocolSummary')), ''),
+            'mainCondition': conditions.most_common(1)[0][0] if conditions else '',
+            'drugs': merge_drugs(result.get('drugs', []) for result in results)
+        }
+    
+    def _analyze_chunks(self, chunks: List[str], progress: Optional[ProgressCallback] = None,
+                        on_drug: Optional[DrugCallback] = None) -> List[Dict[str, Any]]:
+        """Параллельный анализ фрагментов с повтором только неудавшихся"""
+        executor = get_analysis_executor()
+        results: List[Optional[Dict[str, Any]]] = [None] * len(chunks)
+        errors: Dict[int, Exception] = {}
+        pending = list(range(len(chunks)))
+        completed = 0
+        
+        for _ in range(self.chunk_retries + 1):
+            futures = {
+                submit(executor, self._generate_analysis,
+                       self._build_prompt(chunks[index], index + 1, len(chunks)), on_drug): index
+                for index in pending
+            }
+            pending = []
+            for future, index in futures.items():
+                try:
+                    results[index] = future.result()
+                    errors.pop(index, None)
+                    completed += 1
+                    if progress:
+                        progress('analyzing', 20 + 75 * completed // len(chunks))
+                except Exception as e:
+                    errors[index] = e
+                    pending.append(index)
+            if not pending:
+                break
+        
+        if errors:
+            failed = ', '.join(str(index + 1) for index in sorted(errors))
+            raise Exception(f"Не удалось проанализировать фрагменты протокола ({failed} из {len(chunks)}): "
+                            f"{str(next(iter(errors.values())))}")
+        return results
+    
+    def _unique_drugs(self, on_drug: Optional[DrugCallback]) -> Optional[DrugCallback]:
+        """Обертка обратного вызова, пропускающая повторы препаратов
+
+        Повторы возникают при анализе по частям и при повторной отправке
+        фрагмента; обертка потокобезопасна.
+        """
+        if on_drug is None:
+            return None
+        seen = set()
+        lock = threading.Lock()
+        
+        def emit(drug):
+            drug = get_inn_index().annotate(drug)
+            key = self._product_key(drug)
+            with lock:
+                if key in seen:
+                    return
+                seen.add(key)
+            on_drug(drug)
+        
+        return emit
+    
+    def _canonicalize(self, drugs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Каноническое МНН для каждого препарата и объединение дубликатов
+
+        "Metformin", "metformin hydrochloride" и "Метформин" с одинаковой
+        дозировкой и путем введения становятся одним препаратом.
+        """
+        inn_index = get_inn_index()
+        return merge_drugs([[inn_index.annotate(drug) for drug in drugs if isinstance(drug, dict)]],
+                           key=self._product_key)
+    
+    def _product_key(self, drug: Dict[str, Any]) -> tuple:
+        """Ключ дубликата после определения МНН: к МНН, дозировке и пути введения добавляется продукт
+
+        Продукт - нормализованное название препарата: разные продукты (например,
+        комбинация и ее компонент) не объединяются, даже если МНН совпало.
+        """
+        return (*drug_key(drug), get_inn_index().normalize(drug.get('name') or drug.get('innEnglish') or ''))
+    
+    def _build_prompt(self, text: str, part: int = 0, total: int = 0) -> str:
+        """Промпт для анализа протокола или его фрагмента"""
+        part_note = ''
+        if total > 1:
+            part_note = (f"\nЭто фрагмент {part} из {total} протокола: извлеките препараты, "
+                         f"упомянутые в этом фрагменте.\n")
         prompt = f"""
 Проанализируйте следующий клинический протокол и извлеките информацию о лекарственных средствах.
-
+{part_note}
 Текст протокола:
 {text}
 
@@ -89,106 +443,78 @@ class ProtocolAnalyzer:
 - Для targetCondition укажите наиболее специфичное заболевание или состояние
 - Если препарат не найден, не включайте его в список
 """
-        
+        return prompt
+    
+    def _generate_analysis(self, prompt: str, on_drug: Optional[DrugCallback] = None) -> Dict[str, Any]:
+        """Потоковый запрос к модели и разбор JSON из ответа
+
+        Препараты разбираются по мере генерации и сразу передаются в
+        ``on_drug``. Испорченный JSON сначала чинится локально, затем -
+        отдельным коротким запросом к модели только с текстом ответа,
+        без повторного анализа всего протокола.
+        """
         try:
-            response = self.model.generate_content(prompt)
-            
-            # Извлекаем JSON из ответа
-            response_text = response.text
-            
-            # Ищем JSON в ответе
-            start_idx = response_text.find('{')
-            end_idx = response_text.rfind('}') + 1
+            parser = DrugStreamParser()
+            with metrics.span('gemini'):
+                for piece in self._stream_text(prompt):
+                    for drug in parser.feed(piece):
+                        if on_drug:
+                            on_drug(drug)
             
-            if start_idx == -1 or end_idx == 0:
+            response_text = parser.text
+            if not parser.found and not parser.drugs:
                 raise Exception("Не удалось найти JSON в ответе ИИ")
             
-            json_text = response_text[start_idx:end_idx]
-            result = json.loads(json_text)
-            
-            return result
+            with metrics.span('parse'):
+                result = self._parse_json(parser.document())
+                if result is None:
+                    result = repair_json(response_text, expect='drugs')
+                    if isinstance(result, dict) and parser.end is None:
+                        # Ответ оборван: последний препарат в нем может быть неполным
+                        result['drugs'] = parser.drugs
+                if result is None:
+                    result = self._repair_with_model(response_text)
+                if result is None and not parser.drugs:
+                    raise Exception("Ошибка при парсинге JSON ответа: ответ не удалось исправить")
+                
+                analysis, problems = validate_analysis(result, parser.drugs)
+            if problems:
+                print(f"Ответ ИИ не соответствует схеме: {'; '.join(problems)}")
+            return analysis
         
-        except json.JSONDecodeError as e:
-            raise Exception(f"Ошибка при парсинге JSON ответа: {str(e)}")
         except Exception as e:
             raise Exception(f"Ошибка при анализе с помощью ИИ: {str(e)}")
     
-    def generate_pdf_report(self, analysis_data: Dict[str, Any]) -> str:
-        """Генерация PDF отчета"""
+    def _stream_text(self, prompt: str) -> Iterator[str]:
+        """Текст ответа модели по частям по мере генерации"""
+        response = self.model.generate_content(prompt, stream=True)
+        chunks = response if hasattr(response, '__iter__') else [response]
+        for chunk in chunks:
+            yield chunk.text
+    
+    def _repair_with_model(self, response_text: str) -> Optional[Dict[str, Any]]:
+        """Исправление синтаксиса JSON моделью (без текста протокола)"""
+        prompt = f"""
+Следующий JSON содержит синтаксические ошибки. Исправьте только синтаксис, не меняя и не добавляя данные.
+Верните только исправленный JSON без пояснений.
+
+{response_text}
+"""
         try:
-            # Создаем временный файл для PDF
-            downloads_dir = os.path.join(os.path.dirname(__file__), '..', 'downloads')
-            os.makedirs(downloads_dir, exist_ok=True)
-            
-            pdf_filename = f"protocol_analysis_{self._get_timestamp()}.pdf"
-            pdf_path = os.path.join(downloads_dir, pdf_filename)
-            
-            # Создаем PDF документ
-            doc = SimpleDocTemplate(pdf_path, pagesize=letter)
-            styles = getSampleStyleSheet()
-            story = []
-            
-            # Заголовок
-            title_style = ParagraphStyle(
-                'CustomTitle',
-                parent=styles['Heading1'],
-                fontSize=16,
-                spaceAfter=30,
-                alignment=1  # Центрирование
-            )
-            story.append(Paragraph("Анализ клинического протокола", title_style))
-            story.append(Spacer(1, 12))
-            
-            # Общая информация
-            if analysis_data.get('protocol_summary'):
-                story.append(Paragraph("Резюме протокола:", styles['Heading2']))
-                story.append(Paragraph(analysis_data['protocol_summary'], styles['Normal']))
-                story.append(Spacer(1, 12))
-            
-            if analysis_data.get('main_condition'):
-                story.append(Paragraph("Основное состояние:", styles['Heading2']))
-                story.append(Paragraph(analysis_data['main_condition'], styles['Normal']))
-                story.append(Spacer(1, 12))
-            
-            # Таблица препаратов
-            if analysis_data.get('drugs'):
-                story.append(Paragraph("Анализ лекарственных средств:", styles['Heading2']))
-                
-                # Создаем данные для таблицы
-                table_data = [['Препарат', 'МНН (англ.)', 'Дозировка', 'Путь введения', 'Режим']]
-                
-                for drug in analysis_data['drugs']:
-                    table_data.append([
-                        drug.get('name', ''),
-                        drug.get('innEnglish', ''),
-                        drug.get('dosage', ''),
-                        drug.get('route', ''),
-                        drug.get('frequency', '')
-                    ])
-                
-                # Создаем таблицу
-                table = Table(table_data, colWidths=[1.5*inch, 1.5*inch, 1*inch, 1*inch, 1*inch])
-                table.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0, 0), (-1, 0), 10),
-                    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                    ('FONTSIZE', (0, 1), (-1, -1), 8),
-                    ('GRID', (0, 0), (-1, -1), 1, colors.black)
-                ]))
-                
-                story.append(table)
-            
-            # Генерируем PDF
-            doc.build(story)
-            
-            return pdf_path
-        
+            response = self.model.generate_content(prompt)
+            return repair_json(response.text, expect='drugs')
         except Exception as e:
-            raise Exception(f"Ошибка при генерации PDF: {str(e)}")
+            print(f"Ошибка при исправлении JSON ответа: {str(e)}")
+            return None
+    
+    def _parse_json(self, json_text: Optional[str]) -> Optional[Any]:
+        """Разбор JSON; None, если текст отсутствует или некорректен"""
+        if json_text is None:
+            return None
+        try:
+            return json.loads(json_text)
+        except json.JSONDecodeError:
+            return None
     
     def _get_timestamp(self) -> str:
         """Получение текущего времени в формате строки"""
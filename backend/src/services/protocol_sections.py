@@ -0,0 +1,147 @@
+import re
+import hashlib
+from typing import List, Dict, Any, Iterable, Tuple, Callable
+
+# Заголовки разделов: "1.", "2.3 Дозирование", "Раздел 4", "ГЛАВА II", "Section 5"
+_HEADING = re.compile(
+    r'^(?:\d+(?:\.\d+)*\.?\s+\S|(?:раздел|глава|часть|приложение|section|chapter|appendix)\b)',
+    re.IGNORECASE
+)
+_MAX_HEADING_LENGTH = 120
+
+
+def is_heading(line: str) -> bool:
+    """Похожа ли строка на заголовок раздела"""
+    line = line.strip()
+    if not line or len(line) > _MAX_HEADING_LENGTH:
+        return False
+    if _HEADING.match(line):
+        return True
+    # Заголовки, набранные капслоком
+    letters = [char for char in line if char.isalpha()]
+    return len(letters) >= 4 and all(char.isupper() for char in letters)
+
+
+def split_sections(text: str) -> List[str]:
+    """Разбиение текста протокола (вывод mammoth) на разделы по заголовкам"""
+    sections: List[str] = []
+    current: List[str] = []
+
+    for paragraph in text.split('\n'):
+        if is_heading(paragraph) and any(line.strip() for line in current):
+            sections.append('\n'.join(current).strip())
+            current = []
+        current.append(paragraph)
+
+    if any(line.strip() for line in current):
+        sections.append('\n'.join(current).strip())
+    return sections
+
+
+def section_fingerprint(section: str) -> str:
+    """Отпечаток раздела: хэш текста без учета регистра и пробелов"""
+    normalized = ' '.join(section.lower().split())
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()[:32]
+
+
+def group_sections(sections: Iterable[Tuple[str, str]], max_chars: int) -> List[Tuple[List[str], str]]:
+    """Группировка соседних разделов (отпечаток, текст) в блоки для анализа
+
+    Возвращает пары (отпечатки разделов блока, текст блока). Раздел длиннее
+    лимита дает несколько блоков с одним и тем же отпечатком.
+    """
+    units: List[Tuple[List[str], str]] = []
+    fingerprints: List[str] = []
+    current = ''
+
+    def flush():
+        nonlocal fingerprints, current
+        if current:
+            units.append((fingerprints, current))
+        fingerprints, current = [], ''
+
+    for fingerprint, section in sections:
+        if len(section) > max_chars:
+            flush()
+            units.extend(([fingerprint], piece) for piece in _split_long(section, max_chars))
+            continue
+        if current and len(current) + len(section) + 2 > max_chars:
+            flush()
+        current = f"{current}\n\n{section}" if current else section
+        fingerprints.append(fingerprint)
+    flush()
+    return units
+
+
+def _split_long(section: str, max_chars: int) -> List[str]:
+    """Разбиение слишком длинного раздела по абзацам (в крайнем случае - по символам)"""
+    pieces: List[str] = []
+    current = ''
+    for paragraph in section.split('\n'):
+        while len(paragraph) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ''
+            pieces.append(paragraph[:max_chars])
+            paragraph = paragraph[max_chars:]
+        if current and len(current) + len(paragraph) + 1 > max_chars:
+            pieces.append(current)
+            current = ''
+        current = f"{current}\n{paragraph}" if current else paragraph
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def mentions_drug(section: str, drug: Dict[str, Any]) -> bool:
+    """Упоминается ли препарат в тексте раздела
+
+    Сравниваются первые слова названия и МНН без окончания: модель берет
+    названия из текста, а в тексте они стоят в разных падежах
+    ("метформин", "метформина").
+    """
+    text = section.lower()
+    for field in ('name', 'innEnglish', 'canonicalInn'):
+        words = re.findall(r'\w+', str(drug.get(field) or '').lower())
+        if not words:
+            continue
+        stem = words[0][:-2] if len(words[0]) > 6 else words[0]
+        if re.search(r'\b' + re.escape(stem), text):
+            return True
+    return False
+
+
+def drug_key(drug: Dict[str, Any]) -> tuple:
+    """Ключ для поиска дубликатов препарата: МНН, дозировка, путь введения"""
+    def norm(value):
+        return ' '.join(str(value or '').lower().split())
+
+    inn = drug.get('canonicalInn') or drug.get('innEnglish') or drug.get('name')
+    return norm(inn), norm(drug.get('dosage')), norm(drug.get('route'))
+
+
+def merge_drugs(drug_lists: Iterable[List[Dict[str, Any]]],
+                key: Callable[[Dict[str, Any]], tuple] = drug_key) -> List[Dict[str, Any]]:
+    """Объединение списков препаратов из разных фрагментов без дубликатов (по ключу ``key``)
+
+    Пустые поля первой найденной записи дополняются значениями из дубликатов;
+    идентификаторы перенумеровываются, чтобы не пересекались между фрагментами.
+    """
+    merged: Dict[tuple, Dict[str, Any]] = {}
+    for drugs in drug_lists:
+        for drug in drugs or []:
+            if not isinstance(drug, dict):
+                continue
+            drug_id = key(drug)
+            if drug_id not in merged:
+                merged[drug_id] = dict(drug)
+                continue
+            existing = merged[drug_id]
+            for field, value in drug.items():
+                if value and not existing.get(field):
+                    existing[field] = value
+
+    result = list(merged.values())
+    for index, drug in enumerate(result, start=1):
+        drug['id'] = str(index)
+    return result
@@ -0,0 +1,81 @@
+import atexit
+import threading
+from typing import Dict, Any, Callable, Optional
+
+
+class ServiceRegistry:
+    def __init__(self, app=None):
+        """Реестр сервисов приложения: ленивые потокобезопасные синглтоны на процесс"""
+        self.app = None
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._errors: Dict[str, str] = {}
+        self._lock = threading.RLock()
+        self._atexit = False
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Привязка к приложению Flask; сервисы закрываются при завершении процесса"""
+        self.app = app
+        app.extensions['services'] = self
+        # Каждый create_app заново вызывает init_app: обработчик регистрируется один раз
+        with self._lock:
+            if not self._atexit:
+                atexit.register(self.shutdown)
+                self._atexit = True
+
+    def register(self, name: str, factory: Callable[[], Any]) -> None:
+        """Регистрация фабрики сервиса; экземпляр создается при первом обращении"""
+        with self._lock:
+            self._factories[name] = factory
+            self._instances.pop(name, None)
+            self._errors.pop(name, None)
+
+    def get(self, name: str) -> Any:
+        """Экземпляр сервиса (создается один раз на процесс)"""
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+
+        with self._lock:
+            instance = self._instances.get(name)
+            if instance is None:
+                if name not in self._factories:
+                    raise KeyError(f"Сервис не зарегистрирован: {name}")
+                try:
+                    instance = self._factories[name]()
+                except Exception as e:
+                    self._errors[name] = str(e)
+                    raise
+                self._errors.pop(name, None)
+                self._instances[name] = instance
+        return instance
+
+    def probe(self, name: str) -> Optional[str]:
+        """Проверка готовности сервиса: None, если сервис создан, иначе текст ошибки"""
+        try:
+            self.get(name)
+            return None
+        except Exception as e:
+            return str(e)
+
+    def preload(self, *names: str) -> Dict[str, Optional[str]]:
+        """Заблаговременное создание сервисов (например, перед форком воркеров)"""
+        return {name: self.probe(name) for name in names or tuple(self._factories)}
+
+    def shutdown(self) -> None:
+        """Освобождение ресурсов созданных сервисов"""
+        with self._lock:
+            for instance in self._instances.values():
+                close = getattr(instance, 'close', None)
+                if callable(close):
+                    try:
+                        close()
+                    except Exception as e:
+                        print(f"Ошибка при остановке сервиса: {str(e)}")
+            self._instances.clear()
+
+
+services = ServiceRegistry()
@@ -0,0 +1,199 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple, Callable
+from src.models.user import db
+from src.models.research_cache import ResearchCacheEntry
+from src.services.inn_index import get_inn_index
+
+DAY = 24 * 60 * 60
+
+
+def normalize_drug_name(name: str) -> str:
+    """Нормализация названия препарата для ключа кэша: каноническое МНН (см. inn_index)"""
+    return get_inn_index().normalize(name)
+
+
+def normalize_condition(condition: str) -> str:
+    """Нормализация заболевания для ключа кэша"""
+    return ' '.join(condition.lower().split())
+
+
+class ResearchCache:
+    def __init__(self, app=None):
+        """Двухуровневый кэш результатов поиска: LRU в памяти + SQLite
+
+        Запись в памяти отдается, только если она совпадает с записью в
+        базе (по времени получения): под gunicorn запись мог обновить другой
+        воркер, и все воркеры должны отдавать одно и то же содержимое с
+        одним и тем же ETag.
+        """
+        self.app = None
+        self.memory_size = int(os.getenv('RESEARCH_CACHE_MEMORY_SIZE', 1024))
+        self.ttl = {
+            'pubmed': float(os.getenv('RESEARCH_CACHE_TTL_PUBMED', 7 * DAY)),
+            'clinical_trials': float(os.getenv('RESEARCH_CACHE_TTL_CLINICAL_TRIALS', DAY)),
+            'fda': float(os.getenv('RESEARCH_CACHE_TTL_FDA', 30 * DAY)),
+        }
+        # Сколько после истечения TTL еще можно отдавать устаревшие данные,
+        # обновляя их в фоне (stale-while-revalidate)
+        self.stale_ttl = float(os.getenv('RESEARCH_CACHE_STALE_TTL', 7 * DAY))
+
+        self._memory: 'OrderedDict[Tuple[str, str, str], Tuple[List[Dict[str, Any]], float]]' = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._stats = {'memory_hits': 0, 'db_hits': 0, 'stale_hits': 0, 'misses': 0, 'refreshes': 0}
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Привязка к приложению Flask (нужна для доступа к базе из фоновых потоков)"""
+        self.app = app
+        app.extensions['research_cache'] = self
+
+    def make_key(self, source: str, drug_name: str, condition: str = "") -> Tuple[str, str, str]:
+        """Ключ кэша; для FDA заболевание не учитывается"""
+        condition = '' if source == 'fda' else normalize_condition(condition)
+        return source, normalize_drug_name(drug_name), condition
+
+    def get(self, source: str, drug_name: str, condition: str = "") -> Tuple[Optional[List[Dict[str, Any]]], str]:
+        """Поиск в кэше; возвращает (результаты, состояние)
+
+        Состояние: ``fresh`` - данные актуальны, ``stale`` - данные устарели
+        и их нужно обновить в фоне, ``miss`` - данных нет.
+        """
+        if self.app is None:
+            return None, 'miss'
+
+        key = self.make_key(source, drug_name, condition)
+        entry = self._memory_get(key)
+        tier = 'memory_hits'
+        if entry is not None:
+            stored_at = self._db_version(key)
+            if stored_at is not None and stored_at != entry[1]:
+                # Запись обновил другой процесс: копия в памяти устарела
+                entry = None
+        if entry is None:
+            entry = self._db_get(key)
+            tier = 'db_hits'
+            if entry is not None:
+                self._memory_put(key, entry)
+
+        if entry is not None:
+            results, fetched_at = entry
+            age = time.time() - fetched_at
+            ttl = self.ttl.get(source, DAY)
+            if age < ttl:
+                self._count(tier)
+                return results, 'fresh'
+            if age < ttl + self.stale_ttl:
+                self._count('stale_hits')
+                return results, 'stale'
+
+        self._count('misses')
+        return None, 'miss'
+
+    def version(self, source: str, drug_name: str, condition: str = "") -> Optional[float]:
+        """Время получения актуальной записи (для ETag); None, если записи нет или она устарела
+
+        Берется из базы, общей для всех процессов. В статистике попаданий не учитывается.
+        """
+        if self.app is None:
+            return None
+
+        fetched_at = self._db_version(self.make_key(source, drug_name, condition))
+        if fetched_at is None or time.time() - fetched_at >= self.ttl.get(source, DAY):
+            return None
+        return fetched_at
+
+    def set(self, source: str, drug_name: str, condition: str, results: List[Dict[str, Any]]) -> None:
+        """Сохранение результатов в оба уровня кэша"""
+        if self.app is None:
+            return
+
+        key = self.make_key(source, drug_name, condition)
+        fetched_at = time.time()
+        self._memory_put(key, (results, fetched_at))
+        try:
+            with self.app.app_context():
+                db.session.merge(ResearchCacheEntry(
+                    source=key[0], drug=key[1], condition=key[2],
+                    payload=json.dumps(results, ensure_ascii=False),
+                    fetched_at=fetched_at
+                ))
+                db.session.commit()
+        except Exception as e:
+            print(f"Ошибка при сохранении кэша исследований: {str(e)}")
+
+    def revalidate(self, source: str, drug_name: str, condition: str,
+                   fetch: Callable[[], List[Dict[str, Any]]]) -> None:
+        """Фоновое обновление устаревшей записи; параллельные обновления одного ключа схлопываются"""
+        key = self.make_key(source, drug_name, condition)
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        try:
+            self.set(source, drug_name, condition, fetch())
+            self._count('refreshes')
+        except Exception as e:
+            print(f"Ошибка при обновлении кэша {source}: {str(e)}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики попаданий и промахов"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._memory)
+        lookups = stats['memory_hits'] + stats['db_hits'] + stats['stale_hits'] + stats['misses']
+        stats['hit_ratio'] = round((lookups - stats['misses']) / lookups, 3) if lookups else 0.0
+        return stats
+
+    def _memory_get(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+            return entry
+
+    def _memory_put(self, key, entry) -> None:
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def _db_get(self, key):
+        try:
+            with self.app.app_context():
+                row = db.session.get(ResearchCacheEntry, key)
+                if row is None:
+                    return None
+                return json.loads(row.payload), row.fetched_at
+        except Exception as e:
+            print(f"Ошибка при чтении кэша исследований: {str(e)}")
+            return None
+
+    def _db_version(self, key) -> Optional[float]:
+        """Время получения записи в базе (без чтения самих результатов)"""
+        try:
+            with self.app.app_context():
+                return db.session.query(ResearchCacheEntry.fetched_at).filter_by(
+                    source=key[0], drug=key[1], condition=key[2]
+                ).scalar()
+        except Exception as e:
+            print(f"Ошибка при чтении кэша исследований: {str(e)}")
+            return None
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+
+research_cache = ResearchCache()
@@ -0,0 +1,308 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import requests
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from functools import partial
+from typing import Dict, List, Any, Optional, Iterable, Iterator, Tuple
+from src.services.research_service import ResearchService
+from src.services.research_cache import ResearchCache, research_cache
+from src.services.metrics import submit
+from src.services.http_client import background_requests
+from src.services.inn_index import get_inn_index
+from src.services.evidence_ranker import EvidenceRanker
+
+SOURCES = ('pubmed', 'clinical_trials', 'fda')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Общий для процесса пул потоков для запросов к внешним API"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=int(os.getenv('RESEARCH_MAX_WORKERS', 16)),
+                    thread_name_prefix='research'
+                )
+    return _executor
+
+
+def _reset_executor() -> None:
+    # Пул, созданный до fork (например, в мастере gunicorn), в воркере не работает
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_executor)
+
+
+def query_name(drug_name: str) -> str:
+    """Название для запроса к внешним API: каноническое МНН или исходное название"""
+    return get_inn_index().canonical(drug_name) or drug_name
+
+
+class ResearchEngine:
+    def __init__(self, research_service: Optional[ResearchService] = None,
+                 deadline: Optional[float] = None, cache: Optional[ResearchCache] = None,
+                 ranker: Optional[EvidenceRanker] = None):
+        """Параллельный поиск по всем источникам с общим дедлайном"""
+        self.research_service = research_service or ResearchService()
+        self.cache = cache or research_cache
+        # В кэше хранятся все кандидаты, ранжирование и отбор top-k - при ответе
+        self.ranker = ranker or EvidenceRanker()
+        self.deadline = deadline if deadline is not None else float(os.getenv('RESEARCH_DEADLINE', 12))
+        self.executor = get_executor()
+        # Последний наблюдаемый статус каждого источника (для /api/health)
+        self.last_status: Dict[str, str] = {}
+        # Выполняющиеся интерактивные поиски: фоновая предзагрузка их пропускает вперед
+        self._interactive = 0
+        self._interactive_lock = threading.Lock()
+
+    @property
+    def busy(self) -> bool:
+        """Идет ли сейчас в процессе хотя бы один интерактивный поиск"""
+        return self._interactive > 0
+
+    def _track(self, delta: int) -> None:
+        with self._interactive_lock:
+            self._interactive += delta
+
+    def search(self, drug_name: str, condition: str = "") -> Dict[str, Any]:
+        """Запускает все источники одновременно и возвращает то, что успело прийти
+
+        Источники, не уложившиеся в дедлайн или завершившиеся ошибкой, дают
+        пустой список, а причина отражается в поле ``status``. Результаты
+        каждого источника ранжируются по силе доказательств (см. EvidenceRanker).
+        """
+        self._track(1)
+        try:
+            return self._search(drug_name, condition)
+        finally:
+            self._track(-1)
+
+    def _search(self, drug_name: str, condition: str) -> Dict[str, Any]:
+        deadline = time.monotonic() + self.deadline
+        results: Dict[str, Any] = {}
+        status: Dict[str, str] = {}
+
+        futures = {}
+        for source in SOURCES:
+            if self._from_cache(source, drug_name, condition, results, status):
+                continue
+            futures[submit(self.executor, self._fetch, source, drug_name, condition, deadline)] = source
+
+        done, _ = wait(futures, timeout=self.deadline) if futures else (set(), set())
+
+        for future, source in futures.items():
+            if future not in done:
+                future.cancel()
+                results[source], status[source] = [], 'timeout'
+                continue
+            results[source], status[source] = self._outcome(future, source)
+            if status[source] == 'ok':
+                self.cache.set(source, drug_name, condition, results[source])
+
+        results['status'] = {source: status[source] for source in SOURCES}
+        return self.ranker.rank(results)
+
+    def etag(self, drug_name: str, condition: str = "") -> Optional[str]:
+        """ETag ответа search() по версиям записей кэша, без запросов к источникам
+
+        None, если хотя бы для одного источника нет актуальной записи в кэше.
+        """
+        versions = []
+        for source in SOURCES:
+            version = self.cache.version(source, drug_name, condition)
+            if version is None:
+                return None
+            versions.append([*self.cache.make_key(source, drug_name, condition), version])
+        payload = json.dumps([versions, self.ranker.top_k], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+    def search_batch(self, lookups: Iterable[Tuple[str, str]]) -> Iterator[Dict[str, Any]]:
+        """Поиск для набора пар (препарат, заболевание) с выдачей результатов по мере готовности
+
+        Одинаковые (после нормализации) запросы выполняются один раз. Поиск
+        PMID в PubMed идет параллельно по каждому препарату, а детали статей
+        запрашиваются одним общим вызовом esummary для всех препаратов.
+        Каждый элемент результата содержит ``drug``, ``condition``, результаты
+        по источникам и ``status``.
+        """
+        self._track(1)
+        try:
+            yield from self._search_batch(lookups)
+        finally:
+            self._track(-1)
+
+    def prefetch(self, drug_name: str, condition: str = "", deadline: Optional[float] = None) -> str:
+        """Фоновое заполнение кэша для пары (препарат, заболевание)
+
+        Источники запрашиваются по очереди в вызывающем потоке (без общего
+        пула) фоновыми запросами, которые уступают лимиты интерактивным.
+        Возвращает ``skipped`` (все уже в кэше), ``fetched`` или ``errors``.
+        """
+        missing = [source for source in SOURCES if self.cache.version(source, drug_name, condition) is None]
+        if not missing:
+            return 'skipped'
+
+        outcome = 'fetched'
+        with background_requests():
+            for source in missing:
+                try:
+                    result = self._fetch(source, drug_name, condition, deadline)
+                except Exception as e:
+                    print(f"Ошибка при предзагрузке из источника {source}: {str(e)}")
+                    outcome = 'errors'
+                    continue
+                self.cache.set(source, drug_name, condition, result)
+        return outcome
+
+    def _search_batch(self, lookups: Iterable[Tuple[str, str]]) -> Iterator[Dict[str, Any]]:
+        deadline = time.monotonic() + self.deadline
+
+        unique: 'OrderedDict[Tuple[str, str, str], Tuple[str, str]]' = OrderedDict()
+        for drug_name, condition in lookups:
+            unique.setdefault(self.cache.make_key('pubmed', drug_name, condition), (drug_name, condition))
+
+        states: Dict[Tuple[str, str, str], Dict[str, Dict[str, Any]]] = {}
+        futures: Dict[Any, Tuple[Optional[Tuple[str, str, str]], str]] = {}
+        pmids: Dict[Tuple[str, str, str], List[str]] = {}
+        for key, (drug_name, condition) in unique.items():
+            state = states[key] = {'results': {}, 'status': {}}
+            for source in SOURCES:
+                if self._from_cache(source, drug_name, condition, state['results'], state['status']):
+                    continue
+                if source == 'pubmed':
+                    future = submit(
+                        self.executor, self.research_service.fetch_pubmed_ids, query_name(drug_name), condition, deadline=deadline
+                    )
+                    futures[future] = (key, 'pubmed_ids')
+                else:
+                    future = submit(self.executor, self._fetch, source, drug_name, condition, deadline)
+                    futures[future] = (key, source)
+
+        emitted = set()
+
+        def completed():
+            for key, state in states.items():
+                if key not in emitted and len(state['status']) == len(SOURCES):
+                    emitted.add(key)
+                    yield self._batch_item(unique[key], state)
+
+        yield from completed()
+
+        pending = set(futures)
+        id_searches = sum(1 for _, kind in futures.values() if kind == 'pubmed_ids')
+        try:
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    key, kind = futures[future]
+                    if kind == 'pubmed_ids':
+                        id_searches -= 1
+                        ids, ids_status = self._outcome(future, 'pubmed')
+                        if ids_status == 'ok' and ids:
+                            pmids[key] = ids
+                        else:
+                            states[key]['results']['pubmed'], states[key]['status']['pubmed'] = [], ids_status
+                            if ids_status == 'ok':
+                                self.cache.set('pubmed', *unique[key], [])
+
+                        if id_searches == 0 and pmids:
+                            all_pmids = [pmid for ids in pmids.values() for pmid in ids]
+                            summary = submit(
+                                self.executor, self.research_service.fetch_pubmed_summaries, all_pmids, deadline=deadline
+                            )
+                            futures[summary] = (None, 'pubmed_summaries')
+                            pending.add(summary)
+                    elif kind == 'pubmed_summaries':
+                        articles, summary_status = self._outcome(future, 'pubmed')
+                        for pmid_key, ids in pmids.items():
+                            state = states[pmid_key]
+                            state['results']['pubmed'] = [articles[pmid] for pmid in ids if pmid in articles]
+                            state['status']['pubmed'] = summary_status
+                            if summary_status == 'ok':
+                                self.cache.set('pubmed', *unique[pmid_key], state['results']['pubmed'])
+                    else:
+                        result, source_status = self._outcome(future, kind)
+                        states[key]['results'][kind], states[key]['status'][kind] = result, source_status
+                        if source_status == 'ok':
+                            self.cache.set(kind, *unique[key], result)
+
+                yield from completed()
+        finally:
+            for future in pending:
+                future.cancel()
+
+        # Все, что не успело завершиться до дедлайна, отдаем как частичный результат
+        for state in states.values():
+            for source in SOURCES:
+                if source not in state['status']:
+                    state['results'][source], state['status'][source] = [], 'timeout'
+        yield from completed()
+
+    def _from_cache(self, source: str, drug_name: str, condition: str,
+                    results: Dict[str, Any], status: Dict[str, str]) -> bool:
+        """Подстановка результата из кэша; устаревшие записи обновляются в фоне"""
+        cached, state = self.cache.get(source, drug_name, condition)
+        if cached is None:
+            return False
+
+        results[source], status[source] = cached, 'ok'
+        if state == 'stale':
+            # Отдаем устаревшие данные сразу, а обновляем их в фоне
+            self.executor.submit(
+                self.cache.revalidate, source, drug_name, condition,
+                partial(self._fetch, source, drug_name, condition, None)
+            )
+        return True
+
+    def _outcome(self, future, source: str) -> Tuple[Any, str]:
+        """Результат и статус завершенного запроса к источнику"""
+        error = future.exception()
+        if error is None:
+            result, status = future.result(), 'ok'
+        elif isinstance(error, requests.Timeout):
+            result, status = [], 'timeout'
+        else:
+            print(f"Ошибка при поиске в источнике {source}: {str(error)}")
+            result, status = [], 'error'
+        self.last_status[source] = status
+        return result, status
+
+    def is_source_available(self, source: str) -> bool:
+        """Источник считается доступным, пока последний запрос к нему не завершился ошибкой"""
+        return self.last_status.get(source, 'ok') == 'ok'
+
+    def _batch_item(self, lookup: Tuple[str, str], state: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """Элемент пакетного ответа"""
+        drug_name, condition = lookup
+        item: Dict[str, Any] = {'drug': drug_name, 'condition': condition}
+        for source in SOURCES:
+            item[source] = state['results'][source]
+        item['status'] = {source: state['status'][source] for source in SOURCES}
+        return self.ranker.rank(item)
+
+    def _fetch(self, source: str, drug_name: str, condition: str, deadline: Optional[float]):
+        """Запрос к одному источнику (по каноническому МНН, если оно известно)"""
+        drug_name = query_name(drug_name)
+        if source == 'pubmed':
+            return self.research_service.fetch_pubmed(drug_name, condition, deadline=deadline)
+        if source == 'clinical_trials':
+            return self.research_service.fetch_clinical_trials(drug_name, condition, deadline=deadline)
+        if source == 'fda':
+            return self.research_service.fetch_fda(drug_name, deadline=deadline)
+        raise ValueError(f"Неизвестный источник: {source}")
+
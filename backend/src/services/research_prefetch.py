@@ -0,0 +1,214 @@
+import os
+import time
+import threading
+from typing import Dict, List, Any, Optional, Tuple
+from sqlalchemy import or_, text as sql
+from src.models.user import db
+from src.models.job import AnalysisJob
+from src.models.research_prefetch import PrefetchTask
+from src.services.registry import services
+from src.services.research_cache import research_cache
+
+
+class ResearchPrefetch:
+    def __init__(self, app=None):
+        """Фоновая предзагрузка исследований для препаратов завершенного анализа
+
+        Пары (МНН, заболевание) ставятся в очередь в базе, поиск для них
+        выполняется заранее, и первый запрос /api/research отвечает из кэша.
+        Во всех воркерах вместе одновременно обрабатывается не более
+        ``concurrency`` пар: пару захватывают атомарным UPDATE с проверкой
+        числа выполняющихся. Предзагрузка уступает интерактивным поискам
+        (см. ``ResearchEngine.prefetch``) и отменяется, если клиент не
+        обращался к задаче дольше ``idle_timeout`` секунд или отменил ее
+        явно (см. ``cancel``).
+        """
+        self.app = None
+        self.enabled = os.getenv('RESEARCH_PREFETCH', '1') == '1'
+        self.concurrency = int(os.getenv('RESEARCH_PREFETCH_CONCURRENCY', 2))
+        self.idle_timeout = float(os.getenv('RESEARCH_PREFETCH_IDLE', 300))
+        # Общий дедлайн одной пары: фоновые запросы могут подолгу ждать лимитов
+        self.deadline = float(os.getenv('RESEARCH_PREFETCH_DEADLINE', 60))
+        # Пара, захваченная завершившимся воркером, снова доступна через stale_after секунд
+        self.stale_after = float(os.getenv('RESEARCH_PREFETCH_STALE', 120))
+        self.poll_interval = float(os.getenv('RESEARCH_PREFETCH_POLL', 2))
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._stats = {'scheduled': 0, 'fetched': 0, 'skipped': 0, 'cancelled': 0, 'errors': 0}
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Привязка к приложению Flask"""
+        self.app = app
+        app.extensions['research_prefetch'] = self
+
+    def start(self) -> None:
+        """Запуск потоков предзагрузки в этом процессе (под gunicorn - в каждом воркере)"""
+        if not self.enabled or self.app is None or self.concurrency <= 0:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            self._threads = [
+                threading.Thread(target=self._loop, name=f'prefetch-{index}', daemon=True)
+                for index in range(self.concurrency)
+            ]
+        for thread in self._threads:
+            thread.start()
+
+    def schedule(self, job_id: str, drugs: List[Dict[str, Any]]) -> int:
+        """Постановка в очередь поиска для препаратов задачи; возвращает число пар"""
+        if not self.enabled or self.app is None or self.concurrency <= 0:
+            return 0
+        lookups = self._lookups(drugs)
+        if not lookups:
+            return 0
+
+        now = time.time()
+        with self.app.app_context():
+            # Клиент мог отменить предзагрузку еще до завершения анализа
+            scheduled = AnalysisJob.query.filter(
+                AnalysisJob.id == job_id, AnalysisJob.prefetch.is_(None)
+            ).update({'prefetch': 'running'}, synchronize_session=False)
+            if not scheduled:
+                db.session.rollback()
+                return 0
+            db.session.add_all(
+                PrefetchTask(job_id=job_id, drug_name=drug_name[:255], condition=condition[:255],
+                             status='queued', updated_at=now)
+                for drug_name, condition in lookups
+            )
+            db.session.commit()
+
+        with self._lock:
+            self._stats['scheduled'] += len(lookups)
+        self._wakeup.set()
+        return len(lookups)
+
+    def cancel(self, job_id: str) -> bool:
+        """Отмена предзагрузки задачи (в том числе еще не начатой); False, если задачи нет"""
+        with self.app.app_context():
+            job = db.session.get(AnalysisJob, job_id)
+            if job is None:
+                return False
+            if job.prefetch in (None, 'running'):
+                self._cancel_job(job)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики предзагрузки текущего процесса и число пар в общей очереди"""
+        with self._lock:
+            stats = dict(self._stats)
+        pending = 0
+        if self.app is not None:
+            with self.app.app_context():
+                pending = PrefetchTask.query.count()
+        return {**stats, 'pending': pending}
+
+    def _lookups(self, drugs: List[Dict[str, Any]]) -> List[Tuple[str, str]]:
+        """Уникальные (после нормализации) пары (препарат, заболевание), как в пакетном поиске"""
+        lookups = {}
+        for drug in drugs:
+            if not isinstance(drug, dict):
+                continue
+            drug_name = (drug.get('canonicalInn') or drug.get('innEnglish') or drug.get('name') or '').strip()
+            if not drug_name:
+                continue
+            condition = (drug.get('targetCondition') or '').strip()
+            lookups.setdefault(research_cache.make_key('pubmed', drug_name, condition), (drug_name, condition))
+        return list(lookups.values())
+
+    def _loop(self) -> None:
+        """Рабочий поток: захват и обработка пар, пока очередь не пуста"""
+        while True:
+            task = None
+            try:
+                task = self._claim()
+                if task is not None:
+                    self._process(*task)
+            except Exception as e:
+                print(f"Ошибка при предзагрузке исследований: {str(e)}")
+            if task is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def _claim(self) -> Optional[Tuple[int, str, str, str]]:
+        """Атомарный захват следующей пары в пределах общего бюджета всех воркеров"""
+        # Пока в процессе идут интерактивные поиски, новые пары не берутся
+        if services.get('research_engine').busy:
+            return None
+
+        now = time.time()
+        cutoff = now - self.stale_after
+        with self.app.app_context():
+            task = PrefetchTask.query.filter(or_(
+                PrefetchTask.status == 'queued', PrefetchTask.updated_at < cutoff
+            )).order_by(PrefetchTask.id).first()
+            if task is None:
+                return None
+            claimed = (task.id, task.job_id, task.drug_name, task.condition)
+            # Захваты выполняющихся пар с давней отметкой (их воркер завершился) в бюджете не учитываются
+            rowcount = db.session.execute(sql(
+                "UPDATE prefetch_tasks SET status = 'running', updated_at = :now "
+                "WHERE id = :id AND (status = 'queued' OR updated_at < :cutoff) "
+                "AND (SELECT COUNT(*) FROM prefetch_tasks WHERE status = 'running' "
+                "AND updated_at >= :cutoff) < :budget"
+            ), {'now': now, 'id': task.id, 'cutoff': cutoff, 'budget': self.concurrency}).rowcount
+            db.session.commit()
+        return claimed if rowcount else None
+
+    def _process(self, task_id: int, job_id: str, drug_name: str, condition: str) -> None:
+        """Поиск для одной захваченной пары"""
+        outcome = 'cancelled'
+        try:
+            if self._active(job_id):
+                outcome = services.get('research_engine').prefetch(
+                    drug_name, condition, deadline=time.monotonic() + self.deadline
+                )
+        except Exception as e:
+            print(f"Ошибка при предзагрузке исследований для {drug_name}: {str(e)}")
+            outcome = 'errors'
+        finally:
+            self._finish(task_id, job_id, outcome)
+
+    def _active(self, job_id: str) -> bool:
+        """Нужна ли еще предзагрузка: не отменена и клиент недавно обращался к задаче"""
+        with self.app.app_context():
+            job = db.session.get(AnalysisJob, job_id)
+            if job is None or job.prefetch != 'running':
+                return False
+            if max(job.seen_at or 0, job.updated_at) < time.time() - self.idle_timeout:
+                # Клиент ушел: оставшиеся пары задачи не запрашиваются
+                self._cancel_job(job)
+                return False
+            return True
+
+    def _cancel_job(self, job: AnalysisJob) -> None:
+        job.prefetch = 'cancelled'
+        PrefetchTask.query.filter_by(job_id=job.id, status='queued').delete(synchronize_session=False)
+        db.session.commit()
+
+    def _finish(self, task_id: int, job_id: str, outcome: str) -> None:
+        """Удаление обработанной пары; после последней пары предзагрузка задачи завершена"""
+        with self._lock:
+            self._stats[outcome] += 1
+        with self.app.app_context():
+            PrefetchTask.query.filter_by(id=task_id).delete(synchronize_session=False)
+            if not PrefetchTask.query.filter_by(job_id=job_id).count():
+                AnalysisJob.query.filter_by(id=job_id, prefetch='running').update(
+                    {'prefetch': 'done'}, synchronize_session=False
+                )
+            db.session.commit()
+
+    def _reset_after_fork(self) -> None:
+        # Потоки родителя в дочернем процессе не существуют
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._threads = []
+
+
+research_prefetch = ResearchPrefetch()
+os.register_at_fork(after_in_child=research_prefetch._reset_after_fork)
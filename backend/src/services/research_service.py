@@ -1,166 +1,239 @@
 import os
-import requests
 import json
-from typing import List, Dict, Any
+from itertools import islice
+from typing import List, Dict, Any, Optional, Iterable, Iterator
 from urllib.parse import quote
+from src.services.http_client import HttpClient, get_http_client, get_api_key
+from src.services.metrics import metrics
+from src.services.fda_mirror import FdaMirror, fda_mirror, application_result
+from src.services.evidence_ranker import study_type
+
+# Кандидатов из каждого источника; в ответ попадают лучшие после ранжирования (EVIDENCE_TOP_K)
+RESEARCH_CANDIDATES = int(os.getenv('RESEARCH_CANDIDATES', 20))
+CLINICAL_TRIALS_MAX_PAGE_SIZE = 1000
+# Только поля, которые попадают в ответ API
+CLINICAL_TRIALS_FIELDS = 'NCTId,BriefTitle,OverallStatus,Phase'
+# Значения API v2 в прежнем человекочитаемом виде ("Phase 3", "Active, not recruiting")
+STUDY_PHASES = {
+    'EARLY_PHASE1': 'Early Phase 1', 'PHASE1': 'Phase 1', 'PHASE2': 'Phase 2',
+    'PHASE3': 'Phase 3', 'PHASE4': 'Phase 4', 'NA': 'N/A'
+}
+STUDY_STATUSES = {'ACTIVE_NOT_RECRUITING': 'Active, not recruiting'}
+
+
+def ingredients(drug_name: str) -> List[str]:
+    """Действующие вещества: МНН комбинации (см. inn_index) записано через " + " """
+    return [part.strip() for part in drug_name.split(' + ') if part.strip()] or [drug_name]
 
 class ResearchService:
-    def __init__(self):
+    def __init__(self, http_client: Optional[HttpClient] = None, mirror: Optional[FdaMirror] = None):
         """Инициализация сервиса поиска исследований"""
-        self.pubmed_base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils"
-        self.clinical_trials_base_url = "https://clinicaltrials.gov/api/query"
-        self.fda_base_url = "https://api.fda.gov"
+        # Адреса API можно переопределить (например, для локальной заглушки в бенчмарках)
+        self.pubmed_base_url = os.getenv('PUBMED_BASE_URL', "https://eutils.ncbi.nlm.nih.gov/entrez/eutils")
+        self.clinical_trials_base_url = os.getenv('CLINICAL_TRIALS_BASE_URL', "https://clinicaltrials.gov/api/v2")
+        self.fda_base_url = os.getenv('FDA_BASE_URL', "https://api.fda.gov")
+        self.request_timeout = float(os.getenv('RESEARCH_REQUEST_TIMEOUT', 10))
+        self.pubmed_api_key = get_api_key('PUBMED_API_KEY')
+        self.fda_api_key = get_api_key('FDA_API_KEY')
+        # NCBI рекомендует не более 200 идентификаторов в одном GET запросе esummary
+        self.pubmed_summary_batch = 200
+        # Общий пул keep-alive соединений вместо нового TCP+TLS на каждый запрос
+        self.http = http_client or get_http_client()
+        # Локальное зеркало openFDA drugsfda (см. src/fda_import.py)
+        self.fda_mirror = mirror or fda_mirror
     
     def search_pubmed(self, drug_name: str, condition: str = "") -> List[Dict[str, Any]]:
         """Поиск исследований в PubMed"""
         try:
-            # Формируем поисковый запрос
-            if condition:
-                search_term = f'"{drug_name}"[Title/Abstract] AND "{condition}"[MeSH Terms] AND ("randomized controlled trial"[Publication Type] OR "meta-analysis"[Publication Type] OR "systematic review"[Publication Type])'
-            else:
-                search_term = f'"{drug_name}"[Title/Abstract] AND ("randomized controlled trial"[Publication Type] OR "meta-analysis"[Publication Type] OR "systematic review"[Publication Type])'
-            
-            # Поиск статей
-            search_url = f"{self.pubmed_base_url}/esearch.fcgi"
-            search_params = {
-                'db': 'pubmed',
-                'term': search_term,
-                'retmax': 5,
-                'retmode': 'json'
-            }
-            
-            response = requests.get(search_url, params=search_params, timeout=10)
-            if not response.ok:
-                return []
-            
-            search_data = response.json()
-            pmids = search_data.get('esearchresult', {}).get('idlist', [])
-            
-            if not pmids:
-                return []
+            return self.fetch_pubmed(drug_name, condition)
+        except Exception as e:
+            print(f"Ошибка при поиске в PubMed: {str(e)}")
+            return []
+    
+    def search_clinical_trials(self, drug_name: str, condition: str = "") -> List[Dict[str, Any]]:
+        """Поиск клинических исследований"""
+        try:
+            return self.fetch_clinical_trials(drug_name, condition)
+        except Exception as e:
+            print(f"Ошибка при поиске клинических исследований: {str(e)}")
+            return []
+    
+    def search_fda(self, drug_name: str) -> List[Dict[str, Any]]:
+        """Поиск информации в базе FDA"""
+        try:
+            return self.fetch_fda(drug_name)
+        except Exception as e:
+            print(f"Ошибка при поиске в FDA: {str(e)}")
+            return []
+    
+    def fetch_pubmed(self, drug_name: str, condition: str = "",
+                     deadline: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Запрос к PubMed без подавления ошибок (esearch + esummary)"""
+        pmids = self.fetch_pubmed_ids(drug_name, condition, deadline=deadline)
+        if not pmids:
+            return []
+        
+        summaries = self.fetch_pubmed_summaries(pmids, deadline=deadline)
+        return [summaries[pmid] for pmid in pmids if pmid in summaries]
+    
+    @metrics.timed('pubmed_search')
+    def fetch_pubmed_ids(self, drug_name: str, condition: str = "",
+                         deadline: Optional[float] = None) -> List[str]:
+        """Поиск PMID статей через esearch"""
+        # Формируем поисковый запрос; у комбинации в статье должны упоминаться все вещества
+        drug_term = ' AND '.join(f'"{name}"[Title/Abstract]' for name in ingredients(drug_name))
+        if condition:
+            search_term = f'{drug_term} AND "{condition}"[MeSH Terms] AND ("randomized controlled trial"[Publication Type] OR "meta-analysis"[Publication Type] OR "systematic review"[Publication Type])'
+        else:
+            search_term = f'{drug_term} AND ("randomized controlled trial"[Publication Type] OR "meta-analysis"[Publication Type] OR "systematic review"[Publication Type])'
+        
+        # Поиск статей
+        search_url = f"{self.pubmed_base_url}/esearch.fcgi"
+        search_params = {
+            'db': 'pubmed',
+            'term': search_term,
+            'retmax': RESEARCH_CANDIDATES,
+            'retmode': 'json'
+        }
+        if self.pubmed_api_key:
+            search_params['api_key'] = self.pubmed_api_key
+        
+        response = self._get(search_url, search_params, deadline)
+        # Ошибка (в том числе 429/5xx после повторов) - исключение: пустой ответ не попадет в кэш
+        response.raise_for_status()
+        
+        search_data = response.json()
+        return search_data.get('esearchresult', {}).get('idlist', [])
+    
+    @metrics.timed('pubmed_summary')
+    def fetch_pubmed_summaries(self, pmids: List[str],
+                               deadline: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        """Детали статей через esummary; PMID разных запросов объединяются в пакеты"""
+        articles = {}
+        unique_pmids = list(dict.fromkeys(pmids))
+        
+        for start in range(0, len(unique_pmids), self.pubmed_summary_batch):
+            batch = unique_pmids[start:start + self.pubmed_summary_batch]
             
             # Получаем детали статей
             summary_url = f"{self.pubmed_base_url}/esummary.fcgi"
             summary_params = {
                 'db': 'pubmed',
-                'id': ','.join(pmids),
+                'id': ','.join(batch),
                 'retmode': 'json'
             }
+            if self.pubmed_api_key:
+                summary_params['api_key'] = self.pubmed_api_key
             
-            response = requests.get(summary_url, params=summary_params, timeout=10)
-            if not response.ok:
-                return []
+            response = self._get(summary_url, summary_params, deadline)
+            response.raise_for_status()
             
             summary_data = response.json()
-            articles = []
-            
-            for pmid in pmids:
+            for pmid in batch:
                 if pmid in summary_data.get('result', {}):
                     article_data = summary_data['result'][pmid]
-                    articles.append({
+                    articles[pmid] = {
                         'pmid': pmid,
                         'title': article_data.get('title', ''),
                         'authors': ', '.join([author.get('name', '') for author in article_data.get('authors', [])[:3]]),
                         'journal': article_data.get('fulljournalname', ''),
                         'year': article_data.get('pubdate', '').split()[0] if article_data.get('pubdate') else '',
-                        'type': self._determine_study_type(article_data.get('title', '')),
+                        'type': study_type(article_data.get('title', ''), article_data.get('pubtype', [])),
                         'url': f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/"
-                    })
-            
-            return articles
+                    }
         
-        except Exception as e:
-            print(f"Ошибка при поиске в PubMed: {str(e)}")
-            return []
+        return articles
     
-    def search_clinical_trials(self, drug_name: str, condition: str = "") -> List[Dict[str, Any]]:
-        """Поиск клинических исследований"""
-        try:
-            # Формируем поисковый запрос
-            search_terms = [drug_name]
-            if condition:
-                search_terms.append(condition)
-            
-            search_url = f"{self.clinical_trials_base_url}/study_fields"
-            params = {
-                'expr': ' AND '.join(search_terms),
-                'fields': 'NCTId,BriefTitle,OverallStatus,Phase,Condition,InterventionName',
-                'min_rnk': 1,
-                'max_rnk': 5,
-                'fmt': 'json'
-            }
-            
-            response = requests.get(search_url, params=params, timeout=10)
-            if not response.ok:
-                return []
-            
-            data = response.json()
-            studies = []
-            
-            for study in data.get('StudyFieldsResponse', {}).get('StudyFields', []):
-                nct_id = study.get('NCTId', [''])[0]
-                title = study.get('BriefTitle', [''])[0]
-                status = study.get('OverallStatus', [''])[0]
-                phase = study.get('Phase', [''])[0]
-                
-                studies.append({
-                    'nctId': nct_id,
-                    'title': title,
-                    'status': status,
-                    'phase': phase,
-                    'url': f"https://clinicaltrials.gov/ct2/show/{nct_id}"
-                })
-            
-            return studies
+    def fetch_clinical_trials(self, drug_name: str, condition: str = "",
+                              deadline: Optional[float] = None,
+                              limit: int = RESEARCH_CANDIDATES) -> List[Dict[str, Any]]:
+        """Запрос к ClinicalTrials.gov без подавления ошибок (первые ``limit`` исследований)"""
+        return list(islice(self.iter_clinical_trials(drug_name, condition, deadline=deadline,
+                                                     page_size=limit), limit))
+    
+    def iter_clinical_trials(self, drug_name: str, condition: str = "",
+                             statuses: Iterable[str] = (), phases: Iterable[str] = (),
+                             deadline: Optional[float] = None,
+                             page_size: int = RESEARCH_CANDIDATES) -> Iterator[Dict[str, Any]]:
+        """Исследования из API v2 по мере чтения страниц
+
+        Следующая страница (pageToken) запрашивается только когда вызывающий
+        код дочитал предыдущую, поэтому islice(..., n) делает не больше
+        запросов, чем нужно для n исследований. ``statuses`` и ``phases`` -
+        значения API v2, например RECRUITING, COMPLETED и PHASE2, PHASE3.
+        """
+        search_url = f"{self.clinical_trials_base_url}/studies"
+        params = {
+            'query.intr': ' AND '.join(ingredients(drug_name)),
+            'fields': CLINICAL_TRIALS_FIELDS,
+            'pageSize': min(max(page_size, 1), CLINICAL_TRIALS_MAX_PAGE_SIZE),
+            'format': 'json'
+        }
+        if condition:
+            params['query.cond'] = condition
+        statuses = [status.upper() for status in statuses]
+        if statuses:
+            params['filter.overallStatus'] = ','.join(statuses)
+        phases = [phase.upper() for phase in phases]
+        if phases:
+            params['filter.advanced'] = f"AREA[Phase]({' OR '.join(phases)})"
         
-        except Exception as e:
-            print(f"Ошибка при поиске клинических исследований: {str(e)}")
-            return []
+        while True:
+            with metrics.span('clinical_trials'):
+                response = self._get(search_url, params, deadline)
+                response.raise_for_status()
+                data = response.json()
+            
+            for study in data.get('studies', []):
+                yield self._parse_study(study.get('protocolSection', {}))
+            
+            page_token = data.get('nextPageToken')
+            if not page_token:
+                return
+            params['pageToken'] = page_token
     
-    def search_fda(self, drug_name: str) -> List[Dict[str, Any]]:
-        """Поиск информации в базе FDA"""
-        try:
-            search_url = f"{self.fda_base_url}/drug/drugsfda.json"
-            params = {
-                'search': f'products.active_ingredients.name:"{drug_name}"',
-                'limit': 3
-            }
-            
-            response = requests.get(search_url, params=params, timeout=10)
-            if not response.ok:
-                return []
-            
-            data = response.json()
-            results = []
-            
-            for result in data.get('results', []):
-                application_number = result.get('application_number', '')
-                sponsor_name = result.get('sponsor_name', '')
-                
-                results.append({
-                    'applicationNumber': application_number,
-                    'sponsorName': sponsor_name,
-                    'url': f"https://www.accessdata.fda.gov/scripts/cder/daf/index.cfm?event=overview.process&ApplNo={application_number}"
-                })
-            
-            return results
+    def _parse_study(self, protocol: Dict[str, Any]) -> Dict[str, Any]:
+        """Исследование API v2 в формате ответа API"""
+        nct_id = protocol.get('identificationModule', {}).get('nctId', '')
+        status = protocol.get('statusModule', {}).get('overallStatus', '')
+        phases = protocol.get('designModule', {}).get('phases') or []
+        return {
+            'nctId': nct_id,
+            'title': protocol.get('identificationModule', {}).get('briefTitle', ''),
+            'status': STUDY_STATUSES.get(status, status.replace('_', ' ').capitalize()),
+            'phase': '/'.join(STUDY_PHASES.get(phase, phase) for phase in phases),
+            'url': f"https://clinicaltrials.gov/study/{nct_id}"
+        }
+    
+    @metrics.timed('fda')
+    def fetch_fda(self, drug_name: str, deadline: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Поиск в локальном зеркале drugsfda, при промахе - запрос к openFDA без подавления ошибок"""
+        mirrored = self.fda_mirror.lookup(drug_name)
+        if mirrored:
+            return mirrored
         
-        except Exception as e:
-            print(f"Ошибка при поиске в FDA: {str(e)}")
+        search_url = f"{self.fda_base_url}/drug/drugsfda.json"
+        params = {
+            'search': ' AND '.join(f'products.active_ingredients.name:"{name}"' for name in ingredients(drug_name)),
+            'limit': 3
+        }
+        if self.fda_api_key:
+            params['api_key'] = self.fda_api_key
+        
+        response = self._get(search_url, params, deadline)
+        # openFDA отвечает 404, если совпадений нет; остальные ошибки - исключение
+        if response.status_code == 404:
             return []
-    
-    def _determine_study_type(self, title: str) -> str:
-        """Определение типа исследования по заголовку"""
-        title_lower = title.lower()
+        response.raise_for_status()
         
-        if 'meta-analysis' in title_lower or 'meta analysis' in title_lower:
-            return 'Meta-analysis'
-        elif 'systematic review' in title_lower:
-            return 'Systematic Review'
-        elif 'randomized controlled trial' in title_lower or 'rct' in title_lower:
-            return 'RCT'
-        elif 'clinical trial' in title_lower:
-            return 'Clinical Trial'
-        else:
-            return 'Study'
-
+        data = response.json()
+        results = []
+        
+        for result in data.get('results', []):
+            results.append(application_result(result.get('application_number', ''), result.get('sponsor_name', '')))
+        
+        return results
+    
+    def _get(self, url: str, params: Dict[str, Any], deadline: Optional[float]):
+        """GET через общий пул соединений с учетом общего дедлайна"""
+        return self.http.get(url, params=params, timeout=self.request_timeout, deadline=deadline)
@@ -0,0 +1,11 @@
+"""Точка входа WSGI для production
+
+    gunicorn -c gunicorn.conf.py src.wsgi:app
+
+Приложение создается один раз в мастере gunicorn (preload_app) и
+наследуется воркерами через fork, а без preload_app - в каждом воркере.
+Задачи анализа выполняют воркеры (хук post_worker_init в gunicorn.conf.py).
+"""
+from src.main import create_app
+
+app = create_app(dispatch_jobs=False)
@@ -0,0 +1,13 @@
+import os
+import sys
+import pytest
+
+# Тесты запускаются из каталога backend: python -m pytest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Приложение с отдельной базой, без фоновых потоков очереди задач"""
+    from src.main import create_app
+    return create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'app.db'}"}, dispatch_jobs=False)
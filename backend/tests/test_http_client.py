@@ -0,0 +1,64 @@
+import time
+import threading
+from src.services.http_client import HttpClient
+
+NCBI = 'eutils.ncbi.nlm.nih.gov'
+
+
+def count_acquired(limiters, duration):
+    """Число слотов, полученных всеми ограничителями (по два потока на каждый) за duration секунд"""
+    stop = time.monotonic() + duration
+    acquired = []
+    lock = threading.Lock()
+
+    def worker(limiter):
+        while True:
+            limiter.acquire()
+            if time.monotonic() > stop:
+                return
+            with lock:
+                acquired.append(1)
+
+    threads = [threading.Thread(target=worker, args=(limiter,)) for limiter in limiters for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(acquired)
+
+
+def test_rate_limit_is_shared_between_processes(monkeypatch):
+    # Два воркера gunicorn - два независимых клиента в разных процессах
+    monkeypatch.setenv('PUBMED_RATE_LIMIT', '20')
+    monkeypatch.setenv('HTTP_RATE_LIMIT_PROCESSES', '2')
+    limiters = [HttpClient()._limiter_for(NCBI), HttpClient()._limiter_for(NCBI)]
+
+    duration = 1.0
+    total = count_acquired(limiters, duration)
+
+    # Не больше лимита за интервал плюс одно полное ведро (20 слотов) на оба процесса
+    assert total <= 20 * duration + 20 + 1
+    assert total >= 20 * duration - 2
+
+
+def test_rate_limit_defaults_to_gunicorn_workers(monkeypatch):
+    monkeypatch.delenv('HTTP_RATE_LIMIT_PROCESSES', raising=False)
+    monkeypatch.setenv('GUNICORN_WORKERS', '4')
+    monkeypatch.setenv('PUBMED_RATE_LIMIT', '3')
+    limiter = HttpClient()._limiter_for(NCBI)
+
+    assert limiter.rate == 3 / 4
+    assert limiter.capacity == 3 / 4
+
+
+def test_background_requests_pass_with_fractional_bucket():
+    client = HttpClient()
+    client.rate_limit_processes = 4
+    client.rate_limits = {NCBI: 3.0}
+    limiter = client._limiter_for(NCBI)
+
+    started = time.monotonic()
+    limiter.acquire(background=True)
+    limiter.acquire(background=True)
+    # Второй слот освобождается через 1 / 0.75 секунды
+    assert 1.0 < time.monotonic() - started < 2.0
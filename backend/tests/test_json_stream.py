@@ -0,0 +1,69 @@
+import json
+from benchmarks.fake_gemini import FakeChunk
+from src.services.json_stream import DrugStreamParser, repair_json
+from src.services.protocol_analyzer import ProtocolAnalyzer
+
+ANALYSIS = {
+    'protocolSummary': 'Лечение гипертензии',
+    'mainCondition': 'Артериальная гипертензия',
+    'drugs': [
+        {'id': '1', 'name': 'Амлодипин', 'innEnglish': 'amlodipine', 'dosage': '5 мг'},
+        {'id': '2', 'name': 'Лизиноприл', 'innEnglish': 'lisinopril', 'dosage': '10 мг'}
+    ]
+}
+
+# Скобки в пояснении перед JSON: и не JSON вовсе, и пример объекта без препаратов
+PREAMBLE = ('Ниже результат анализа {в формате JSON}, поля описаны в задании '
+            '(например, {"protocolSummary": "..."}):\n```json\n')
+
+
+def feed_by(parser, text, size):
+    for start in range(0, len(text), size):
+        parser.feed(text[start:start + size])
+
+
+def test_parser_skips_braces_in_preamble():
+    text = PREAMBLE + json.dumps(ANALYSIS, ensure_ascii=False, indent=2) + '\n```'
+    for size in (1, 7, len(text)):
+        parser = DrugStreamParser()
+        feed_by(parser, text, size)
+
+        assert [drug['innEnglish'] for drug in parser.drugs] == ['amlodipine', 'lisinopril']
+        assert json.loads(parser.document()) == ANALYSIS
+
+
+def test_repair_skips_braces_in_preamble():
+    # Оборванный ответ: последний препарат не закрыт
+    text = PREAMBLE + json.dumps(ANALYSIS, ensure_ascii=False)[:-20]
+
+    result = repair_json(text, expect='drugs')
+
+    assert result['protocolSummary'] == ANALYSIS['protocolSummary']
+    assert result['drugs'][0] == ANALYSIS['drugs'][0]
+
+
+def test_repair_ignores_text_after_json():
+    text = PREAMBLE + json.dumps(ANALYSIS, ensure_ascii=False) + '\n```\nЕсли нужно {уточнить} - спросите.'
+    assert repair_json(text, expect='drugs') == ANALYSIS
+
+
+class PreambleModel:
+    def __init__(self):
+        """Модель, отвечающая JSON с пояснением со скобками перед ним"""
+        self.calls = 0
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        self.calls += 1
+        text = PREAMBLE + json.dumps(ANALYSIS, ensure_ascii=False) + '\n```'
+        return [FakeChunk(text[start:start + 16]) for start in range(0, len(text), 16)]
+
+
+def test_analysis_with_brace_preamble_needs_no_repair_call():
+    model = PreambleModel()
+    analyzer = ProtocolAnalyzer(model=model)
+
+    result = analyzer._generate_analysis('протокол')
+
+    assert model.calls == 1
+    assert [drug['name'] for drug in result['drugs']] == ['Амлодипин', 'Лизиноприл']
+    assert result['mainCondition'] == ANALYSIS['mainCondition']
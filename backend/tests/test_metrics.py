@@ -0,0 +1,54 @@
+import json
+import pytest
+from src.services.metrics import metrics
+from src.services.registry import services
+
+
+class TracedEngine:
+    def __init__(self, cached=False):
+        """Поисковик без внешних запросов; при промахе кэша выполняет этап pubmed_search"""
+        self.cached = cached
+
+    def etag(self, drug_name, condition):
+        return None
+
+    def search(self, drug_name, condition):
+        if not self.cached:
+            with metrics.span('pubmed_search'):
+                pass
+        return {'status': {}}
+
+    def search_batch(self, lookups):
+        for drug_name, condition in lookups:
+            yield {'drug': drug_name, 'condition': condition, **self.search(drug_name, condition)}
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def test_server_timing_for_executed_stages(client):
+    services.register('research_engine', lambda: TracedEngine())
+    response = client.get('/api/research/metformin', headers={'X-Trace': '1'})
+    assert response.headers['Server-Timing'].startswith('pubmed_search;dur=')
+
+
+def test_no_empty_server_timing_for_cached_response(client):
+    services.register('research_engine', lambda: TracedEngine(cached=True))
+    response = client.get('/api/research/metformin', headers={'X-Trace': '1'})
+    assert 'Server-Timing' not in response.headers
+
+
+def test_batch_stream_ends_with_timings(client):
+    services.register('research_engine', lambda: TracedEngine())
+    body = {'drugs': [{'id': '1', 'innEnglish': 'metformin'}, {'id': '2', 'innEnglish': 'amlodipine'}]}
+
+    traced = client.post('/api/research/batch', json=body, headers={'X-Trace': '1'})
+    lines = [json.loads(line) for line in traced.get_data(as_text=True).splitlines()]
+    assert 'Server-Timing' not in traced.headers
+    assert len(lines) == 3 and set(lines[-1]) == {'timings'}
+    assert 'pubmed_search' in lines[-1]['timings']
+
+    plain = client.post('/api/research/batch', json=body)
+    assert all('timings' not in json.loads(line) for line in plain.get_data(as_text=True).splitlines())
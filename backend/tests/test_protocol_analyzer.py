@@ -0,0 +1,64 @@
+from benchmarks.fake_gemini import FakeGeminiModel
+from src.services.analysis_history import analysis_history
+from src.services.protocol_analyzer import ProtocolAnalyzer
+
+
+class CountingModel(FakeGeminiModel):
+    def __init__(self):
+        """Заглушка модели без задержек, считающая вызовы"""
+        super().__init__(latency=0, chars_per_second=1e9)
+        self.calls = 0
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        self.calls += 1
+        return super().generate_content(prompt, stream, **kwargs)
+
+
+def drug_name(number):
+    # Названия различаются уже в первых буквах, как у настоящих препаратов
+    return 'Лек' + ''.join('бвгдежзклм'[int(digit)] for digit in f'{number:02d}') + 'ин'
+
+
+def protocol(sections=40, changed=None):
+    parts = []
+    for number in range(1, sections + 1):
+        dosage = 20 if number == changed else 10
+        parts.append(f"{number}. Раздел {number}\n"
+                     f"Препарат: {drug_name(number)}; доза {dosage} мг; путь введения: внутрь; 2 раза в сутки\n"
+                     + 'Описание схемы лечения и контроля. ' * 45)
+    return '\n'.join(parts)
+
+
+def test_revision_reanalyzes_only_changed_section(app):
+    model = CountingModel()
+    analyzer = ProtocolAnalyzer(model=model, history=analysis_history)
+
+    first = analyzer.analyze_text(protocol(), filename='p.docx')
+    assert first['success'] and len(first['drugs']) == 40
+    full_calls = model.calls
+    assert full_calls == 2
+
+    model.calls = 0
+    revised = analyzer.analyze_text(protocol(changed=5), filename='p.docx', revision_of=first['analysis_id'])
+
+    assert model.calls == 1
+    assert revised['revision'] == {'previous_id': first['analysis_id'], 'sections': 40, 'reused': 39, 'analyzed': 1}
+    dosages = {drug['name']: drug['dosage'] for drug in revised['drugs']}
+    assert len(dosages) == 40
+    assert dosages[drug_name(5)] == '20 мг'
+    assert dosages[drug_name(6)] == '10 мг'
+    assert revised['protocol_summary'] == first['protocol_summary']
+
+
+def test_revision_with_most_text_changed_is_analyzed_whole(app):
+    model = CountingModel()
+    analyzer = ProtocolAnalyzer(model=model, history=analysis_history)
+    first = analyzer.analyze_text(protocol(sections=4), filename='p.docx')
+
+    model.calls = 0
+    revised = analyzer.analyze_text(protocol(sections=4).replace('10 мг', '30 мг'),
+                                    filename='p.docx', revision_of=first['analysis_id'])
+
+    assert model.calls == 1
+    assert revised['revision']['reused'] == 0
+    assert {drug['dosage'] for drug in revised['drugs']} == {'30 мг'}
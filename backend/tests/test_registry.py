@@ -0,0 +1,13 @@
+import atexit
+from src.services.registry import ServiceRegistry
+
+
+def test_shutdown_hook_registered_once(app, monkeypatch):
+    hooks = []
+    monkeypatch.setattr(atexit, 'register', hooks.append)
+    registry = ServiceRegistry()
+
+    for _ in range(3):
+        registry.init_app(app)
+
+    assert hooks == [registry.shutdown]
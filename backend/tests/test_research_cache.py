@@ -0,0 +1,24 @@
+import time
+from src.services.research_cache import ResearchCache
+
+
+def test_workers_serve_the_same_version(app):
+    # Два воркера gunicorn: у каждого своя память, база общая
+    first, second = ResearchCache(app), ResearchCache(app)
+
+    first.set('pubmed', 'metformin', '', [{'pmid': '1'}])
+    assert second.get('pubmed', 'metformin') == ([{'pmid': '1'}], 'fresh')
+
+    time.sleep(0.01)
+    first.set('pubmed', 'metformin', '', [{'pmid': '2'}])
+
+    assert second.get('pubmed', 'metformin') == ([{'pmid': '2'}], 'fresh')
+    assert second.version('pubmed', 'metformin') == first.version('pubmed', 'metformin')
+
+
+def test_memory_hit_when_database_matches(app):
+    cache = ResearchCache(app)
+    cache.set('fda', 'metformin', '', [{'id': 'x'}])
+
+    assert cache.get('fda', 'metformin') == ([{'id': 'x'}], 'fresh')
+    assert cache.stats()['memory_hits'] == 1
@@ -0,0 +1,82 @@
+import time
+import pytest
+from src.models.user import db
+from src.models.job import AnalysisJob
+from src.models.research_prefetch import PrefetchTask
+from src.services.registry import services
+from src.services.research_prefetch import research_prefetch
+
+DRUGS = [{'innEnglish': name, 'targetCondition': 'Hypertension'} for name in ('amlodipine', 'lisinopril', 'metformin')]
+
+
+class FakeEngine:
+    def __init__(self):
+        """Поисковик без внешних запросов: запоминает предзагруженные пары"""
+        self.busy = False
+        self.prefetched = []
+
+    def prefetch(self, drug_name, condition, deadline=None):
+        self.prefetched.append(drug_name)
+        return 'fetched'
+
+    def etag(self, drug_name, condition):
+        return None
+
+    def search(self, drug_name, condition):
+        return {'status': {}}
+
+
+@pytest.fixture
+def engine(app):
+    engine = FakeEngine()
+    services.register('research_engine', lambda: engine)
+    return engine
+
+
+def add_job(app, job_id):
+    now = time.time()
+    with app.app_context():
+        db.session.add(AnalysisJob(id=job_id, status='done', stage='done', progress=100, filename='p.docx',
+                                   refresh=False, payload=b'', created_at=now, updated_at=now))
+        db.session.commit()
+
+
+def job_state(app, job_id):
+    with app.app_context():
+        job = db.session.get(AnalysisJob, job_id)
+        return job.prefetch, PrefetchTask.query.filter_by(job_id=job_id).count()
+
+
+def test_prefetch_stops_after_cancel(app, engine):
+    add_job(app, 'job-1')
+    assert research_prefetch.schedule('job-1', DRUGS) == 3
+
+    research_prefetch._process(*research_prefetch._claim())
+    assert engine.prefetched == ['amlodipine']
+
+    assert app.test_client().delete('/api/jobs/job-1/prefetch').json['prefetch'] == 'cancelled'
+    assert research_prefetch._claim() is None
+    assert job_state(app, 'job-1') == ('cancelled', 0)
+    assert engine.prefetched == ['amlodipine']
+
+
+def test_claimed_pair_is_not_fetched_after_cancel(app, engine):
+    add_job(app, 'job-2')
+    research_prefetch.schedule('job-2', DRUGS)
+
+    task = research_prefetch._claim()
+    research_prefetch.cancel('job-2')
+    research_prefetch._process(*task)
+
+    assert engine.prefetched == []
+    assert job_state(app, 'job-2') == ('cancelled', 0)
+
+
+def test_research_request_extends_prefetch(app, engine):
+    add_job(app, 'job-3')
+
+    response = app.test_client().get('/api/research/amlodipine?condition=Hypertension&job=job-3')
+
+    assert response.status_code == 200
+    with app.app_context():
+        assert db.session.get(AnalysisJob, 'job-3').seen_at is not None
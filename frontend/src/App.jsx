@@ -1,4 +1,4 @@
-import { useState } from 'react'
+import { useState, useEffect, useRef } from 'react'
 import { Upload, FileText, Search, Download, AlertCircle, CheckCircle } from 'lucide-react'
 import { Button } from '@/components/ui/button.jsx'
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from '@/components/ui/card.jsx'
@@ -6,16 +6,36 @@ import { Alert, AlertDescription } from '@/components/ui/alert.jsx'
 import { Progress } from '@/components/ui/progress.jsx'
 import './App.css'
 
+const JOB_POLL_INTERVAL = 1000
+
 function App() {
   const [file, setFile] = useState(null)
   const [isAnalyzing, setIsAnalyzing] = useState(false)
   const [analysisResult, setAnalysisResult] = useState(null)
   const [error, setError] = useState(null)
   const [progress, setProgress] = useState(0)
+  // Задача последнего анализа: для нее сервер заранее ищет исследования
+  const jobIdRef = useRef(null)
+
+  // Результаты закрыты: фоновая предзагрузка исследований больше не нужна
+  const cancelPrefetch = () => {
+    const jobId = jobIdRef.current
+    jobIdRef.current = null
+    if (jobId) {
+      // keepalive: запрос уходит и при закрытии страницы
+      fetch(`/api/jobs/${jobId}/prefetch`, { method: 'DELETE', keepalive: true }).catch(() => {})
+    }
+  }
+
+  useEffect(() => {
+    window.addEventListener('pagehide', cancelPrefetch)
+    return () => window.removeEventListener('pagehide', cancelPrefetch)
+  }, [])
 
   const handleFileChange = (event) => {
     const selectedFile = event.target.files[0]
     if (selectedFile && selectedFile.name.endsWith('.docx')) {
+      cancelPrefetch()
       setFile(selectedFile)
       setError(null)
       setAnalysisResult(null)
@@ -28,6 +48,7 @@ function App() {
   const analyzeProtocol = async () => {
     if (!file) return
 
+    cancelPrefetch()
     setIsAnalyzing(true)
     setError(null)
     setProgress(0)
@@ -36,25 +57,21 @@ function App() {
       const formData = new FormData()
       formData.append('file', file)
 
-      // Симуляция прогресса
-      const progressInterval = setInterval(() => {
-        setProgress(prev => Math.min(prev + 10, 90))
-      }, 500)
-
       const response = await fetch('/api/upload', {
         method: 'POST',
         body: formData
       })
 
-      clearInterval(progressInterval)
-      setProgress(100)
-
       if (!response.ok) {
         const errorData = await response.json()
         throw new Error(errorData.error || 'Ошибка при анализе файла')
       }
 
-      const result = await response.json()
+      // Анализ выполняется в фоне: опрашиваем состояние задачи
+      const job = await response.json()
+      jobIdRef.current = job.id
+      const result = await waitForJob(job.status_url)
+      setProgress(100)
       setAnalysisResult(result)
     } catch (err) {
       setError(err.message)
@@ -64,10 +81,36 @@ function App() {
     }
   }
 
+  const waitForJob = async (statusUrl) => {
+    while (true) {
+      const response = await fetch(statusUrl)
+      const job = await response.json()
+
+      if (!response.ok) {
+        throw new Error(job.error || 'Ошибка при получении статуса анализа')
+      }
+      if (job.status === 'done') {
+        return job.result
+      }
+      if (job.status === 'failed') {
+        throw new Error(job.error || 'Ошибка при анализе файла')
+      }
+
+      // Препараты появляются по мере разбора ответа модели
+      if (job.partial_drugs && job.partial_drugs.length > 0) {
+        setAnalysisResult({ drugs: job.partial_drugs })
+      }
+      setProgress(Math.max(job.progress, 1))
+      await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL))
+    }
+  }
+
   const searchResearch = async (drugName, condition) => {
     try {
       const params = new URLSearchParams()
       if (condition) params.append('condition', condition)
+      // Обращение к результатам продлевает предзагрузку исследований задачи
+      if (jobIdRef.current) params.append('job', jobIdRef.current)
       
       const response = await fetch(`/api/research/${encodeURIComponent(drugName)}?${params}`)
       if (response.ok) {